@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measures how much memory Chordsheet uses to load, lay out, rasterise and show documents, by
+stage, and fails if a stage goes over its budget. Each document goes through the same stages
+as in the GUI: it is loaded, rendered to a PDF, then the PDF is rasterised and shown by the
+preview (with Qt's offscreen platform, unless --no-preview is given).
+
+Usage: python3 benchmark_memory.py [-n RUNS] [--budget STAGE=MB] [--json FILE] [file ...]
+"""
+
+import os
+import sys
+import argparse
+from io import BytesIO
+
+from chordsheet.memoryProfile import MemoryProfiler, stageOrder, megabyte
+
+
+def parseBudget(text):
+    """
+    Turn 'stage=MB' into (stage, bytes).
+    """
+    stage, sep, size = text.partition('=')
+    if not sep or stage not in stageOrder:
+        raise argparse.ArgumentTypeError("budgets look like STAGE=MB, with STAGE one of " + ', '.join(stageOrder))
+    try:
+        return stage, float(size) * megabyte
+    except ValueError:
+        raise argparse.ArgumentTypeError("{s!r} isn't a number of megabytes".format(s=size))
+
+
+def runStages(path, viewer=None, app=None):
+    """
+    Take a document through every stage, as the GUI does.
+    """
+    from chordsheet.document import Document, Style
+    from chordsheet.render import Renderer
+
+    doc = Document.newFromFile(path)
+    pdf = BytesIO()
+    Renderer(doc, Style()).savePDF(pdf)
+    if viewer is not None:
+        # as PDFViewer.update does, but without its page cache
+        viewer.clear()
+        viewer.render(pdf)
+        viewer.show()
+        app.processEvents()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Chordsheet memory use by stage.")
+    parser.add_argument('files', nargs='*', metavar='file',
+                        default=[os.path.join('examples', 'examplelong.xml')],
+                        help="documents to load and render (default: examples/examplelong.xml)")
+    parser.add_argument('-n', '--runs', type=int, default=1,
+                        help="times to go through every document; retained memory that keeps "
+                        "growing with more runs is a leak (default: 1)")
+    parser.add_argument('--budget', type=parseBudget, action='append', default=[], metavar='STAGE=MB',
+                        help="fail if the peak memory of a stage goes over this (can be repeated)")
+    parser.add_argument('--retained-budget', dest='retainedBudget', type=parseBudget, action='append',
+                        default=[], metavar='STAGE=MB',
+                        help="fail if a stage leaves more than this allocated, over all the runs")
+    parser.add_argument('--frames', type=int, default=1,
+                        help="frames of traceback to record for each allocation (default: 1)")
+    parser.add_argument('--top', type=int, default=10, help="allocation sites to report per stage (default: 10)")
+    parser.add_argument('--json', metavar='FILE', help="write the full report here")
+    parser.add_argument('--no-preview', dest='preview', action='store_false',
+                        help="stop after writing the PDF, without Qt or PyMuPDF")
+    args = parser.parse_args()
+
+    from chordsheet.fonts import registerFonts
+    registerFonts()
+
+    viewer = app = None
+    if args.preview:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        from chordsheet.pdfViewer import PDFViewer
+        app = QApplication(sys.argv[:1])
+        viewer = PDFViewer(None)
+        viewer.resize(800, 1000)
+
+    # once without profiling, so the modules and caches that are only loaded the first time
+    # aren't counted against whichever stage happens to load them
+    runStages(args.files[0], viewer, app)
+
+    profiler = MemoryProfiler(frames=args.frames, topSites=args.top)
+    profiler.install()
+    profiler.start()
+    try:
+        for n in range(args.runs):
+            for path in args.files:
+                runStages(path, viewer, app)
+    finally:
+        profiler.uninstall()
+
+    report = profiler.report()
+    if args.json:
+        profiler.saveReport(args.json)
+    profiler.stop()
+
+    print("{:<10}{:>7}{:>10}{:>13}{:>13}".format("stage", "calls", "peak MB", "retained MB", "resident MB"))
+    for name, stats in report['stages'].items():
+        resident = stats['residentRetained']
+        print("{:<10}{:>7}{:>10.2f}{:>13.2f}{:>13}".format(
+            name, stats['calls'], stats['peak'] / megabyte, stats['retained'] / megabyte,
+            '-' if resident is None else "{:.2f}".format(resident / megabyte)))
+
+    failures = profiler.overBudget(dict(args.budget), dict(args.retainedBudget))
+    for message in failures:
+        print("over budget: " + message, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
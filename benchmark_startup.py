@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Measures how long Chordsheet takes to start, broken down by phase. Each run happens in a fresh
+interpreter so module imports are timed cold.
+
+Usage: python3 benchmark_startup.py [-n RUNS] [--offscreen] [file]
+"""
+
+import sys
+import os
+import json
+import argparse
+import subprocess
+from statistics import median
+from time import perf_counter
+
+phases = ['interpreter', 'import gui', 'QApplication', 'main window', 'show', 'open file', 'first render']
+
+
+def child(filePath):
+    """
+    Run one startup and print the time taken by each phase as JSON.
+    """
+    times = {}
+    start = perf_counter()
+
+    import gui
+    from PyQt5.QtWidgets import QApplication
+    from chordsheet.document import Document, Style
+    times['import gui'] = perf_counter() - start
+
+    mark = perf_counter()
+    app = QApplication(sys.argv[:1])
+    times['QApplication'] = perf_counter() - mark
+
+    mark = perf_counter()
+    w = gui.DocumentWindow(Document(), Style())
+    times['main window'] = perf_counter() - mark
+
+    mark = perf_counter()
+    w.show()
+    app.processEvents()
+    times['show'] = perf_counter() - mark
+
+    mark = perf_counter()
+    if filePath:
+        w.doc.loadCSMacro(filePath) if filePath.lower().endswith('.cma') else w.doc.loadXML(filePath)
+        w.UIInitDocument()
+    times['open file'] = perf_counter() - mark
+
+    mark = perf_counter()
+    w.updatePreview()
+    app.processEvents()
+    times['first render'] = perf_counter() - mark
+
+    print(json.dumps(times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Chordsheet startup time by phase.")
+    parser.add_argument('file', nargs='?', default=os.path.join('examples', 'example.xml'),
+                        help="document to open and render (default: examples/example.xml)")
+    parser.add_argument('-n', '--runs', type=int, default=5, help="number of runs (default: 5)")
+    parser.add_argument('--offscreen', action='store_true', help="use Qt's offscreen platform")
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.file)
+        return
+
+    env = dict(os.environ)
+    if args.offscreen:
+        env['QT_QPA_PLATFORM'] = 'offscreen'
+    scriptDir = os.path.abspath(os.path.dirname(__file__))
+
+    results = {p: [] for p in phases}
+    for n in range(args.runs):
+        start = perf_counter()
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', args.file],
+                                cwd=scriptDir, env=env, capture_output=True, text=True, check=True).stdout
+        total = perf_counter() - start
+        times = json.loads(output.strip().splitlines()[-1])
+        # whatever isn't accounted for by the phases is interpreter startup and shutdown
+        times['interpreter'] = total - sum(times.values())
+        for p in phases:
+            results[p].append(times[p])
+
+    print("{:<14}{:>10}".format("phase", "median ms"))
+    for p in phases:
+        print("{:<14}{:>10.1f}".format(p, median(results[p]) * 1000))
+    print("{:<14}{:>10.1f}".format("total", sum(median(results[p]) for p in phases) * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+import sys
+
+from chordsheet.cli import main
+
+sys.exit(main())
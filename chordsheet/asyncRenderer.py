@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Rendering for asyncio programs. Renders run on an executor so the event loop is never blocked.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+def renderBytes(document, style, invariant=False):
+    """
+    Render a document and return the PDF as bytes. Runs on the executor, so it has to be a
+    plain function for process pools to be able to pickle it.
+    """
+    from chordsheet.fonts import registerFonts
+    from chordsheet.render import Renderer
+
+    registerFonts()
+    return Renderer(document, style, invariant).stream().getvalue()
+
+
+class AsyncRenderer:
+    """
+    Runs renders on an executor, at most maxConcurrent at a time. Further renders wait their
+    turn without blocking the event loop.
+
+    By default renders run on threads, which keeps the loop responsive but only uses one core
+    (ReportLab holds the GIL). Pass a ProcessPoolExecutor to render in parallel. With threads,
+    the document and style must not be changed while they are being rendered.
+    """
+
+    def __init__(self, executor=None, maxConcurrent=4, chunkSize=64*1024, invariant=False):
+        self.ownExecutor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=maxConcurrent)
+        self.maxConcurrent = maxConcurrent
+        self.chunkSize = chunkSize
+        self.invariant = invariant
+        self.semaphore = None
+
+    async def render(self, document, style, timeout=None):
+        """
+        Render a document to PDF bytes. Raises asyncio.TimeoutError if it takes longer than
+        timeout seconds. If the caller is cancelled or times out before the render has started
+        it is dropped; one already running is left to finish, but its result is thrown away.
+        """
+        loop = asyncio.get_running_loop()
+        # the style as it is now, not as it is by the time a worker gets to it
+        style = style.snapshot()
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.maxConcurrent)
+
+        async def run():
+            await self.semaphore.acquire()
+            try:
+                job = self.executor.submit(renderBytes, document, style, self.invariant)
+            except BaseException:
+                self.semaphore.release()
+                raise
+
+            def finished(job):
+                # hold the slot until the executor is really done with the job, even if
+                # whoever was waiting for it has given up
+                try:
+                    loop.call_soon_threadsafe(self.semaphore.release)
+                except RuntimeError:  # the loop has been closed
+                    pass
+            job.add_done_callback(finished)
+            return await asyncio.wrap_future(job)
+
+        return await asyncio.wait_for(run(), timeout)
+
+    async def stream(self, document, style, timeout=None):
+        """
+        Render a document and yield the PDF in chunks, e.g. to write to an HTTP response. The
+        whole PDF is rendered before the first chunk, as the end of a PDF (the cross-reference
+        table) can only be written once everything else is known.
+        """
+        pdf = await self.render(document, style, timeout)
+        view = memoryview(pdf)
+        for start in range(0, len(pdf), self.chunkSize):
+            yield bytes(view[start:start + self.chunkSize])
+
+    async def savePDF(self, document, style, pathToPDF, timeout=None):
+        """
+        Render a document to a file.
+        """
+        pdf = await self.render(document, style, timeout)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, writeFile, pathToPDF, pdf)
+
+    def close(self):
+        """
+        Shut down the executor, if this renderer created it.
+        """
+        if self.ownExecutor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+def writeFile(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Automatic choice of the beat width, so a document fits on as few pages as it can (or on a given
+number of pages) with its beats as wide as possible. The margins and line spacing can be
+tightened too if that isn't enough. Every candidate is judged with Renderer.paginate, so nothing
+is drawn and a fit takes a few milliseconds.
+"""
+
+import time
+from math import floor, trunc
+
+from chordsheet.render import Renderer, availableWidth
+
+minUnitWidth = 5  # the narrowest beat width that is still readable, in style units
+minMargin = 5  # mm
+minLineSpacing = 1.0
+tighteningSteps = 3
+
+
+class Fit:
+    """
+    The result of fitStyle: the style chosen, the number of pages the document takes with it,
+    and how many layouts were tried to find it.
+    """
+
+    def __init__(self, style, pages, evaluations):
+        self.style = style
+        self.pages = pages
+        self.evaluations = evaluations
+
+    def __repr__(self):
+        return "Fit(unitWidth={w}, pages={p}, evaluations={e})".format(
+            w=self.style.unitWidth, p=self.pages, e=self.evaluations)
+
+
+def beatsPerLine(style, timeSignature, unitWidth):
+    """
+    Return how many beats ChordProgression.wrap puts on each line for a beat width.
+    """
+    availWidth = availableWidth(style)
+    return 2 * timeSignature * trunc((availWidth/(unitWidth*style.unit)) / (2*timeSignature))
+
+
+def candidateWidths(style, timeSignature, minWidth=minUnitWidth, maxWidth=None):
+    """
+    Return the beat widths worth trying, widest first. The layout only changes when the number
+    of beats on a line does, so only the widest beat width for each number of bars per line
+    is needed. Widths are rounded down to a tenth, to be easy to read and type.
+    """
+    availWidth = availableWidth(style)
+    widths = []
+    bars = 1
+    while True:
+        width = floor(10 * availWidth / (2*timeSignature*bars*style.unit)) / 10
+        if width < minWidth:
+            break
+        # rounding can leave the exact widest width a hair too wide for the line
+        while beatsPerLine(style, timeSignature, width) < 2*timeSignature*bars:
+            width = round(width - 0.1, 1)
+        if width >= minWidth and (maxWidth is None or width <= maxWidth):
+            widths.append(width)
+        bars += 1
+    return widths
+
+
+def tightenedStyles(style, margins=False, lineSpacing=False):
+    """
+    Return the style, then versions of it with progressively tighter margins and/or line
+    spacing, ending at minMargin and minLineSpacing.
+    """
+    styles = [style]
+    if not (margins or lineSpacing):
+        return styles
+    for step in range(1, tighteningSteps):
+        f = step / (tighteningSteps - 1)
+        changes = {}
+        if margins:
+            for name in ('leftMargin', 'rightMargin', 'topMargin', 'bottomMargin'):
+                value = getattr(style, name)
+                changes[name] = value - f * max(value - minMargin, 0)
+        if lineSpacing:
+            changes['lineSpacing'] = style.lineSpacing - f * max(style.lineSpacing - minLineSpacing, 0)
+        styles.append(style.replace(**changes))
+    return styles
+
+
+def fitStyle(document, style, targetPages=None, minWidth=minUnitWidth, maxWidth=None,
+             margins=False, lineSpacing=False, timeLimit=0.25):
+    """
+    Find the widest beat width that keeps the document to targetPages pages, or to as few pages
+    as any allowed beat width gives if targetPages is None. If margins or lineSpacing are set
+    they are tightened as far as is needed, but no further. Returns a Fit.
+
+    Fewer beats on a line never makes for fewer pages, so the widths are binary searched. If
+    the target can't be met, or timeLimit seconds go by, the fewest pages found is returned.
+    """
+    deadline = time.perf_counter() + timeLimit
+    timeSignature = document.timeSignature
+    style = style.snapshot()
+    styles = tightenedStyles(style, margins, lineSpacing)
+    evaluations = 0
+    counted = {}
+
+    def pages(s):
+        nonlocal evaluations
+        if s not in counted:
+            evaluations += 1
+            counted[s] = Renderer(document, s).paginate().pages
+        return counted[s]
+
+    def candidates(s):
+        return [s.replace(unitWidth=w) for w in candidateWidths(s, timeSignature, minWidth, maxWidth)]
+
+    if targetPages is None:
+        # the fewest pages possible is with everything as tight as it is allowed to go
+        tightest = candidates(styles[-1])
+        if not tightest:
+            return Fit(style, pages(style), evaluations)
+        targetPages = pages(tightest[-1])
+
+    best = None
+    for s in styles:
+        widths = candidates(s)
+        if not widths:
+            continue
+        if best is None or pages(widths[-1]) < best.pages:
+            best = Fit(widths[-1], pages(widths[-1]), evaluations)
+        if pages(widths[-1]) > targetPages:
+            if time.perf_counter() > deadline:
+                break
+            continue
+
+        # the first (widest) candidate that meets the target
+        low, high = 0, len(widths) - 1
+        while low < high and time.perf_counter() <= deadline:
+            middle = (low + high) // 2
+            if pages(widths[middle]) <= targetPages:
+                high = middle
+            else:
+                low = middle + 1
+        return Fit(widths[high], pages(widths[high]), evaluations)
+
+    if best is None:
+        return Fit(style, pages(style), evaluations)
+    best.evaluations = evaluations
+    return best
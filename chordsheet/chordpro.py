@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+"""
+Reading and writing ChordPro. Files are read a line at a time and each song is handed over as
+soon as it ends, so multi-song files of any size can be converted in one pass.
+
+ChordPro has no timing except in grids, so chords in lyric lines are given a bar each (or
+beatsPerChord beats). Grids are read beat for beat, and documents are written as grids so that
+nothing about their timing is lost.
+"""
+
+import os
+import re
+
+from chordsheet.document import Document, Chord, Block, Section
+from chordsheet.parsers import parseName, parseFingering, parseChordSymbol, pitchClasses, sharp, flat
+from chordsheet.transpose import noteNames
+
+chordProExtensions = ('.cho', '.chopro', '.chordpro', '.crd', '.pro')
+
+# short and alternative directive names, and the ones we treat the same as others
+directiveAliases = {
+    't': 'title', 'st': 'subtitle', 'ns': 'new_song', 'c': 'comment', 'ci': 'comment', 'cb': 'comment',
+    'comment_italic': 'comment', 'comment_box': 'comment', 'highlight': 'comment', 'chord': 'define',
+    'soc': 'start_of_chorus', 'eoc': 'end_of_chorus', 'sov': 'start_of_verse', 'eov': 'end_of_verse',
+    'sob': 'start_of_bridge', 'eob': 'end_of_bridge', 'sog': 'start_of_grid', 'eog': 'end_of_grid',
+    'sot': 'start_of_tab', 'eot': 'end_of_tab',
+}
+directivePattern = re.compile(r'^\{\s*([A-Za-z_]+)(?:-[^\s:}]*)?\s*(?::\s*|\s+)?(.*?)\s*\}\s*$')
+chordPattern = re.compile(r'\[([^\]]*)\]')
+attributePattern = re.compile(r'([A-Za-z_]+)\s*=\s*"([^"]*)"')
+# the shape of a grid: [left margin +] measures [x beats] [+ right margin]
+shapePattern = re.compile(r'^(?:(\d+)\+)?(\d+)(?:x(\d+))?(?:\+(\d+))?$')
+noChordNames = ('N.C.', 'N.C', 'NC', 'X')
+
+
+def isBarLine(token):
+    return all(ch in '|:.' for ch in token) and '|' in token
+
+
+def spellKey(symbol, semitones):
+    """
+    Name the note some semitones above a chord's root, spelt with sharps or flats the way it
+    usually is in that chord, e.g. the seventh of C7 as B♭.
+    """
+    if sharp in symbol.root:
+        spelling = 'sharp'
+    elif flat in symbol.root:
+        spelling = 'flat'
+    else:
+        interval = semitones % 12
+        flatIntervals = (1, 3, 10) + ((6,) if symbol.quality in ('dim', 'hdim') else ()) + \
+            ((8,) if symbol.quality != 'aug' else ())
+        spelling = 'flat' if interval in flatIntervals else 'sharp'
+    return noteNames[spelling][(symbol.rootPitch + semitones) % 12]
+
+
+def isCell(token):
+    """
+    Whether a token in a grid is a cell: a chord, or a symbol that carries one on. Only whole
+    chord names count, so that margin text such as 'Coda' isn't taken for a C chord.
+    """
+    return token in ('.', '/', '%') or all(
+        name.upper() in noChordNames or parseChordSymbol(parseName(name)).complete
+        for name in token.split('~'))
+
+
+class ChordProReader:
+    """
+    Turns lines of ChordPro into Documents. Feed it lines with feed(), which returns a Document
+    whenever a song ends, then call finish() for the last one.
+
+    Chords in lyric lines last beatsPerChord beats, or a bar if it is None. With lyrics set,
+    the words after each chord become the notes of its block.
+    """
+
+    def __init__(self, beatsPerChord=None, lyrics=False):
+        self.beatsPerChord = beatsPerChord
+        self.lyrics = lyrics
+        self.startSong()
+
+    def startSong(self):
+        self.document = Document()
+        self.chords = {}
+        self.section = None
+        self.environment = None
+        self.notes = None  # from a comment, for the next block
+        self.hasContent = False
+        # for grids
+        self.cellBeats = None
+        self.margins = (0, 0)
+        self.lastBar = []
+
+    def chord(self, name):
+        """
+        Return the Chord for a name, adding it to the document if it's new, or None for no chord.
+        """
+        name = name.strip()
+        if name.upper() in noChordNames:
+            return None
+        name = parseName(name)
+        if name not in self.chords:
+            self.chords[name] = Chord(name)
+            self.document.chordList.append(self.chords[name])
+        return self.chords[name]
+
+    def addBlock(self, chord, length, notes=None):
+        if self.notes:
+            notes = self.notes + (' ' + notes if notes else '')
+            self.notes = None
+        if self.section is None:
+            self.section = Section()
+        self.section.blockList.append(Block(length, chord=chord, notes=notes))
+        self.hasContent = True
+
+    def endSection(self):
+        if self.section is not None and self.section.blockList:
+            if not self.section.name:
+                self.section.name = "Section {}".format(len(self.document.sectionList) + 1)
+            self.document.sectionList.append(self.section)
+        self.section = None
+
+    def feed(self, line):
+        """
+        Read one line. Returns the previous song's Document if this line starts a new one.
+        """
+        line = line.rstrip('\r\n')
+        stripped = line.strip()
+        if stripped.startswith('{'):
+            return self.directive(stripped)
+        if stripped.startswith('#') or self.environment == 'tab':
+            return None
+        if not stripped:
+            if self.environment is None:
+                # a blank line ends a paragraph outside of any chorus, verse etc.
+                self.endSection()
+            return None
+        if self.environment == 'grid':
+            self.gridLine(stripped)
+        else:
+            self.lyricLine(line)
+        return None
+
+    def finish(self):
+        """
+        Return the last song's Document, or None if there wasn't anything after the last break.
+        """
+        self.endSection()
+        document = self.document if self.hasContent else None
+        self.startSong()
+        return document
+
+    def directive(self, text):
+        match = directivePattern.match(text)
+        if match is None:
+            return None
+        name, value = match.group(1).lower(), match.group(2)
+        name = directiveAliases.get(name, name)
+
+        if name == 'new_song':
+            return self.finish()
+        elif name in ('title', 'subtitle', 'composer', 'arranger', 'tempo'):
+            setattr(self.document, name, value)
+            self.hasContent = True
+        elif name == 'artist':
+            # there's nowhere else to put the performer
+            if self.document.subtitle is None:
+                self.document.subtitle = value
+        elif name == 'time':
+            try:
+                self.document.timeSignature = int(value.split('/')[0])
+            except ValueError:
+                pass
+        elif name == 'comment':
+            self.notes = value if not self.notes else self.notes + ' ' + value
+        elif name == 'define':
+            self.define(value)
+        elif name.startswith('start_of_'):
+            self.endSection()
+            self.environment = name[len('start_of_'):]
+            if self.environment == 'grid':
+                label = self.startGrid(value)
+            else:
+                attributes = dict(attributePattern.findall(value))
+                label = attributes.get('label', value if not attributes else None)
+            self.section = Section(name=label or self.environment.capitalize())
+        elif name.startswith('end_of_'):
+            self.endSection()
+            self.environment = None
+        return None
+
+    def define(self, value):
+        """
+        Read a guitar voicing, e.g. 'Am base-fret 1 frets x 0 2 2 1 0', or a piano one, e.g.
+        'Am keys 9 12 16'.
+        """
+        words = value.split()
+        if not words or not ('frets' in words or 'keys' in words):
+            return
+        chord = self.chord(words[0])
+        if chord is None:
+            return
+        if 'keys' in words:
+            self.defineKeys(chord, words[words.index('keys') + 1:])
+        if 'frets' in words:
+            self.defineFrets(chord, words)
+
+    def defineKeys(self, chord, keys):
+        """
+        Read the keys of a piano voicing, given in semitones up from the root.
+        """
+        symbol = parseChordSymbol(chord.name)
+        if symbol.root is None or not keys or not all(k.lstrip('-').isdigit() for k in keys):
+            return
+        chord.voicings['piano'] = [spellKey(symbol, int(k)) for k in keys]
+
+    def defineFrets(self, chord, words):
+        """
+        Read the frets of a guitar voicing, counted from the base fret if one is given.
+        """
+        baseFret = 1
+        if 'base-fret' in words:
+            try:
+                baseFret = int(words[words.index('base-fret') + 1])
+            except (ValueError, IndexError):
+                return
+        start = words.index('frets') + 1
+        frets = []
+        for f in words[start:start + 6]:
+            if f.isdigit():
+                frets.append(str(int(f) + baseFret - 1) if int(f) > 0 else '0')
+            elif f in ('x', 'X', 'N', '-1'):
+                frets.append('x')
+            else:
+                return
+        try:
+            chord.voicings['guitar'] = parseFingering(','.join(frets), 'guitar')
+        except Exception:  # not six strings
+            pass
+
+    def startGrid(self, value):
+        """
+        Set up for a grid from the arguments of start_of_grid. Returns its label, if any.
+        """
+        attributes = dict(attributePattern.findall(value))
+        if attributes:
+            shape, label = attributes.get('shape', ''), attributes.get('label')
+        elif shapePattern.match(value.replace(' ', '')):
+            shape, label = value, None
+        else:
+            shape, label = '', value
+        match = shapePattern.match(shape.replace(' ', ''))
+        self.cellBeats = None
+        self.margins = (0, 0)
+        if match is not None:
+            left, measures, beats, right = match.groups()
+            self.margins = (int(left or 0), int(right or 0))
+            if beats:
+                self.cellBeats = self.document.timeSignature / int(beats)
+        self.lastBar = []
+        return label
+
+    def gridLine(self, line):
+        """
+        Read a row of a grid. With a shape giving the beats in a bar every cell is a beat
+        long; otherwise each bar is shared out between its cells.
+        """
+        tokens = line.split()
+        left, right = self.margins
+        bars = [n for n, t in enumerate(tokens) if isBarLine(t)]
+        if bars:
+            # margins are before the first bar line and after the last, if the shape says
+            # there are some or they aren't cells
+            if left or not all(isCell(t) for t in tokens[:bars[0]]):
+                tokens = tokens[bars[0]:]
+                bars = [n - bars[0] for n in bars]
+            if right or not all(isCell(t) for t in tokens[bars[-1] + 1:]):
+                tokens = tokens[:bars[-1] + 1]
+        elif left:
+            tokens = tokens[1:]
+
+        bars = [[]]
+        for t in tokens:
+            if isBarLine(t):
+                if bars[-1]:
+                    bars.append([])
+            else:
+                bars[-1].append(t)
+        for cells in bars:
+            if cells == ['%'] and self.lastBar:
+                cells = self.lastBar
+            if not cells:
+                continue
+            beats = self.cellBeats or self.document.timeSignature / len(cells)
+            for cell in cells:
+                self.gridCell(cell, beats)
+            self.lastBar = cells
+
+    def gridCell(self, cell, beats):
+        if cell in ('.', '/', '%'):
+            # the chord before carries on
+            if self.section is not None and self.section.blockList:
+                self.section.blockList[-1].length += beats
+            else:
+                self.addBlock(None, beats)
+            return
+        names = cell.split('~')  # several chords sharing a cell
+        for name in names:
+            self.addBlock(self.chord(name), beats / len(names))
+
+    def lyricLine(self, line):
+        matches = list(chordPattern.finditer(line))
+        length = self.beatsPerChord or self.document.timeSignature
+        for n, match in enumerate(matches):
+            name = match.group(1)
+            if name.startswith('*'):  # an annotation, not a chord
+                continue
+            notes = None
+            if self.lyrics:
+                end = matches[n + 1].start() if n + 1 < len(matches) else len(line)
+                notes = chordPattern.sub('', line[match.end():end]).strip() or None
+            self.addBlock(self.chord(name), length, notes)
+
+
+def iterChordPro(lines, beatsPerChord=None, lyrics=False):
+    """
+    Generate a Document for each song in some lines of ChordPro (e.g. an open file), one at a
+    time as each is read.
+    """
+    reader = ChordProReader(beatsPerChord, lyrics)
+    for line in lines:
+        document = reader.feed(line)
+        if document is not None:
+            yield document
+    document = reader.finish()
+    if document is not None:
+        yield document
+
+
+def iterChordProFile(filepath, beatsPerChord=None, lyrics=False):
+    """
+    Generate a Document for each song in a ChordPro file, reading it as it goes.
+    """
+    with open(filepath, 'r', encoding='utf-8-sig') as f:
+        yield from iterChordPro(f, beatsPerChord, lyrics)
+
+
+def formatBeats(value):
+    return str(int(value)) if value == int(value) else str(value)
+
+
+def keysLine(chord):
+    """
+    Return the define directive for a chord's piano voicing, or None if it hasn't one. Keys
+    are given in semitones up from the root, each above the one before.
+    """
+    notes = chord.voicings.get('piano')
+    root = parseChordSymbol(chord.name).rootPitch
+    if not notes or root is None or not all(n in pitchClasses for n in notes):
+        return None
+    keys = []
+    for n in notes:
+        key = (pitchClasses[n] - root) % 12
+        while keys and key <= keys[-1]:
+            key += 12
+        keys.append(key)
+    return "{{define: {n} keys {k}}}".format(n=chord.name, k=' '.join(str(k) for k in keys))
+
+
+def defineLine(chord):
+    """
+    Return the define directive for a chord's guitar voicing, or None if it hasn't one.
+    """
+    frets = chord.voicings.get('guitar')
+    if not frets:
+        return None
+    fretted = [int(f) for f in frets if f.isdigit() and int(f) > 0]
+    # frets up the neck are given from a base fret, as ChordPro only expects a few
+    baseFret = min(fretted) if fretted and max(fretted) > 5 else 1
+    frets = [str(int(f) - baseFret + 1) if f.isdigit() and int(f) > 0 else (f if f.isdigit() else 'x')
+             for f in frets]
+    return "{{define: {n} base-fret {b} frets {f}}}".format(n=chord.name, b=baseFret, f=' '.join(frets))
+
+
+def cellBeatsFor(section):
+    """
+    Return the length of a grid cell that every block in a section is a whole number of.
+    """
+    for beats in (1, 0.5, 0.25):
+        if all((b.length / beats).is_integer() for b in section.blockList):
+            return beats
+    return 0.25  # anything finer is rounded
+
+
+def gridLines(section, timeSignature, barsPerRow=4):
+    """
+    Return the lines of a grid for a section. A block with notes starts a new row, with its
+    notes in a comment just above.
+    """
+    cellBeats = cellBeatsFor(section)
+    cellsPerBar = round(timeSignature / cellBeats)
+    lines = ['{{start_of_grid: shape="{b}x{c}" label="{l}"}}'.format(
+        b=barsPerRow, c=cellsPerBar, l=(section.name or '').replace('"', "'"))]
+    row = []
+    cell = 0
+
+    def endRow():
+        if row:
+            lines.append(' '.join(row + (['|'] if cell % cellsPerBar == 0 else [])))
+            row.clear()
+
+    for b in section.blockList:
+        if b.notes:
+            endRow()
+            lines.append("{{comment: {n}}}".format(n=' '.join(b.notes.split())))
+        for n in range(max(1, round(b.length / cellBeats))):
+            if cell % cellsPerBar == 0:
+                if len(row) >= barsPerRow * (cellsPerBar + 1):
+                    endRow()
+                row.append('|')
+            if n == 0:
+                row.append(b.chord.name if b.chord is not None else 'N.C.')
+            else:
+                row.append('.')
+            cell += 1
+    endRow()
+    lines.append('{end_of_grid}')
+    return lines
+
+
+def chordProLines(document):
+    """
+    Generate the lines of ChordPro for a document.
+    """
+    yield "{{title: {t}}}".format(t=document.title or '')
+    for name in ('subtitle', 'composer', 'arranger'):
+        value = getattr(document, name)
+        if value:
+            yield "{{{d}: {v}}}".format(d=name, v=value)
+    yield "{{time: {n}/4}}".format(n=document.timeSignature)
+    if document.tempo:
+        yield "{{tempo: {t}}}".format(t=document.tempo)
+    for c in document.chordList:
+        for line in (defineLine(c), keysLine(c)):
+            if line:
+                yield line
+    for s in document.sectionList:
+        yield ''
+        yield from gridLines(s, document.timeSignature)
+
+
+def writeChordPro(document, f):
+    """
+    Write a document to an open text file as ChordPro.
+    """
+    for line in chordProLines(document):
+        f.write(line + '\n')
+
+
+def saveChordPro(documents, filepath):
+    """
+    Save one document or several (e.g. from a generator) to a ChordPro file, with new_song
+    between them.
+    """
+    if isinstance(documents, Document):
+        documents = [documents]
+    with open(filepath, 'w', encoding='utf-8') as f:
+        for n, document in enumerate(documents):
+            if n:
+                f.write('\n{new_song}\n')
+            writeChordPro(document, f)
+
+
+def documentToChordPro(document):
+    return '\n'.join(chordProLines(document)) + '\n'
+
+
+def importChordPro(inputPath, outputDir=None, beatsPerChord=None, lyrics=False):
+    """
+    Convert a ChordPro file to Chordsheet XML, next to it or in outputDir, one song at a time.
+    A file with one song becomes song.xml; one with several becomes song-1.xml, song-2.xml and
+    so on. Returns the paths written.
+    """
+    base = os.path.join(outputDir if outputDir else os.path.dirname(inputPath),
+                        os.path.splitext(os.path.basename(inputPath))[0])
+    written = []
+    for n, document in enumerate(iterChordProFile(inputPath, beatsPerChord, lyrics)):
+        if n == 1:
+            # it turns out there's more than one song, so number the first one too
+            os.replace(written[0], base + '-1.xml')
+            written[0] = base + '-1.xml'
+        path = base + ('-{n}.xml'.format(n=n + 1) if n else '.xml')
+        document.saveXML(path)
+        written.append(path)
+    return written
+
+
+def exportChordPro(inputPath, outputDir=None):
+    """
+    Convert a Chordsheet document to ChordPro, next to it or in outputDir. Returns the paths
+    written.
+    """
+    path = os.path.join(outputDir if outputDir else os.path.dirname(inputPath),
+                        os.path.splitext(os.path.basename(inputPath))[0] + '.cho')
+    saveChordPro(Document.newFromFile(inputPath), path)
+    return [path]
+
+
+def convertFile(inputPath, toChordPro, outputDir=None, beatsPerChord=None, lyrics=False):
+    """
+    Convert a file to or from ChordPro. Returns (paths written, error message or None). Run in
+    the worker processes, so it must not raise.
+    """
+    try:
+        if toChordPro:
+            return exportChordPro(inputPath, outputDir), None
+        return importChordPro(inputPath, outputDir, beatsPerChord, lyrics), None
+    except Exception as e:
+        return [], "{f}: could not be converted: {e}".format(f=inputPath, e=e)
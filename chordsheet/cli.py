@@ -0,0 +1,537 @@
+# -*- coding: utf-8 -*-
+"""
+Command line interface to Chordsheet. This never imports Qt, so it can run on machines without
+a display, e.g. CI and render servers.
+"""
+
+import os
+import sys
+import signal
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from reportlab.lib.pagesizes import A4, A5, LETTER, LEGAL
+
+from chordsheet.document import Document, Style
+
+# exit codes
+exitOK = 0
+exitFailed = 1  # at least one file could not be loaded or rendered
+exitUsage = 2  # the arguments don't make sense (argparse uses this too)
+
+pageSizeDict = {'A4': A4, 'A5': A5, 'Letter': LETTER, 'Legal': LEGAL}
+
+
+def error(message):
+    print("chordsheet: " + message, file=sys.stderr)
+
+
+def styleFromArgs(args):
+    """
+    Create a Style from the style options shared by the commands.
+    """
+    style = Style(pageSize=pageSizeDict[args.page_size])
+    for attr in ['leftMargin', 'rightMargin', 'topMargin', 'bottomMargin', 'lineSpacing', 'unitWidth']:
+        value = getattr(args, attr)
+        if value is not None:
+            setattr(style, attr, value)
+    return style
+
+
+def addInvariantArgument(parser):
+    parser.add_argument('--invariant', action='store_true',
+                        help="make the output depend only on the input (fixed dates and IDs), "
+                        "so the same input always gives the same bytes")
+
+
+def addStyleArguments(parser):
+    group = parser.add_argument_group("style")
+    group.add_argument('--page-size', choices=list(pageSizeDict.keys()), default='A4')
+    group.add_argument('--left-margin', dest='leftMargin', type=float, metavar='MM')
+    group.add_argument('--right-margin', dest='rightMargin', type=float, metavar='MM')
+    group.add_argument('--top-margin', dest='topMargin', type=float, metavar='MM')
+    group.add_argument('--bottom-margin', dest='bottomMargin', type=float, metavar='MM')
+    group.add_argument('--line-spacing', dest='lineSpacing', type=float)
+    group.add_argument('--beat-width', dest='unitWidth', type=float, metavar='MM')
+
+
+def outputPathFor(inputPath, outputDir):
+    """
+    Work out where the PDF for an input file should go: next to it, or in outputDir if given.
+    """
+    name = os.path.splitext(os.path.basename(inputPath))[0] + '.pdf'
+    return os.path.join(outputDir if outputDir else os.path.dirname(inputPath), name)
+
+
+def initWorker():
+    """
+    Load the fonts and the renderer, so they're ready before the first job arrives.
+    """
+    from chordsheet.fonts import registerFonts
+    import chordsheet.render
+    registerFonts()
+
+
+def renderFile(inputPath, outputPath, style, invariant=False, lazy=False):
+    """
+    Load a document and render it to outputPath ('-' for stdout). Returns an error message, or
+    None if it worked. Run in the worker processes, so it must not raise. With lazy set, the
+    sections of XML documents are read as they are rendered instead of all up front.
+    """
+    from chordsheet.render import Renderer
+
+    try:
+        if lazy and os.path.splitext(inputPath)[1].lower() in ('.xml', '.cml'):
+            doc = Document.newFromXMLLazily(inputPath)
+        else:
+            doc = Document.newFromFile(inputPath)
+    except Exception as e:
+        return "{f}: could not be loaded: {e}".format(f=inputPath, e=e)
+    try:
+        if outputPath == '-':
+            sys.stdout.buffer.write(Renderer(doc, style, invariant).stream().getvalue())
+            sys.stdout.buffer.flush()
+        else:
+            Renderer(doc, style, invariant).savePDF(outputPath)
+    except Exception as e:
+        return "{f}: could not be rendered: {e}".format(f=inputPath, e=e)
+    return None
+
+
+def renderCommand(args):
+    style = styleFromArgs(args)
+
+    if args.output == '-':
+        if len(args.files) > 1:
+            error("only one file can be written to stdout")
+            return exitUsage
+        jobs = [(args.files[0], '-')]
+    elif args.output and (len(args.files) == 1 and args.output.lower().endswith('.pdf')):
+        jobs = [(args.files[0], args.output)]
+    else:
+        if args.output and args.output.lower().endswith('.pdf'):
+            error("{o} looks like a PDF, but only one file can be rendered to a PDF; give a directory "
+                  "for more".format(o=args.output))
+            return exitUsage
+        jobs = [(f, outputPathFor(f, args.output)) for f in args.files]
+        # e.g. song.xml and song.cma, which would both be rendered to song.pdf
+        inputsFor = {}
+        for inputPath, outputPath in jobs:
+            inputsFor.setdefault(os.path.normcase(os.path.abspath(outputPath)), []).append(inputPath)
+        clashes = [inputs for inputs in inputsFor.values() if len(inputs) > 1]
+        for inputs in clashes:
+            error("{i} would be rendered to the same PDF".format(i=', '.join(inputs)))
+        if clashes:
+            return exitUsage
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+
+    workers = min(args.jobs or os.cpu_count() or 1, len(jobs))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=initWorker) as pool:
+            errors = list(pool.map(renderFile, *zip(*jobs), [style] * len(jobs),
+                                   [args.invariant] * len(jobs), [args.lazy] * len(jobs)))
+    else:
+        # a pool isn't worth starting for a single worker
+        initWorker()
+        errors = [renderFile(i, o, style, args.invariant, args.lazy) for i, o in jobs]
+
+    failed = [e for e in errors if e is not None]
+    for e in failed:
+        error(e)
+    if not args.quiet:
+        for (inputPath, outputPath), e in zip(jobs, errors):
+            if e is None and outputPath != '-':
+                print("{i} -> {o}".format(i=inputPath, o=outputPath), file=sys.stderr)
+    return exitFailed if failed else exitOK
+
+
+def transposeCommand(args):
+    from chordsheet.transpose import transposeFile, transposedPathFor
+
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    jobs = [(f, transposedPathFor(f, args.semitones, args.output)) for f in args.files]
+    semitones = [args.semitones] * len(jobs)
+    spelling = [args.spelling] * len(jobs)
+
+    workers = min(args.jobs or os.cpu_count() or 1, len(jobs))
+    if workers > 1:
+        # plenty of small jobs, so hand them out in batches
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            errors = list(pool.map(transposeFile, *zip(*jobs), semitones, spelling,
+                                   chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        errors = list(map(transposeFile, *zip(*jobs), semitones, spelling))
+
+    failed = [e for e in errors if e is not None]
+    for e in failed:
+        error(e)
+    if not args.quiet:
+        for (inputPath, outputPath), e in zip(jobs, errors):
+            if e is None:
+                print("{i} -> {o}".format(i=inputPath, o=outputPath), file=sys.stderr)
+    return exitFailed if failed else exitOK
+
+
+def convertCommand(args):
+    from chordsheet.chordpro import convertFile, chordProExtensions
+    from chordsheet.library import findDocuments
+    from chordsheet.watcher import documentExtensions
+
+    toChordPro = args.to == 'chordpro'
+    files = findDocuments(args.files, documentExtensions if toChordPro else chordProExtensions)
+    if not files:
+        error("no files to convert")
+        return exitUsage
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+    options = [[toChordPro] * len(files), [args.output] * len(files), [args.beats] * len(files),
+               [args.lyrics] * len(files)]
+
+    workers = min(args.jobs or os.cpu_count() or 1, len(files))
+    if workers > 1:
+        # plenty of small jobs, so hand them out in batches
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(convertFile, files, *options,
+                                    chunksize=max(1, len(files) // (workers * 4))))
+    else:
+        results = list(map(convertFile, files, *options))
+
+    failed = [e for written, e in results if e is not None]
+    for e in failed:
+        error(e)
+    if not args.quiet:
+        for inputPath, (written, e) in zip(files, results):
+            for outputPath in written:
+                print("{i} -> {o}".format(i=inputPath, o=outputPath), file=sys.stderr)
+    return exitFailed if failed else exitOK
+
+
+def lintCommand(args):
+    from chordsheet.lint import lintFiles, reportJSON, error as errorSeverity
+
+    files, problems = lintFiles(args.files, jobs=args.jobs)
+    if not files:
+        error("no documents to check")
+        return exitUsage
+
+    if args.format == 'json':
+        report = reportJSON(files, problems)
+    else:
+        report = ''.join(str(p) + '\n' for p in problems)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+    else:
+        sys.stdout.write(report)
+
+    errors = sum(1 for p in problems if p.severity == errorSeverity)
+    warnings = len(problems) - errors
+    if not args.quiet:
+        print("{f} files checked, {e} errors, {w} warnings".format(f=len(files), e=errors, w=warnings),
+              file=sys.stderr)
+    return exitFailed if errors or (args.strict and warnings) else exitOK
+
+
+def libraryImportCommand(args):
+    from chordsheet.library import Library
+
+    with Library(args.database) as library:
+        result = library.importFiles(args.files, jobs=args.jobs)
+        pruned = library.prune() if args.prune else 0
+    for e in result.errors:
+        error(e)
+    if not args.quiet:
+        print("{a} added, {u} updated, {n} unchanged, {p} removed -> {d}".format(
+            a=result.added, u=result.updated, n=result.unchanged, p=pruned, d=args.database), file=sys.stderr)
+    return exitFailed if result.errors else exitOK
+
+
+def librarySearchCommand(args):
+    from chordsheet.library import Library
+
+    if not os.path.exists(args.database):
+        error("{d}: no such library".format(d=args.database))
+        return exitUsage
+    fields = {f: getattr(args, f) for f in ('title', 'composer', 'arranger') if getattr(args, f) is not None}
+    with Library(args.database) as library:
+        # every condition given must match
+        found = None
+        if args.text:
+            found = library.search(' '.join(args.text))
+        if fields or found is None and not (args.chord or args.progression):
+            found = intersectEntries(found, library.find(**fields))
+        for chord in args.chord or []:
+            found = intersectEntries(found, library.withChord(chord, enharmonic=not args.exact))
+        if args.progression:
+            try:
+                matches = library.withProgression(args.progression, anyKey=not args.same_key, strict=args.exact)
+            except ValueError as e:
+                error(str(e))
+                return exitUsage
+            if found is not None:
+                ids = set(e.id for e in found)
+                matches = [m for m in matches if m.entry.id in ids]
+            for m in matches:
+                print("{p}\t{t}\t{s}, block {b}".format(p=m.entry.path, t=m.entry.title, s=m.section.name,
+                                                        b=m.block + 1))
+            return exitOK if matches else exitFailed
+    for entry in found:
+        print("{p}\t{t}".format(p=entry.path, t=entry.title))
+    return exitOK if found else exitFailed
+
+
+def intersectEntries(found, entries):
+    """
+    Keep the entries of found (in its order) that are also in entries, or all of entries if
+    nothing has been looked for yet.
+    """
+    if found is None:
+        return entries
+    ids = set(e.id for e in entries)
+    return [e for e in found if e.id in ids]
+
+
+def watchCommand(args):
+    from chordsheet.watcher import Watcher
+
+    if not os.path.isdir(args.directory):
+        error("{d}: not a directory".format(d=args.directory))
+        return exitUsage
+
+    def report(message):
+        if not args.quiet or ' -> ' not in message:
+            print(message, file=sys.stderr)
+
+    watcher = Watcher(args.directory, styleFromArgs(args), outputDir=args.output, interval=args.interval,
+                      debounce=args.debounce, jobs=args.jobs, invariant=args.invariant, report=report)
+    # stop as cleanly on SIGTERM (e.g. from a service manager) as on Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        watcher.run(once=args.once)
+    except KeyboardInterrupt:
+        pass
+    return exitOK
+
+
+def songbookCommand(args):
+    from chordsheet.songbook import Songbook
+
+    initWorker()
+    try:
+        book = Songbook.newFromFiles(args.files, styleFromArgs(args), title=args.title,
+                                     sharedCharts=args.shared_charts, jobs=args.jobs, invariant=args.invariant)
+    except Exception as e:
+        error("could not load the songs: {e}".format(e=e))
+        return exitFailed
+    try:
+        pages = book.savePDF(args.output)
+    except Exception as e:
+        error("{o}: could not be rendered: {e}".format(o=args.output, e=e))
+        return exitFailed
+    if not args.quiet:
+        print("{n} songs, {p} pages -> {o}".format(n=len(book.songs), p=pages, o=args.output), file=sys.stderr)
+    return exitOK
+
+
+def serveCommand(args):
+    from chordsheet.server import RenderService, makeServer
+
+    service = RenderService(styleFromArgs(args), jobs=args.jobs, queueSize=args.queue,
+                            cacheBytes=args.cache_size*1024*1024)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server = makeServer(service, port=args.port, socketPath=args.socket, quiet=args.quiet)
+    except OSError as e:
+        error("could not listen: {e}".format(e=e))
+        return exitFailed
+    try:
+        service.start()
+        print("serving on {a} with {n} workers".format(
+            a=args.socket or "http://127.0.0.1:{p}".format(p=server.server_address[1]), n=service.jobs),
+            file=sys.stderr, flush=True)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return exitOK
+
+
+def makeParser():
+    parser = argparse.ArgumentParser(
+        prog="chordsheet", description="Render Chordsheet documents without the GUI.")
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    render = subparsers.add_parser(
+        'render', help="render .xml/.cml/.cma files to PDF")
+    render.add_argument('files', nargs='+', metavar='file')
+    render.add_argument('-o', '--output', metavar='PATH',
+                        help="PDF file (one input), directory, or '-' for stdout (default: next to each input)")
+    render.add_argument('-j', '--jobs', type=int, metavar='N',
+                        help="number of worker processes (default: one per CPU)")
+    render.add_argument('-q', '--quiet', action='store_true',
+                        help="only report errors")
+    render.add_argument('--lazy', action='store_true',
+                        help="read the sections of XML documents as they are rendered, to save memory on very large ones")
+    addInvariantArgument(render)
+    addStyleArguments(render)
+    render.set_defaults(func=renderCommand)
+
+    transpose = subparsers.add_parser(
+        'transpose', help="transpose documents, saving a copy of each in the new key")
+    transpose.add_argument('files', nargs='+', metavar='file')
+    transpose.add_argument('-s', '--semitones', type=int, required=True, metavar='N',
+                           help="how far to transpose, e.g. 2 for up a tone or -3 for down a minor third")
+    transpose.add_argument('--spelling', choices=['sharp', 'flat'],
+                           help="write sharps or flats (default: as each document mostly does already)")
+    transpose.add_argument('-o', '--output', metavar='DIR',
+                           help="directory for the copies, named e.g. song+2.xml (default: next to each input)")
+    transpose.add_argument('-j', '--jobs', type=int, metavar='N',
+                           help="number of worker processes (default: one per CPU)")
+    transpose.add_argument('-q', '--quiet', action='store_true',
+                           help="only report errors")
+    transpose.set_defaults(func=transposeCommand)
+
+    convert = subparsers.add_parser(
+        'convert', help="convert ChordPro files to Chordsheet documents, or the other way round")
+    convert.add_argument('files', nargs='+', metavar='file',
+                         help="files, or directories to look through for them")
+    convert.add_argument('--to', choices=['xml', 'chordpro'], required=True,
+                         help="xml to read ChordPro (songs in one file are saved separately), "
+                         "chordpro to write it")
+    convert.add_argument('-o', '--output', metavar='DIR',
+                         help="directory for the converted files (default: next to each input)")
+    convert.add_argument('--beats', type=float, metavar='N',
+                         help="how long each chord in a lyric line lasts (default: a bar)")
+    convert.add_argument('--lyrics', action='store_true',
+                         help="keep the words after each chord as the notes of its block")
+    convert.add_argument('-j', '--jobs', type=int, metavar='N',
+                         help="number of worker processes (default: one per CPU)")
+    convert.add_argument('-q', '--quiet', action='store_true',
+                         help="only report errors")
+    convert.set_defaults(func=convertCommand)
+
+    lint = subparsers.add_parser(
+        'lint', help="check documents for problems without rendering them")
+    lint.add_argument('files', nargs='+', metavar='file',
+                      help="documents, or directories to look through for them")
+    lint.add_argument('--format', choices=['text', 'json'], default='text',
+                      help="one problem per line, or a JSON report (default: text)")
+    lint.add_argument('-o', '--output', metavar='FILE', help="write the report here instead of to stdout")
+    lint.add_argument('--strict', action='store_true', help="fail on warnings as well as errors")
+    lint.add_argument('-j', '--jobs', type=int, metavar='N',
+                      help="number of worker processes (default: one per CPU)")
+    lint.add_argument('-q', '--quiet', action='store_true',
+                      help="don't print the summary")
+    lint.set_defaults(func=lintCommand)
+
+    library = subparsers.add_parser(
+        'library', help="keep documents in a database that can be searched without opening them")
+    library.add_argument('database', help="SQLite file, created if it doesn't exist")
+    librarySubparsers = library.add_subparsers(dest='action', metavar='action')
+    librarySubparsers.required = True
+
+    libraryImport = librarySubparsers.add_parser(
+        'import', help="add documents, or bring the ones already there up to date")
+    libraryImport.add_argument('files', nargs='+', metavar='file',
+                               help="documents, or directories to look through for them")
+    libraryImport.add_argument('--prune', action='store_true',
+                               help="also remove songs whose files no longer exist")
+    libraryImport.add_argument('-j', '--jobs', type=int, metavar='N',
+                               help="number of worker processes (default: one per CPU)")
+    libraryImport.add_argument('-q', '--quiet', action='store_true',
+                               help="only report errors")
+    libraryImport.set_defaults(func=libraryImportCommand)
+
+    librarySearch = librarySubparsers.add_parser(
+        'search', help="list the songs matching everything given, one path and title per line")
+    librarySearch.add_argument('text', nargs='*',
+                               help="words to find in the titles, credits, section names or notes")
+    librarySearch.add_argument('--title')
+    librarySearch.add_argument('--composer')
+    librarySearch.add_argument('--arranger')
+    librarySearch.add_argument('-c', '--chord', action='append', metavar='NAME',
+                               help="a chord the song uses, in any spelling (can be given more than once)")
+    librarySearch.add_argument('-p', '--progression', metavar='CHORDS',
+                               help="a progression the song contains, in any key, as chord names or Roman "
+                               "numerals, e.g. 'ii-V-I' or 'C G Am F'; prints where each one is")
+    librarySearch.add_argument('--same-key', action='store_true',
+                               help="only find the progression in the key it is given in")
+    librarySearch.add_argument('--exact', action='store_true',
+                               help="only match chords spelt exactly as given, and progressions "
+                               "with exactly the chords given rather than ones of the same kind")
+    librarySearch.set_defaults(func=librarySearchCommand)
+
+    watch = subparsers.add_parser(
+        'watch', help="re-render documents in a directory tree whenever they change")
+    watch.add_argument('directory')
+    watch.add_argument('-o', '--output', metavar='DIR',
+                       help="directory to mirror the tree into (default: next to each input)")
+    watch.add_argument('-j', '--jobs', type=int, metavar='N',
+                       help="number of worker processes (default: one per CPU)")
+    watch.add_argument('--interval', type=float, default=0.5, metavar='SECONDS',
+                       help="how often to look for changes (default: 0.5)")
+    watch.add_argument('--debounce', type=float, default=0.3, metavar='SECONDS',
+                       help="how long a file must stay unchanged before it is rendered (default: 0.3)")
+    watch.add_argument('--once', action='store_true',
+                       help="render whatever is out of date and exit")
+    watch.add_argument('-q', '--quiet', action='store_true',
+                       help="only report errors")
+    addInvariantArgument(watch)
+    addStyleArguments(watch)
+    watch.set_defaults(func=watchCommand)
+
+    songbook = subparsers.add_parser(
+        'songbook', help="combine documents into one PDF with a table of contents")
+    songbook.add_argument('files', nargs='+', metavar='file',
+                          help="documents, in the order they should appear")
+    songbook.add_argument('-o', '--output', metavar='PDF', required=True)
+    songbook.add_argument('-t', '--title', help="title shown above the table of contents")
+    songbook.add_argument('--shared-charts', action='store_true',
+                          help="draw each chord voicing once in an appendix instead of in every song")
+    songbook.add_argument('-j', '--jobs', type=int, metavar='N',
+                          help="number of worker processes (default: one per CPU)")
+    songbook.add_argument('-q', '--quiet', action='store_true',
+                          help="only report errors")
+    addInvariantArgument(songbook)
+    addStyleArguments(songbook)
+    songbook.set_defaults(func=songbookCommand)
+
+    serve = subparsers.add_parser(
+        'serve', help="render documents sent over HTTP on localhost")
+    listen = serve.add_mutually_exclusive_group()
+    listen.add_argument('-p', '--port', type=int, default=8765,
+                        help="port to listen on, on 127.0.0.1 only (default: 8765)")
+    listen.add_argument('--socket', metavar='PATH', help="listen on a Unix socket instead")
+    serve.add_argument('-j', '--jobs', type=int, metavar='N',
+                       help="number of worker processes (default: one per CPU)")
+    serve.add_argument('--queue', type=int, default=16, metavar='N',
+                       help="requests that can wait for a worker before new ones are turned away (default: 16)")
+    serve.add_argument('--cache-size', type=int, default=64, metavar='MB',
+                       help="memory to keep rendered results in (default: 64)")
+    serve.add_argument('-q', '--quiet', action='store_true',
+                       help="don't log each request")
+    addStyleArguments(serve)
+    serve.set_defaults(func=serveCommand)
+
+    return parser
+
+
+def main(argv=None):
+    args = makeParser().parse_args(argv)
+    if os.environ.get('CHORDSHEET_MEMORY_PROFILE'):
+        import multiprocessing
+        from chordsheet.memoryProfile import profileFromEnvironment
+        # the preview stages would import Qt
+        profileFromEnvironment(stages=['load', 'layout'])
+        # workers that aren't forked start without the profiler, so do everything here
+        if multiprocessing.get_start_method() != 'fork' and getattr(args, 'jobs', 1) != 1:
+            error("memory profiling can't follow worker processes on this platform, so using one job")
+            args.jobs = 1
+    return args.func(args)
@@ -1,7 +1,8 @@
 # -*- coding: utf-8 -*-
 
+import os
 from xml.etree import ElementTree as ET
-from chordsheet.parsers import parseFingering, parseName
+from chordsheet.parsers import parseFingering, parseName, parseChordSymbol
 from reportlab.lib.units import mm
 from reportlab.lib.pagesizes import A4
 
@@ -35,6 +36,64 @@ class Style:
         self.chordNameFontSize = 18
         self.beatsFontSize = 12
 
+    def snapshot(self):
+        """
+        Return an immutable copy of the style as it is now, for rendering while this one
+        carries on being edited.
+        """
+        return FrozenStyle({name: getattr(self, name) for name in styleFields})
+
+
+# every setting held by a Style, in the order FrozenStyle compares them
+styleFields = ('unit', 'pageSize', 'leftMargin', 'topMargin', 'rightMargin', 'bottomMargin', 'font',
+               'lineSpacing', 'unitWidth', 'useIncludedFont', 'numberPages', 'separatorSize',
+               'titleFontSize', 'subtitleFontSize', 'creditsFontSize', 'tempoFontSize',
+               'headingFontSize', 'notesFontSize', 'chordNameFontSize', 'beatsFontSize')
+
+
+class FrozenStyle:
+    """
+    Immutable, hashable snapshot of a Style. It has the same attributes as a Style, so it can
+    be used anywhere one is read from, and is safe to share between threads and processes.
+    """
+    __slots__ = styleFields
+
+    def __init__(self, fields):
+        for name in styleFields:
+            value = fields[name]
+            object.__setattr__(self, name, tuple(value) if name == 'pageSize' else value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FrozenStyle can't be changed, edit the Style it came from instead")
+
+    def __delattr__(self, name):
+        raise AttributeError("FrozenStyle can't be changed, edit the Style it came from instead")
+
+    def __reduce__(self):
+        return (FrozenStyle, (dict(self.items()),))
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in styleFields]
+
+    def __eq__(self, other):
+        if isinstance(other, self.__class__):
+            return self.items() == other.items()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(tuple(self.items()))
+
+    def snapshot(self):
+        return self
+
+    def replace(self, **changes):
+        """
+        Return a copy of the snapshot with some settings changed.
+        """
+        fields = dict(self.items())
+        fields.update(changes)
+        return FrozenStyle(fields)
+
 
 class Chord:
     def __init__(self, name, **kwargs):
@@ -43,6 +102,13 @@ class Chord:
         for inst, fing in kwargs.items():
             self.voicings[inst] = fing
 
+    @property
+    def symbol(self):
+        """
+        The chord's name parsed into a ChordSymbol. Parsing is cached, so this is cheap.
+        """
+        return parseChordSymbol(self.name)
+
     def __eq__(self, other):
         if isinstance(other, self.__class__):
             return self.name == other.name and self.voicings == other.voicings
@@ -96,6 +162,17 @@ class Document:
         xmlDoc = ET.parse(filepath)
         root = xmlDoc.getroot()
 
+        self.loadXMLHeader(root)
+
+        self.sectionList = []
+        if root.find('section'):
+            for n, s in enumerate(root.findall('section')):
+                self.sectionList.append(self.sectionFromXML(s, n))
+
+    def loadXMLHeader(self, root):
+        """
+        Import everything but the sections from the root element of an XML file.
+        """
         self.chordList = []
         if root.find('chords'):
             for c in root.findall('chords/chord'):
@@ -104,33 +181,6 @@ class Document:
                     self.chordList[-1].voicings[v.attrib['instrument']
                                                 ] = parseFingering(v.text, v.attrib['instrument'])
 
-        self.sectionList = []
-        if root.find('section'):
-            for n, s in enumerate(root.findall('section')):
-                blockList = []
-
-                for b in s.findall('block'):
-                    blockChordName = parseName(b.find('chord').text) if b.find(
-                        'chord') is not None else None
-                    if blockChordName:
-                        blockChord = None
-                        for c in self.chordList:
-                            if c.name == blockChordName:
-                                blockChord = c
-                                break
-                        if blockChord is None:
-                            raise ValueError("Chord {c} does not match any chord in {l}.".format(
-                                c=blockChordName, l=self.chordList))
-                    else:
-                        blockChord = None
-                    blockNotes = (b.find('notes').text if b.find(
-                        'notes') is not None else None)
-                    blockList.append(
-                        Block(float(b.find('length').text), chord=blockChord, notes=blockNotes))
-                # automatically name the section by its index if a name isn't given. The +1 is because indexing starts from 0.
-                self.sectionList.append(Section(blockList=blockList, name=(
-                    s.attrib['name'] if 'name' in s.attrib else "Section {}".format(n + 1))))
-
         self.title = (root.find('title').text if root.find(
             'title') is not None else '')  # Do not initialise title empty
         self.subtitle = (root.find('subtitle').text if root.find(
@@ -144,6 +194,34 @@ class Document:
         self.tempo = (root.find('tempo').text if root.find(
             'tempo') is not None else None)
 
+    def sectionFromXML(self, s, n):
+        """
+        Return a Section read from a section element, the nth in the file.
+        """
+        blockList = []
+
+        for b in s.findall('block'):
+            blockChordName = parseName(b.find('chord').text) if b.find(
+                'chord') is not None else None
+            if blockChordName:
+                blockChord = None
+                for c in self.chordList:
+                    if c.name == blockChordName:
+                        blockChord = c
+                        break
+                if blockChord is None:
+                    raise ValueError("Chord {c} does not match any chord in {l}.".format(
+                        c=blockChordName, l=self.chordList))
+            else:
+                blockChord = None
+            blockNotes = (b.find('notes').text if b.find(
+                'notes') is not None else None)
+            blockList.append(
+                Block(float(b.find('length').text), chord=blockChord, notes=blockNotes))
+        # automatically name the section by its index if a name isn't given. The +1 is because indexing starts from 0.
+        return Section(blockList=blockList, name=(
+            s.attrib['name'] if 'name' in s.attrib else "Section {}".format(n + 1)))
+
     @classmethod
     def newFromXML(cls, filepath):
         """
@@ -153,6 +231,83 @@ class Document:
         doc.loadXML(filepath)
         return doc
 
+    @classmethod
+    def newFromXMLLazily(cls, filepath):
+        """
+        Create a new Document object from an XML file without reading in its sections. Instead
+        sectionList is an iterator that reads them from the file one at a time as they are
+        used, so it can only be gone through once (e.g. by a render). Everything else must
+        come before the first section, as it does in files written by saveXML.
+        """
+        doc = cls()
+        events = ET.iterparse(filepath, events=('start', 'end'))
+        event, root = next(events)
+
+        # read up to the start of the first section
+        depth = 1
+        inSection = False
+        for event, element in events:
+            if event == 'start':
+                depth += 1
+                if depth == 2 and element.tag == 'section':
+                    inSection = True
+                    break
+            else:
+                depth -= 1
+        doc.loadXMLHeader(root)
+
+        def sections():
+            depth = 2
+            n = 0
+            if not inSection:
+                return
+            for event, element in events:
+                if event == 'start':
+                    depth += 1
+                else:
+                    depth -= 1
+                    if depth == 1 and element.tag == 'section':
+                        yield doc.sectionFromXML(element, n)
+                        n += 1
+                        # let go of the elements read so far
+                        root.clear()
+
+        doc.sectionList = sections()
+        return doc
+
+    @classmethod
+    def newFromCSMacro(cls, filepath):
+        """
+        Create a new Document object directly from a Chordsheet Macro file.
+        """
+        doc = cls()
+        doc.loadCSMacro(filepath)
+        return doc
+
+    @classmethod
+    def newFromChordPro(cls, filepath):
+        """
+        Create a new Document object from the first song in a ChordPro file.
+        """
+        doc = cls()
+        doc.loadChordPro(filepath)
+        return doc
+
+    @classmethod
+    def newFromFile(cls, filepath):
+        """
+        Create a new Document object from a file, choosing the format by its extension.
+        """
+        from chordsheet.chordpro import chordProExtensions
+
+        fileExt = os.path.splitext(filepath)[1].lower()
+        if fileExt == ".cma":
+            return cls.newFromCSMacro(filepath)
+        elif fileExt in chordProExtensions:
+            return cls.newFromChordPro(filepath)
+        else:  # if fileExt in [".xml", ".cml"]:
+            return cls.newFromXML(filepath)
+
     def saveXML(self, filepath):
         """
         Write the contents of the Document object to an XML file.
@@ -202,10 +357,40 @@ class Document:
         tree = ET.ElementTree(root)
         tree.write(filepath)
         
+    def loadChordPro(self, filepath):
+        """
+        Read the first song in a ChordPro file and import its contents.
+        """
+        from chordsheet.chordpro import iterChordProFile
+
+        self.loadChordProSong(iterChordProFile(filepath))
+
+    def loadChordProText(self, text):
+        """
+        Import the contents of the first song in some ChordPro text.
+        """
+        from chordsheet.chordpro import iterChordPro
+
+        self.loadChordProSong(iterChordPro(text.splitlines()))
+
+    def loadChordProSong(self, songs):
+        song = next(songs, None)
+        songs.close()  # only the first song is wanted, so stop reading
+        if song is None:
+            raise ValueError("There are no songs in this ChordPro file.")
+        self.__dict__.update(song.__dict__)
+
     def loadCSMacro(self, filepath):
         """
         Read a Chordsheet Macro file and import its contents.
         """
+        with open(filepath, 'r') as f:
+            self.loadCSMacroText(f.read())
+
+    def loadCSMacroText(self, cmatext):
+        """
+        Import the contents of a Chordsheet Macro from a string.
+        """
         self.chordList = []
         self.sectionList = []
 
@@ -259,9 +444,6 @@ class Document:
                 
             self.sectionList[-1].blockList = blockList
             
-        with open(filepath, 'r') as f:
-            cmatext = f.read()
-            
         cmaCmdsArgs = [statement.split(" ", 1) for statement in \
             (rawStatement.strip() for rawStatement in cmatext.split("\\")[1:])]
 
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+# the fonts folder lives next to the chordsheet package, or in the bundle for a pyinstaller binary
+if getattr(sys, 'frozen', False):
+    fontDir = os.path.join(sys._MEIPASS, 'fonts')
+else:
+    fontDir = os.path.join(os.path.dirname(
+        os.path.dirname(os.path.abspath(__file__))), 'fonts')
+
+
+def registerFonts():
+    """
+    Register the fonts used by Style with ReportLab. Parsing the font files is slow, so this is
+    left until something is about to be rendered, and only done once.
+    """
+    registered = pdfmetrics.getRegisteredFontNames()
+    if 'FreeSans' not in registered:
+        pdfmetrics.registerFont(
+            TTFont('FreeSans', os.path.join(fontDir, 'FreeSans.ttf')))
+    if sys.platform == "darwin" and 'HelveticaNeue' not in registered:
+        pdfmetrics.registerFont(
+            TTFont('HelveticaNeue', 'HelveticaNeue.ttc', subfontIndex=0))
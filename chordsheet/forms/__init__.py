@@ -0,0 +1 @@
+# Modules in this package are generated from the .ui files by compile_ui.py and are not kept in git.
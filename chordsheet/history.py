@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import sys
+from collections import deque
+
+from chordsheet.document import Section
+
+# rough size of a Block and its attribute dictionary, used to estimate what a snapshot costs
+blockSize = 200
+
+
+class SectionSnapshot:
+    """
+    Frozen copy of a Section. The blocks themselves are shared, not copied.
+    """
+    __slots__ = ('name', 'blockList')
+
+    def __init__(self, name, blockList):
+        self.name = name
+        self.blockList = tuple(blockList)
+
+
+class Snapshot:
+    """
+    Frozen copy of a Document. Chords, blocks and any sections that haven't changed are shared
+    with the snapshot before it, so each snapshot only costs what was edited.
+    """
+    __slots__ = ('title', 'subtitle', 'composer', 'arranger', 'timeSignature', 'tempo',
+                 'chordList', 'sectionList', 'size')
+
+    def __init__(self, document, chordList, sectionList, size):
+        self.title = document.title
+        self.subtitle = document.subtitle
+        self.composer = document.composer
+        self.arranger = document.arranger
+        self.timeSignature = document.timeSignature
+        self.tempo = document.tempo
+        self.chordList = chordList
+        self.sectionList = sectionList
+        # estimated number of bytes this snapshot added to the history
+        self.size = size
+
+    def sameAs(self, other):
+        """
+        Check whether two snapshots hold the same document. Shared parts are compared by identity
+        so this is cheap.
+        """
+        return (self.title, self.subtitle, self.composer, self.arranger, self.timeSignature, self.tempo) == \
+            (other.title, other.subtitle, other.composer, other.arranger, other.timeSignature, other.tempo) and \
+            self.chordList is other.chordList and len(self.sectionList) == len(other.sectionList) and \
+            all(a is b for a, b in zip(self.sectionList, other.sectionList))
+
+
+class History:
+    """
+    Undo/redo history of a Document built from structurally shared snapshots.
+
+    Objects must not be changed in place once they have been recorded: edited chords, blocks
+    and sections should be replaced by new objects, as DocumentWindow.updateDocument does.
+    The oldest steps are dropped once the history goes over maxBytes (an estimate) or maxSteps.
+    """
+
+    def __init__(self, maxBytes=64*1024*1024, maxSteps=None):
+        self.maxBytes = maxBytes
+        self.maxSteps = maxSteps
+        self.undoStack = deque()  # the current state is always at the end
+        self.redoStack = []
+        self.totalSize = 0
+        # id of each live Section -> (Section, SectionSnapshot), so unchanged sections are reused
+        self.liveSections = {}
+
+    def snapshot(self, document):
+        """
+        Take a snapshot of the document, sharing everything that hasn't changed since the last one.
+        """
+        previous = self.undoStack[-1] if self.undoStack else None
+        size = 0
+
+        if previous is not None and len(previous.chordList) == len(document.chordList) and \
+                all(a is b for a, b in zip(previous.chordList, document.chordList)):
+            chordList = previous.chordList
+        else:
+            chordList = tuple(document.chordList)
+            size += sys.getsizeof(chordList)
+
+        liveSections = {}
+        sectionList = []
+        previousSections = None
+        for s in document.sectionList:
+            if id(s) in self.liveSections:
+                frozen = self.liveSections[id(s)][1]
+            else:
+                frozen = SectionSnapshot(s.name, s.blockList)
+                # blocks already held by the last snapshot of this section don't cost anything
+                if previousSections is None:
+                    previousSections = {ss.name: ss for ss in previous.sectionList} if previous else {}
+                oldBlocks = {id(b) for b in previousSections[s.name].blockList} \
+                    if s.name in previousSections else set()
+                size += sys.getsizeof(frozen) + sys.getsizeof(frozen.blockList) + \
+                    blockSize * sum(1 for b in frozen.blockList if id(b) not in oldBlocks)
+            liveSections[id(s)] = (s, frozen)
+            sectionList.append(frozen)
+        self.liveSections = liveSections
+
+        sectionList = tuple(sectionList)
+        size += sys.getsizeof(sectionList)
+        return Snapshot(document, chordList, sectionList, size)
+
+    def record(self, document):
+        """
+        Add the current state of the document to the history. Returns the new snapshot, or None
+        if nothing has changed since the last one.
+        """
+        snapshot = self.snapshot(document)
+        if self.undoStack and snapshot.sameAs(self.undoStack[-1]):
+            return None
+        self.undoStack.append(snapshot)
+        self.totalSize += snapshot.size
+        for s in self.redoStack:
+            self.totalSize -= s.size
+        self.redoStack = []
+        self.trim()
+        return snapshot
+
+    def clear(self, document):
+        """
+        Forget all history and start again from the given document.
+        """
+        self.undoStack.clear()
+        self.redoStack = []
+        self.totalSize = 0
+        self.liveSections = {}
+        self.record(document)
+
+    def trim(self):
+        while len(self.undoStack) > 1 and (self.totalSize > self.maxBytes or
+                                           (self.maxSteps is not None and len(self.undoStack) > self.maxSteps + 1)):
+            self.totalSize -= self.undoStack.popleft().size
+
+    def canUndo(self):
+        return len(self.undoStack) > 1
+
+    def canRedo(self):
+        return bool(self.redoStack)
+
+    def undo(self):
+        """
+        Step back one snapshot and return it, or None if there is nothing to undo.
+        """
+        if not self.canUndo():
+            return None
+        self.redoStack.append(self.undoStack.pop())
+        return self.undoStack[-1]
+
+    def redo(self):
+        """
+        Step forward one snapshot and return it, or None if there is nothing to redo.
+        """
+        if not self.canRedo():
+            return None
+        self.undoStack.append(self.redoStack.pop())
+        return self.undoStack[-1]
+
+    def apply(self, snapshot, document):
+        """
+        Put the document back into the state held by a snapshot. Sections that are the same in
+        the document and the snapshot are kept as they are, so only the ones that differ are new.
+        """
+        liveByFrozen = {id(frozen): s for s, frozen in self.liveSections.values()}
+        liveSections = {}
+        sectionList = []
+        for frozen in snapshot.sectionList:
+            s = liveByFrozen.get(id(frozen))
+            if s is None:
+                s = Section(blockList=list(frozen.blockList), name=frozen.name)
+            liveSections[id(s)] = (s, frozen)
+            sectionList.append(s)
+        self.liveSections = liveSections
+
+        document.title = snapshot.title
+        document.subtitle = snapshot.subtitle
+        document.composer = snapshot.composer
+        document.arranger = snapshot.arranger
+        document.timeSignature = snapshot.timeSignature
+        document.tempo = snapshot.tempo
+        document.chordList = list(snapshot.chordList)
+        document.sectionList = sectionList
+        return document
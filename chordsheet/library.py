@@ -0,0 +1,519 @@
+# -*- coding: utf-8 -*-
+"""
+A library of documents kept in an SQLite database, so that thousands of songs can be searched by
+their details, their text or the chords they use without opening a single file. Documents are
+stored in a compact JSON form that is much quicker to load than XML.
+"""
+
+import os
+import json
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from chordsheet.document import Document, Chord, Block, Section
+from chordsheet.parsers import parseName, parseChordSymbol
+from chordsheet.progressions import (documentProgressions, storedProgressions, progressionGrams,
+                                     parseProgression, queryGrams, findProgression)
+from chordsheet.chordpro import chordProExtensions, iterChordProFile
+from chordsheet.watcher import documentExtensions, hashFile
+
+# bump this whenever the tables change; older databases are rebuilt from scratch
+schemaVersion = 3
+
+metadataFields = ('title', 'subtitle', 'composer', 'arranger', 'timeSignature', 'tempo')
+
+schema = """
+CREATE TABLE IF NOT EXISTS songs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    song INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    title TEXT COLLATE NOCASE,
+    subtitle TEXT COLLATE NOCASE,
+    composer TEXT COLLATE NOCASE,
+    arranger TEXT COLLATE NOCASE,
+    timeSignature INTEGER,
+    tempo TEXT,
+    document TEXT NOT NULL,
+    UNIQUE (path, song)
+);
+CREATE INDEX IF NOT EXISTS songsTitle ON songs (title);
+CREATE INDEX IF NOT EXISTS songsSubtitle ON songs (subtitle);
+CREATE INDEX IF NOT EXISTS songsComposer ON songs (composer);
+CREATE INDEX IF NOT EXISTS songsArranger ON songs (arranger);
+CREATE INDEX IF NOT EXISTS songsTimeSignature ON songs (timeSignature);
+
+CREATE TABLE IF NOT EXISTS songChords (
+    name TEXT NOT NULL,
+    chordKey TEXT NOT NULL,
+    songId INTEGER NOT NULL REFERENCES songs (id) ON DELETE CASCADE,
+    PRIMARY KEY (name, songId)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS songChordsKey ON songChords (chordKey, songId);
+CREATE INDEX IF NOT EXISTS songChordsSong ON songChords (songId);
+
+CREATE TABLE IF NOT EXISTS songProgressions (
+    songId INTEGER PRIMARY KEY REFERENCES songs (id) ON DELETE CASCADE,
+    progressions TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS progressionGrams (
+    gram TEXT NOT NULL,
+    songId INTEGER NOT NULL REFERENCES songs (id) ON DELETE CASCADE,
+    PRIMARY KEY (gram, songId)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS progressionGramsSong ON progressionGrams (songId);
+"""
+
+# the text searched by Library.search, rowid being the song's id
+textSchema = "CREATE VIRTUAL TABLE IF NOT EXISTS songText USING fts5 (title, subtitle, composer, arranger, notes)"
+# the same without full-text search, for SQLite builds without FTS5
+plainTextSchema = "CREATE TABLE IF NOT EXISTS songText (title, subtitle, composer, arranger, notes)"
+
+
+def documentToJSON(document):
+    """
+    Return a document as JSON. Blocks refer to chords by their position in chordList.
+    """
+    chordIndex = {id(c): n for n, c in enumerate(document.chordList)}
+    return json.dumps({
+        'title': document.title, 'subtitle': document.subtitle, 'composer': document.composer,
+        'arranger': document.arranger, 'timeSignature': document.timeSignature, 'tempo': document.tempo,
+        'chords': [[c.name, c.voicings] for c in document.chordList],
+        'sections': [[s.name, [[b.length, chordIndex.get(id(b.chord)), b.notes] for b in s.blockList]]
+                     for s in document.sectionList],
+    }, ensure_ascii=False, separators=(',', ':'))
+
+
+def documentFromJSON(text):
+    """
+    Create a Document from JSON written by documentToJSON.
+    """
+    data = json.loads(text)
+    chordList = [Chord(name, **voicings) for name, voicings in data['chords']]
+    sectionList = [Section(blockList=[Block(length, chord=chordList[c] if c is not None else None, notes=notes)
+                                      for length, c, notes in blocks], name=name)
+                   for name, blocks in data['sections']]
+    return Document(chordList=chordList, sectionList=sectionList, title=data['title'],
+                    subtitle=data['subtitle'], composer=data['composer'], arranger=data['arranger'],
+                    timeSignature=data['timeSignature'], tempo=data['tempo'])
+
+
+def chordKey(name):
+    """
+    Return the key songs are found by for a chord name. Names that parse are keyed by what the
+    chord is, so that e.g. G♭m11 finds songs that spell it F♯m11, and the rest by their name.
+    """
+    symbol = parseChordSymbol(name)
+    if symbol.complete:
+        return repr(symbol.key())
+    return name
+
+
+def documentText(document):
+    """
+    Return the text in a document that isn't part of its details: section names and notes.
+    """
+    text = [s.name for s in document.sectionList if s.name]
+    text.extend(b.notes for s in document.sectionList for b in s.blockList if b.notes)
+    return "\n".join(text)
+
+
+def songContent(document):
+    """
+    Return everything the library stores about a document, as the arguments to Library.store
+    that follow the file's details.
+    """
+    return ([getattr(document, f) for f in metadataFields], documentToJSON(document),
+            [c.name for c in document.chordList], documentText(document),
+            storedProgressions(documentProgressions(document)))
+
+
+def loadSongs(path):
+    """
+    Return the documents in a file: every song of a ChordPro file, or the one document in any
+    other.
+    """
+    if os.path.splitext(path)[1].lower() not in chordProExtensions:
+        return [Document.newFromFile(path)]
+    documents = list(iterChordProFile(path))
+    if not documents:
+        raise ValueError("There are no songs in this ChordPro file.")
+    return documents
+
+
+def readSong(path, knownHash=None):
+    """
+    Load a file and return its details and the songContent of each song in it, or None for
+    the content if it hashes to knownHash and so hasn't changed. Run in the worker processes;
+    raises if the file can't be loaded.
+    """
+    stat = os.stat(path)
+    fileHash = hashFile(path)
+    if fileHash == knownHash:
+        return stat.st_mtime_ns, stat.st_size, fileHash, None
+    return stat.st_mtime_ns, stat.st_size, fileHash, [songContent(d) for d in loadSongs(path)]
+
+
+def tryReadSong(path, knownHash=None):
+    """
+    readSong, but returning the error message instead of raising.
+    """
+    try:
+        return readSong(path, knownHash), None
+    except Exception as e:
+        return None, "{f}: could not be loaded: {e}".format(f=path, e=e)
+
+
+def findDocuments(paths, extensions=documentExtensions):
+    """
+    Return the document files among paths, looking through any directories for ones with
+    one of extensions.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+                found.extend(os.path.join(root, f) for f in sorted(files)
+                             if f.lower().endswith(extensions) and not f.startswith('.'))
+        else:
+            found.append(path)
+    return found
+
+
+class ImportResult:
+    """
+    What Library.importFiles did: how many files were added, updated or already up to date,
+    and an error message for each one that couldn't be loaded.
+    """
+
+    def __init__(self):
+        self.added = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.errors = []
+
+    def __repr__(self):
+        return "ImportResult(added={a}, updated={u}, unchanged={n}, errors={e})".format(
+            a=self.added, u=self.updated, n=self.unchanged, e=len(self.errors))
+
+
+class LibraryEntry:
+    """
+    A song found in the library, and which song it is in its file (counting from 1, as a
+    ChordPro file can hold several). The details are there straight away; the document itself
+    is only put together when it is first asked for.
+    """
+
+    def __init__(self, songId, path, song, title, subtitle, composer, arranger, timeSignature, tempo, data):
+        self.id = songId
+        self.path = path
+        self.song = song
+        self.title = title
+        self.subtitle = subtitle
+        self.composer = composer
+        self.arranger = arranger
+        self.timeSignature = timeSignature
+        self.tempo = tempo
+        self.data = data
+        self._document = None
+
+    def __repr__(self):
+        return "LibraryEntry({p!r}, song={s}, title={t!r})".format(p=self.path, s=self.song, t=self.title)
+
+    @property
+    def document(self):
+        if self._document is None:
+            self._document = documentFromJSON(self.data)
+        return self._document
+
+
+class ProgressionMatch:
+    """
+    A place a progression was found: the song, and the section and block it starts at.
+    """
+
+    def __init__(self, entry, sectionIndex, block):
+        self.entry = entry
+        self.sectionIndex = sectionIndex
+        self.block = block
+
+    def __repr__(self):
+        return "ProgressionMatch({p!r}, section={s}, block={b})".format(
+            p=self.entry.path, s=self.sectionIndex, b=self.block)
+
+    @property
+    def section(self):
+        return self.entry.document.sectionList[self.sectionIndex]
+
+
+entryColumns = "songs.id, songs.path, songs.song, songs.title, songs.subtitle, songs.composer, songs.arranger, " \
+               "songs.timeSignature, songs.tempo, songs.document"
+
+
+class Library:
+    """
+    Documents imported into an SQLite database at path (':memory:' for one that isn't saved).
+    Files are only read again when they have changed, so the library can be brought up to
+    date with the files on disk by importing them all again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        if path != ':memory:':
+            self.connection.execute("PRAGMA journal_mode = WAL")
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != schemaVersion:
+            self.dropTables()
+        with self.connection:
+            self.connection.executescript(schema)
+            try:
+                self.connection.execute(textSchema)
+                self.fullText = True
+            except sqlite3.OperationalError:
+                self.connection.execute(plainTextSchema)
+                self.fullText = False
+            self.connection.execute("PRAGMA user_version = {v}".format(v=schemaVersion))
+
+    def dropTables(self):
+        with self.connection:
+            for table in ('songText', 'progressionGrams', 'songProgressions', 'songChords', 'songs'):
+                self.connection.execute("DROP TABLE IF EXISTS {t}".format(t=table))
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT count(*) FROM songs").fetchone()[0]
+
+    def paths(self):
+        return [row[0] for row in self.connection.execute("SELECT DISTINCT path FROM songs ORDER BY path")]
+
+    def store(self, path, song, mtime, size, fileHash, metadata, data, chordNames, text, progressions):
+        """
+        Add or replace a song of a path. Must be called inside a transaction.
+        """
+        self.connection.execute(
+            "INSERT INTO songs (path, song, mtime, size, hash, title, subtitle, composer, arranger, timeSignature, "
+            "tempo, document) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (path, song) DO UPDATE SET mtime = excluded.mtime, size = excluded.size, "
+            "hash = excluded.hash, title = excluded.title, subtitle = excluded.subtitle, "
+            "composer = excluded.composer, arranger = excluded.arranger, "
+            "timeSignature = excluded.timeSignature, tempo = excluded.tempo, document = excluded.document",
+            [path, song, mtime, size, fileHash] + list(metadata) + [data])
+        songId = self.connection.execute("SELECT id FROM songs WHERE path = ? AND song = ?",
+                                         (path, song)).fetchone()[0]
+        self.connection.execute("DELETE FROM songChords WHERE songId = ?", (songId,))
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO songChords (name, chordKey, songId) VALUES (?, ?, ?)",
+            [(name, chordKey(name), songId) for name in chordNames])
+        self.connection.execute("DELETE FROM songText WHERE rowid = ?", (songId,))
+        self.connection.execute(
+            "INSERT INTO songText (rowid, title, subtitle, composer, arranger, notes) VALUES (?, ?, ?, ?, ?, ?)",
+            [songId] + list(metadata[:4]) + [text])
+        self.connection.execute(
+            "INSERT OR REPLACE INTO songProgressions (songId, progressions) VALUES (?, ?)",
+            (songId, json.dumps(progressions, separators=(',', ':'))))
+        self.connection.execute("DELETE FROM progressionGrams WHERE songId = ?", (songId,))
+        self.connection.executemany(
+            "INSERT INTO progressionGrams (gram, songId) VALUES (?, ?)",
+            [(gram, songId) for gram in progressionGrams(progressions)])
+        return songId
+
+    def addDocument(self, document, path):
+        """
+        Store a document that is already loaded, under a path that needn't exist. It will be
+        replaced if a file at that path is imported later.
+        """
+        with self.connection:
+            songId = self.store(path, 1, 0, 0, '', *songContent(document))
+            self.removeSongs(path, 1)
+            return songId
+
+    def importFiles(self, paths, jobs=None):
+        """
+        Import document files, and any in directories among paths. Every song in a ChordPro
+        file is imported. Files that haven't changed since they were last imported are skipped
+        without being read: first by their size and modification time, then by a hash of their
+        content. Returns an ImportResult, which counts files rather than songs.
+        """
+        result = ImportResult()
+        known = {row[0]: row[1:] for row in self.connection.execute(
+            "SELECT path, mtime, size, hash FROM songs WHERE song = 1")}
+
+        toRead = []
+        for path in findDocuments(paths, documentExtensions + chordProExtensions):
+            path = os.path.abspath(path)
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                result.errors.append("{f}: could not be loaded: {e}".format(f=path, e=e.strerror))
+                continue
+            if path in known and known[path][:2] == (stat.st_mtime_ns, stat.st_size):
+                result.unchanged += 1
+            else:
+                toRead.append(path)
+
+        knownHashes = [known[p][2] if p in known else None for p in toRead]
+        workers = min(jobs or os.cpu_count() or 1, len(toRead))
+        if workers > 1:
+            # plenty of small jobs, so hand them out in batches
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                read = list(pool.map(tryReadSong, toRead, knownHashes,
+                                     chunksize=max(1, len(toRead) // (workers * 4))))
+        else:
+            read = list(map(tryReadSong, toRead, knownHashes))
+
+        with self.connection:
+            for path, (song, error) in zip(toRead, read):
+                if error is not None:
+                    result.errors.append(error)
+                    continue
+                mtime, size, fileHash, contents = song
+                if contents is None:
+                    # touched but not changed
+                    self.connection.execute("UPDATE songs SET mtime = ?, size = ? WHERE path = ?",
+                                            (mtime, size, path))
+                    result.unchanged += 1
+                    continue
+                for n, content in enumerate(contents):
+                    self.store(path, n + 1, mtime, size, fileHash, *content)
+                # the file may have fewer songs than it had
+                self.removeSongs(path, len(contents))
+                if path in known:
+                    result.updated += 1
+                else:
+                    result.added += 1
+        return result
+
+    def removeSongs(self, path, keep=0):
+        """
+        Remove the songs of a path after the first keep of them. Returns how many were removed.
+        Must be called inside a transaction.
+        """
+        rows = self.connection.execute("SELECT id FROM songs WHERE path = ? AND song > ?", (path, keep)).fetchall()
+        self.connection.executemany("DELETE FROM songText WHERE rowid = ?", rows)
+        self.connection.executemany("DELETE FROM songs WHERE id = ?", rows)
+        return len(rows)
+
+    def remove(self, path):
+        """
+        Take every song of a path out of the library. Returns whether there were any.
+        """
+        with self.connection:
+            return self.removeSongs(path) > 0
+
+    def prune(self):
+        """
+        Remove the songs whose files no longer exist. Returns how many were removed.
+        """
+        gone = [p for p in self.paths() if not os.path.exists(p)]
+        for path in gone:
+            self.remove(path)
+        return len(gone)
+
+    def entries(self, query, parameters=()):
+        return [LibraryEntry(*row) for row in self.connection.execute(query, parameters)]
+
+    def get(self, path, song=1):
+        """
+        Return the LibraryEntry for a song of a path, or None if it isn't in the library.
+        """
+        found = self.entries("SELECT {c} FROM songs WHERE path = ? AND song = ?".format(c=entryColumns),
+                             (path, song))
+        return found[0] if found else None
+
+    def find(self, **fields):
+        """
+        Return the songs whose details match all of those given, e.g. find(composer='Miles Davis',
+        timeSignature=3). Text is compared ignoring case. With nothing given, every song is
+        returned. Sorted by title.
+        """
+        for name in fields:
+            if name not in metadataFields:
+                raise ValueError("Can't search by {f}, only by {l}.".format(f=name, l=', '.join(metadataFields)))
+        where = " AND ".join("{f} = ?".format(f=name) for name in fields) or "1"
+        return self.entries("SELECT {c} FROM songs WHERE {w} ORDER BY title, path, song".format(
+                            c=entryColumns, w=where), list(fields.values()))
+
+    def search(self, text, limit=None):
+        """
+        Return the songs whose title, subtitle, composer, arranger, section names or notes
+        contain every word of text (or words starting with them), best matches first.
+        """
+        words = text.split()
+        if not words:
+            return []
+        limitClause = " LIMIT {n}".format(n=int(limit)) if limit is not None else ""
+        if self.fullText:
+            # quote every word, so nothing in it is taken for FTS query syntax
+            match = " ".join('"{w}"*'.format(w=w.replace('"', '""')) for w in words)
+            return self.entries(
+                "SELECT {c} FROM songText JOIN songs ON songs.id = songText.rowid "
+                "WHERE songText MATCH ? ORDER BY rank{l}".format(c=entryColumns, l=limitClause), (match,))
+        where = " AND ".join(["(coalesce(songText.title, '') || ' ' || coalesce(songText.subtitle, '') || ' ' || "
+                              "coalesce(songText.composer, '') || ' ' || coalesce(songText.arranger, '') || ' ' || "
+                              "songText.notes) LIKE ?"] * len(words))
+        return self.entries(
+            "SELECT {c} FROM songText JOIN songs ON songs.id = songText.rowid WHERE {w} "
+            "ORDER BY songs.title, songs.path, songs.song{l}".format(c=entryColumns, w=where, l=limitClause),
+            ['%{w}%'.format(w=w) for w in words])
+
+    def withChord(self, name, enharmonic=True):
+        """
+        Return the songs that use a chord, sorted by title. Unless enharmonic is False, other
+        spellings of the same chord count too (e.g. G♭m11 for F♯m11).
+        """
+        name = parseName(name)
+        if enharmonic:
+            condition, value = "songChords.chordKey = ?", chordKey(name)
+        else:
+            condition, value = "songChords.name = ?", name
+        return self.entries(
+            "SELECT {c} FROM songChords JOIN songs ON songs.id = songChords.songId WHERE {w} "
+            "GROUP BY songs.id ORDER BY songs.title, songs.path, songs.song".format(c=entryColumns, w=condition),
+            (value,))
+
+    def withProgression(self, query, anyKey=True, strict=False):
+        """
+        Return a ProgressionMatch for everywhere a progression appears, e.g. 'ii-V-I' or
+        'C G Am F' (see progressions.parseProgression). Unless anyKey is False it is found in
+        any key. Chords only need to be of the same family (major, minor or diminished) as in
+        the query unless strict is set. Sorted by title.
+
+        Only songs containing every n-gram of the query are looked at closely, which for most
+        queries is a small part of the library.
+        """
+        chords = parseProgression(query)
+        gramList = queryGrams(chords)
+        rows = self.connection.execute(
+            "SELECT {c}, songProgressions.progressions FROM songs "
+            "JOIN songProgressions ON songProgressions.songId = songs.id WHERE songs.id IN "
+            "(SELECT songId FROM progressionGrams WHERE gram IN ({g}) GROUP BY songId HAVING count(*) = ?) "
+            "ORDER BY songs.title, songs.path, songs.song".format(c=entryColumns, g=', '.join('?' * len(gramList))),
+            gramList + [len(gramList)])
+        matches = []
+        for row in rows:
+            found = findProgression(chords, json.loads(row[-1]), anyKey, strict)
+            if found:
+                entry = LibraryEntry(*row[:-1])
+                matches.extend(ProgressionMatch(entry, n, block) for n, block in found)
+        return matches
+
+    def chordNames(self):
+        """
+        Return every chord name used in the library, with the number of songs using it, most
+        used first.
+        """
+        return self.connection.execute(
+            "SELECT name, count(*) FROM songChords GROUP BY name ORDER BY count(*) DESC, name").fetchall()
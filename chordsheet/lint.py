@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+"""
+Checks documents for problems without rendering them. Unlike loading, which stops at the first
+thing it can't make sense of, every problem in a file is found and reported with its line, so a
+whole library can be checked in one go.
+"""
+
+import os
+import re
+import json
+from xml.etree import ElementTree as ET
+from xml.parsers import expat
+from concurrent.futures import ProcessPoolExecutor
+
+from chordsheet.parsers import parseFingering, parseName, parseChordSymbol, pitchClasses
+from chordsheet.document import defaultTimeSignature
+from chordsheet.watcher import documentExtensions
+
+error = 'error'  # loading the document would fail, or it wouldn't render as intended
+warning = 'warning'  # it will load, but probably isn't what was meant
+
+cmaCommands = ('chordsheet', 'title', 'subtitle', 'arranger', 'composer', 'timesig', 'tempo', 'chord',
+               'section', '!', 'rem')
+
+
+class Problem:
+    """
+    Something wrong with a document. line is None if the problem is with the file as a whole.
+    """
+
+    def __init__(self, path, line, severity, code, message):
+        self.path = path
+        self.line = line
+        self.severity = severity
+        self.code = code
+        self.message = message
+
+    def __repr__(self):
+        return "Problem({p!r}, {l}, {s!r}, {c!r})".format(p=self.path, l=self.line, s=self.severity, c=self.code)
+
+    def __str__(self):
+        location = self.path if self.line is None else "{p}:{l}".format(p=self.path, l=self.line)
+        return "{loc}: {s}: {m} [{c}]".format(loc=location, s=self.severity, m=self.message, c=self.code)
+
+    def toDict(self):
+        return {'path': self.path, 'line': self.line, 'severity': self.severity, 'code': self.code,
+                'message': self.message}
+
+
+class DocumentParts:
+    """
+    What was found in a file, with where it was found, for the checks shared by every format.
+    """
+
+    def __init__(self):
+        self.timeSignature = defaultTimeSignature
+        self.chords = []  # (name, line)
+        self.sections = []  # (name, line, [(length, chord name, line)])
+
+
+class Linter:
+    """
+    Collects the problems in one file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.problems = []
+
+    def report(self, line, severity, code, message):
+        self.problems.append(Problem(self.path, line, severity, code, message))
+
+    def checkVoicing(self, line, chordName, instrument, fingering):
+        try:
+            voicing = parseFingering(fingering, instrument)
+        except Exception as e:
+            self.report(line, error, 'bad-voicing', "{i} voicing of {c}: {e}".format(i=instrument, c=chordName, e=e))
+            return
+        if instrument == 'guitar':
+            bad = [f for f in voicing if not (f.isdigit() or f.lower() == 'x')]
+            if bad:
+                self.report(line, warning, 'bad-voicing', "guitar voicing of {c} has frets that aren't numbers or x: "
+                            "{f}".format(c=chordName, f=', '.join(bad)))
+        elif instrument == 'piano':
+            bad = [n for n in voicing if n not in pitchClasses]
+            if bad:
+                self.report(line, warning, 'bad-voicing', "piano voicing of {c} has notes that aren't notes: "
+                            "{n}".format(c=chordName, n=', '.join(bad)))
+        else:
+            self.report(line, warning, 'unknown-instrument', "{c} has a voicing for {i}, which can't be shown".format(
+                c=chordName, i=instrument))
+
+    def checkLength(self, line, text):
+        """
+        Return a block length as a number, or None after reporting it if it isn't one.
+        """
+        try:
+            length = float(text)
+        except (TypeError, ValueError):
+            self.report(line, error, 'bad-length', "block length {t!r} isn't a number".format(t=text))
+            return None
+        if not length > 0:
+            self.report(line, error, 'bad-length', "block length {l:g} isn't more than zero".format(l=length))
+            return None
+        return length
+
+    def checkParts(self, parts):
+        """
+        The checks that are the same whatever format the document was in.
+        """
+        if parts.timeSignature <= 0:
+            self.report(None, error, 'bad-time-signature', "time signature {t} isn't more than zero".format(
+                t=parts.timeSignature))
+            return
+
+        defined = {}
+        for name, line in parts.chords:
+            if name in defined:
+                self.report(line, warning, 'duplicate-chord', "{c} is already defined on line {l}; blocks "
+                            "will use that one".format(c=name, l=defined[name]))
+                continue
+            defined[name] = line
+            if not parseChordSymbol(name).complete:
+                self.report(line, warning, 'unknown-chord-name', "{c} isn't a chord name that can be "
+                            "understood, so it can't be transposed or searched for".format(c=name))
+
+        used = set()
+        for sectionName, sectionLine, blocks in parts.sections:
+            if not blocks:
+                self.report(sectionLine, warning, 'empty-section', "section {s} has no blocks".format(s=sectionName))
+            beats = 0
+            for length, chordName, line in blocks:
+                if length is not None:
+                    beats += length
+                if chordName is None:
+                    continue
+                if chordName not in defined:
+                    self.report(line, error, 'undefined-chord', "{c} does not match any chord".format(c=chordName))
+                used.add(chordName)
+            if beats % parts.timeSignature:
+                self.report(sectionLine, warning, 'incomplete-bar', "section {s} is {b:g} beats long, which isn't "
+                            "a whole number of bars of {t}".format(s=sectionName, b=beats, t=parts.timeSignature))
+
+        for name, line in defined.items():
+            if name not in used:
+                self.report(line, warning, 'unused-chord', "{c} isn't used by any block".format(c=name))
+
+    def lintXML(self, data):
+        parts = DocumentParts()
+        try:
+            root, lines = parseXMLWithLines(data)
+        except expat.ExpatError as e:
+            self.report(e.lineno, error, 'syntax', "not well-formed XML: {e}".format(e=expat.ErrorString(e.code)))
+            return
+        if root.tag != 'chordsheet':
+            self.report(lines[root], error, 'not-chordsheet', "the root element is <{t}>, not <chordsheet>".format(
+                t=root.tag))
+            return
+
+        element = root.find('timesignature')
+        if element is not None:
+            try:
+                parts.timeSignature = int(element.text)
+            except (TypeError, ValueError):
+                self.report(lines[element], error, 'bad-time-signature',
+                            "time signature {t!r} isn't a whole number".format(t=element.text))
+                return
+
+        for c in root.findall('chords/chord'):
+            nameElement = c.find('name')
+            if nameElement is None or not (nameElement.text or '').strip():
+                self.report(lines[c], error, 'missing-name', "chord has no name")
+                continue
+            name = parseName(nameElement.text)
+            parts.chords.append((name, lines[nameElement]))
+            for v in c.findall('voicing'):
+                if 'instrument' not in v.attrib:
+                    self.report(lines[v], error, 'bad-voicing', "voicing of {c} doesn't say which instrument it is "
+                                "for".format(c=name))
+                else:
+                    self.checkVoicing(lines[v], name, v.attrib['instrument'], v.text or '')
+
+        for n, s in enumerate(root.findall('section')):
+            blocks = []
+            for b in s.findall('block'):
+                lengthElement = b.find('length')
+                if lengthElement is None:
+                    self.report(lines[b], error, 'bad-length', "block has no length")
+                    length = None
+                else:
+                    length = self.checkLength(lines[lengthElement], lengthElement.text)
+                chordElement = b.find('chord')
+                chordName = parseName(chordElement.text) if chordElement is not None and chordElement.text else None
+                blocks.append((length, chordName, lines[chordElement if chordName else b]))
+            parts.sections.append((s.attrib.get('name', "Section {}".format(n + 1)), lines[s], blocks))
+
+        self.checkParts(parts)
+
+    def lintCSMacro(self, text):
+        parts = DocumentParts()
+        aliases = {}
+        # find where each statement starts, as loadCSMacroText splits the text at backslashes
+        starts = [m.start() for m in re.finditer(r'\\', text)]
+        for start, end in zip(starts, starts[1:] + [len(text)]):
+            line = text.count('\n', 0, start) + 1
+            statement = text[start + 1:end].strip()
+            cmd, args = (statement.split(" ", 1) + [''])[:2]
+            if cmd not in cmaCommands:
+                self.report(line, error, 'unknown-command', "command {c!r} not understood".format(c=cmd))
+            elif cmd == 'timesig':
+                try:
+                    parts.timeSignature = int(args)
+                except ValueError:
+                    self.report(line, error, 'bad-time-signature',
+                                "time signature {t!r} isn't a whole number".format(t=args))
+                    return
+            elif cmd == 'chord':
+                self.lintCSMacroChord(line, args, parts, aliases)
+            elif cmd == 'section':
+                self.lintCSMacroSection(text, start, line, args, parts, aliases)
+        self.checkParts(parts)
+
+    def lintCSMacroChord(self, line, args, parts, aliases):
+        argList = args.split(" ")
+        chordName = argList.pop(0)
+        if not chordName:
+            self.report(line, error, 'missing-name', "chord has no name")
+            return
+        parts.chords.append((parseName(chordName), line))
+        if len(argList) % 2:
+            self.report(line, warning, 'bad-chord', "{a!r} has nothing after it and is ignored".format(a=argList[-1]))
+        argIter = iter(argList)
+        for subCmd, arg in zip(argIter, argIter):
+            if subCmd == "alias":
+                aliases[arg] = chordName
+            else:
+                self.checkVoicing(line, parseName(chordName), subCmd, arg)
+
+    def lintCSMacroSection(self, text, start, line, args, parts, aliases):
+        if "\n" not in args:
+            self.report(line, error, 'bad-section', "section has no name, or no blocks on the lines after it")
+            parts.sections.append((args.strip(), line, []))
+            return
+        sectionName = args.split("\n", 1)[0].strip()
+        # where the blocks start in the whole text, to work out their lines
+        offset = text.index(args, start) + len(args.split("\n", 1)[0]) + 1
+        blocks = []
+        for match in re.finditer(r'\S+', args.split("\n", 1)[1]):
+            blockLine = text.count('\n', 0, offset + match.start()) + 1
+            blockParams = match.group().split(",")
+            if len(blockParams) < 2:
+                self.report(blockLine, error, 'bad-block', "block {b!r} isn't a chord and a length separated by a "
+                            "comma".format(b=match.group()))
+                continue
+            length = self.checkLength(blockLine, blockParams[1])
+            chordName = aliases.get(blockParams[0], blockParams[0])
+            chordName = parseName(chordName) if chordName not in ["NC", "X"] else None
+            blocks.append((length, chordName or None, blockLine))
+        parts.sections.append((sectionName, line, blocks))
+
+    def lintChordPro(self, lines):
+        from chordsheet.chordpro import directivePattern, directiveAliases, chordPattern
+
+        known = set(directiveAliases.values()) | {
+            'title', 'subtitle', 'composer', 'arranger', 'artist', 'tempo', 'time', 'key', 'album', 'year',
+            'lyricist', 'copyright', 'duration', 'capo', 'meta', 'new_song', 'comment', 'define'}
+        environment = None
+        environmentLine = None
+        for n, line in enumerate(lines, 1):
+            stripped = line.strip()
+            if stripped.startswith('{'):
+                match = directivePattern.match(stripped)
+                if match is None:
+                    self.report(n, error, 'syntax', "directive isn't closed with }")
+                    continue
+                name = directiveAliases.get(match.group(1).lower(), match.group(1).lower())
+                if name.startswith('start_of_'):
+                    if environment is not None:
+                        self.report(n, error, 'unclosed-environment', "{e} started on line {l} isn't ended before "
+                                    "this".format(e=environment, l=environmentLine))
+                    environment, environmentLine = name[len('start_of_'):], n
+                elif name.startswith('end_of_'):
+                    if environment != name[len('end_of_'):]:
+                        self.report(n, error, 'unclosed-environment', "{d} doesn't end anything that was "
+                                    "started".format(d=name))
+                    environment = None
+                elif name == 'define':
+                    words = match.group(2).split()
+                    if not ('frets' in words or 'keys' in words):
+                        self.report(n, warning, 'bad-voicing', "define has no frets or keys, so is ignored")
+                elif name == 'time' and not match.group(2).split('/')[0].strip().isdigit():
+                    self.report(n, error, 'bad-time-signature',
+                                "time signature {t!r} isn't understood".format(t=match.group(2)))
+                elif name not in known and not name.startswith('x_'):
+                    self.report(n, warning, 'unknown-directive', "directive {d!r} isn't understood and is "
+                                "ignored".format(d=match.group(1)))
+            elif not stripped.startswith('#') and environment != 'tab':
+                if stripped.count('[') != stripped.count(']'):
+                    self.report(n, error, 'syntax', "[ and ] don't match up")
+                for match in chordPattern.finditer(line):
+                    name = match.group(1).strip()
+                    if name and not name.startswith('*') and name.upper() not in ('N.C.', 'N.C', 'NC', 'X') and \
+                            not parseChordSymbol(parseName(name)).complete:
+                        self.report(n, warning, 'unknown-chord-name', "{c} isn't a chord name that can be "
+                                    "understood, so it can't be transposed or searched for".format(c=name))
+        if environment is not None:
+            self.report(environmentLine, error, 'unclosed-environment', "{e} is never ended".format(e=environment))
+
+
+def parseXMLWithLines(data):
+    """
+    Parse XML into an ElementTree, also returning the line each element starts on, which
+    ElementTree doesn't keep.
+    """
+    lines = {}
+    stack = []
+    root = None
+    parser = expat.ParserCreate()
+
+    def start(tag, attrib):
+        nonlocal root
+        element = ET.Element(tag, attrib) if not stack else ET.SubElement(stack[-1], tag, attrib)
+        lines[element] = parser.CurrentLineNumber
+        if root is None:
+            root = element
+        stack.append(element)
+
+    def end(tag):
+        stack.pop()
+
+    def text(data):
+        if stack:
+            element = stack[-1]
+            if len(element):
+                element[-1].tail = (element[-1].tail or '') + data
+            else:
+                element.text = (element.text or '') + data
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = text
+    parser.Parse(data, True)
+    return root, lines
+
+
+def lintFile(path):
+    """
+    Return every problem found in a file. Run in the worker processes, so it must not raise.
+    """
+    from chordsheet.chordpro import chordProExtensions
+
+    linter = Linter(path)
+    fileExt = os.path.splitext(path)[1].lower()
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        linter.report(None, error, 'unreadable', "could not be read: {e}".format(e=e.strerror))
+        return linter.problems
+    try:
+        if fileExt == '.cma':
+            linter.lintCSMacro(data.decode('utf-8'))
+        elif fileExt in chordProExtensions:
+            linter.lintChordPro(data.decode('utf-8-sig').splitlines())
+        else:
+            linter.lintXML(data)
+    except UnicodeDecodeError as e:
+        linter.report(None, error, 'syntax', "isn't UTF-8 text: {e}".format(e=e))
+    except Exception as e:  # a problem the checks don't know about yet
+        linter.report(None, error, 'internal', "could not be checked: {e}".format(e=e))
+    return linter.problems
+
+
+def lintFiles(paths, jobs=None):
+    """
+    Check document files, and any in directories among paths, in parallel. Returns the files
+    checked and every problem found in them.
+    """
+    from chordsheet.chordpro import chordProExtensions
+    from chordsheet.library import findDocuments
+
+    files = findDocuments(paths, documentExtensions + chordProExtensions)
+    workers = min(jobs or os.cpu_count() or 1, len(files))
+    if workers > 1:
+        # plenty of small jobs, so hand them out in batches
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lintFile, files, chunksize=max(1, len(files) // (workers * 4))))
+    else:
+        results = list(map(lintFile, files))
+    return files, [p for problems in results for p in problems]
+
+
+def reportJSON(files, problems):
+    """
+    Return a report of the problems found in some files as JSON.
+    """
+    return json.dumps({
+        'files': len(files),
+        'errors': sum(1 for p in problems if p.severity == error),
+        'warnings': sum(1 for p in problems if p.severity == warning),
+        'problems': [p.toDict() for p in problems],
+    }, indent=2, ensure_ascii=False)
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in memory profiling of the stages a document goes through: loading, laying out and writing
+the PDF, and rasterising and showing the preview. Uses tracemalloc, which slows everything
+down a lot, so nothing here is used unless asked for: set CHORDSHEET_MEMORY_PROFILE to a path
+and the GUI or the command line writes a JSON report there when it exits, or run
+benchmark_memory.py. Worker processes forked by the command line record their own stages,
+which are merged into the report.
+
+For each stage the report has how far memory rose above where it started (peak), how much of
+that was still allocated when it finished (retained) and where the retained memory was
+allocated. tracemalloc only sees memory allocated by Python, not by PyMuPDF or Qt, so on
+Linux the change in the resident set size of the process is recorded as well.
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import shutil
+import tempfile
+import threading
+import importlib
+import tracemalloc
+import multiprocessing.util
+from contextlib import contextmanager
+from functools import wraps
+
+# (module, class, method, stage) for everything that is profiled
+profiledMethods = [
+    ('chordsheet.document', 'Document', 'loadXML', 'load'),
+    ('chordsheet.document', 'Document', 'loadCSMacro', 'load'),
+    ('chordsheet.document', 'Document', 'loadChordPro', 'load'),
+    ('chordsheet.render', 'Renderer', 'savePDF', 'layout'),
+    ('chordsheet.songbook', 'Songbook', 'savePDF', 'layout'),
+    ('chordsheet.pdfViewer', 'PDFViewer', 'render', 'rasterize'),
+    ('chordsheet.pdfViewer', 'PDFViewer', 'show', 'show'),
+]
+
+stageOrder = ['load', 'layout', 'rasterize', 'show']
+
+# the environment variable that turns profiling on, set to where the report should be written
+environmentVariable = 'CHORDSHEET_MEMORY_PROFILE'
+
+megabyte = 1024*1024
+
+
+def residentBytes():
+    """
+    Return the resident set size of this process, or None where it can't be found cheaply.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class StageStats:
+    """
+    Everything recorded for one stage, over all the times it ran.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.peak = 0  # the most memory rose above where it started, in any one call
+        self.retained = 0  # memory still allocated at the end, summed over the calls
+        self.residentRetained = None
+        self.sites = {}  # site -> [bytes, blocks] retained
+
+    def toDict(self, topSites=None):
+        sites = sorted(self.sites.items(), key=lambda item: item[1][0], reverse=True)[:topSites]
+        return {'calls': self.calls, 'seconds': round(self.seconds, 6), 'peak': self.peak,
+                'retained': self.retained, 'residentRetained': self.residentRetained,
+                'sites': [{'site': site, 'size': size, 'count': count} for site, (size, count) in sites]}
+
+    def merge(self, stats):
+        """
+        Add in what another process recorded for the stage, as returned by toDict.
+        """
+        self.calls += stats['calls']
+        self.seconds += stats['seconds']
+        self.peak = max(self.peak, stats['peak'])
+        self.retained += stats['retained']
+        if stats['residentRetained'] is not None:
+            self.residentRetained = (self.residentRetained or 0) + stats['residentRetained']
+        for site in stats['sites']:
+            total = self.sites.setdefault(site['site'], [0, 0])
+            total[0] += site['size']
+            total[1] += site['count']
+
+
+class OpenStage:
+    """
+    A stage that is running, with what memory looked like when it started.
+    """
+
+    def __init__(self, name, snapshot):
+        self.name = name
+        self.snapshot = snapshot
+        self.start = tracemalloc.get_traced_memory()[0]
+        self.peak = self.start
+        self.resident = residentBytes()
+        self.clock = time.perf_counter()
+
+
+class MemoryProfiler:
+    """
+    Records memory use by stage. Stages can be timed with the stage() context manager, or
+    install() wraps the methods in profiledMethods so they're recorded wherever they're called
+    from. frames is how many frames of traceback are kept for each allocation: more says more
+    about where memory went, but costs more.
+    """
+
+    def __init__(self, frames=1, topSites=10):
+        self.frames = frames
+        self.topSites = topSites
+        self.stats = {}
+        self.open = []
+        self.installed = []
+        self.lock = threading.RLock()
+        self.startedTracing = False
+        self.workerDir = None  # where forked workers leave what they recorded
+        self.processes = 1
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self.startedTracing = True
+
+    def stop(self):
+        if self.startedTracing:
+            tracemalloc.stop()
+            self.startedTracing = False
+
+    def takeSnapshot(self):
+        return tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+
+    def enter(self, name):
+        with self.lock:
+            # a stage starting inside another resets the peak, so keep the outer one's first
+            peak = tracemalloc.get_traced_memory()[1]
+            for stage in self.open:
+                stage.peak = max(stage.peak, peak)
+            stage = OpenStage(name, self.takeSnapshot())
+            tracemalloc.reset_peak()
+            self.open.append(stage)
+            return stage
+
+    def exit(self, stage):
+        with self.lock:
+            current, peak = tracemalloc.get_traced_memory()
+            seconds = time.perf_counter() - stage.clock
+            self.open.remove(stage)
+            stage.peak = max(stage.peak, peak)
+            for outer in self.open:
+                outer.peak = max(outer.peak, stage.peak)
+
+            stats = self.stats.setdefault(stage.name, StageStats(stage.name))
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.peak = max(stats.peak, stage.peak - stage.start)
+            stats.retained += current - stage.start
+            resident = residentBytes()
+            if resident is not None and stage.resident is not None:
+                stats.residentRetained = (stats.residentRetained or 0) + resident - stage.resident
+
+            keyType = 'traceback' if self.frames > 1 else 'lineno'
+            for difference in self.takeSnapshot().compare_to(stage.snapshot, keyType):
+                if difference.size_diff <= 0:
+                    continue
+                site = ' <- '.join('{f}:{l}'.format(f=frame.filename, l=frame.lineno)
+                                   for frame in difference.traceback)
+                total = stats.sites.setdefault(site, [0, 0])
+                total[0] += difference.size_diff
+                total[1] += difference.count_diff
+            stage.snapshot = None
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Record memory use by the code inside the with block as the stage name.
+        """
+        stage = self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit(stage)
+
+    def wrap(self, function, name):
+        @wraps(function)
+        def profiled(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+        profiled.unprofiled = function
+        return profiled
+
+    def install(self, stages=None):
+        """
+        Wrap the methods in profiledMethods so every call is recorded, or only those for the
+        stages given. Modules that can't be imported (the preview without Qt) are skipped.
+        Returns the methods wrapped.
+        """
+        for moduleName, className, methodName, name in profiledMethods:
+            if stages is not None and name not in stages:
+                continue
+            try:
+                module = importlib.import_module(moduleName)
+            except ImportError:
+                continue
+            cls = getattr(module, className)
+            method = cls.__dict__[methodName]
+            setattr(cls, methodName, self.wrap(method, name))
+            self.installed.append((cls, methodName, method))
+        return ["{c}.{m}".format(c=cls.__name__, m=methodName) for cls, methodName, method in self.installed]
+
+    def uninstall(self):
+        for cls, methodName, method in reversed(self.installed):
+            setattr(cls, methodName, method)
+        self.installed = []
+
+    def followForks(self):
+        """
+        Have worker processes forked from this one (e.g. by ProcessPoolExecutor) record their
+        stages too, to be merged in by mergeWorkers. Tracing and the wrapped methods carry over
+        into a forked process, but what it records would be lost when it exits.
+        """
+        if self.workerDir is None:
+            self.workerDir = tempfile.mkdtemp(prefix='chordsheet-memory-')
+            multiprocessing.util.register_after_fork(self, MemoryProfiler.forked)
+
+    def forked(self):
+        # start afresh, so the parent's stages aren't counted twice
+        self.stats = {}
+        self.open = []
+        self.lock = threading.RLock()
+        # multiprocessing skips atexit in its processes, but runs its own finalizers
+        multiprocessing.util.Finalize(None, self.saveWorkerStats, exitpriority=10)
+
+    def saveWorkerStats(self):
+        if not self.stats:
+            return
+        path = os.path.join(self.workerDir, '{p}.json'.format(p=os.getpid()))
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({s: stats.toDict() for s, stats in self.stats.items()}, f)
+
+    def mergeWorkers(self):
+        """
+        Add in what forked processes recorded. Call once they have all exited.
+        """
+        if self.workerDir is None:
+            return
+        for name in os.listdir(self.workerDir):
+            with open(os.path.join(self.workerDir, name), encoding='utf-8') as f:
+                for s, stats in json.load(f).items():
+                    self.stats.setdefault(s, StageStats(s)).merge(stats)
+            self.processes += 1
+        shutil.rmtree(self.workerDir, ignore_errors=True)
+        self.workerDir = None
+
+    def report(self):
+        """
+        Return everything recorded as a dictionary that can be written as JSON. Sizes are in
+        bytes.
+        """
+        names = [s for s in stageOrder if s in self.stats] + sorted(s for s in self.stats if s not in stageOrder)
+        report = {'python': sys.version.split()[0], 'frames': self.frames, 'processes': self.processes,
+                  'stages': {s: self.stats[s].toDict(self.topSites) for s in names}}
+        if tracemalloc.is_tracing():
+            report['traced'], report['tracedPeak'] = tracemalloc.get_traced_memory()
+        report['resident'] = residentBytes()
+        return report
+
+    def saveReport(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+            f.write('\n')
+
+    def finish(self, path):
+        """
+        Merge in the workers and write the report to path.
+        """
+        self.mergeWorkers()
+        self.saveReport(path)
+
+    def overBudget(self, peakBudgets=None, retainedBudgets=None):
+        """
+        Return a message for each stage that used more than its budget, in bytes, of peak or
+        retained memory.
+        """
+        messages = []
+        for kind, budgets in [('peak', peakBudgets or {}), ('retained', retainedBudgets or {})]:
+            for name, budget in budgets.items():
+                stats = self.stats.get(name)
+                if stats is None:
+                    continue
+                used = getattr(stats, kind)
+                if used > budget:
+                    messages.append("{s}: {k} memory {u:.1f} MB is over the budget of {b:.1f} MB".format(
+                        s=name, k=kind, u=used / megabyte, b=budget / megabyte))
+        return messages
+
+
+def profileFromEnvironment(stages=None):
+    """
+    If CHORDSHEET_MEMORY_PROFILE is set, start profiling the stages given (or all of them), in
+    this process and any forked from it, and write the report to the path it is set to when
+    this process exits. Returns the profiler, or None.
+    """
+    path = os.environ.get(environmentVariable)
+    if not path:
+        return None
+    profiler = MemoryProfiler()
+    profiler.install(stages)
+    profiler.start()
+    profiler.followForks()
+    atexit.register(profiler.finish, os.path.abspath(path))
+    return profiler
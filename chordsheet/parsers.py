@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+from functools import lru_cache
+
 
 def parseFingering(fingering, instrument):
     """
@@ -31,4 +33,205 @@ def parseName(chordName):
     parsedName = chordName
     for i, j in nameReplacements.items():
         parsedName = parsedName.replace(i, j)
-    return parsedName
\ No newline at end of file
+    return parsedName
+
+
+sharp = nameReplacements['#']
+flat = nameReplacements['b']
+
+# note name -> pitch class (0 is C), for every name with up to two accidentals
+pitchClasses = {}
+for letter, pc in {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}.items():
+    for accidentals, shift in [('', 0), (sharp, 1), (flat, -1), (sharp*2, 2), (flat*2, -2)]:
+        pitchClasses[letter + accidentals] = (pc + shift) % 12
+
+# how each kind of chord can be written, longest first so e.g. 'maj' is tried before 'm'
+qualitySymbols = [
+    ('maj', 'maj'), ('Maj', 'maj'), ('ma', 'maj'), ('M', 'maj'), ('Δ', 'maj'),
+    ('min', 'min'), ('mi', 'min'), ('m', 'min'), ('-', 'min'),
+    ('dim', 'dim'), ('°', 'dim'), ('o', 'dim'),
+    ('ø', 'hdim'),
+    ('aug', 'aug'), ('+', 'aug'),
+]
+suspensions = [('sus2', 'sus2'), ('sus4', 'sus4'), ('sus', 'sus4')]
+additions = ['add', 'omit', 'no']
+extensionNumbers = ['13', '11', '9', '7', '6', '5', '4', '2']
+# a third can only be added or left out, e.g. Cno3, not used as an extension on its own
+additionNumbers = ['13', '11', '9', '7', '6', '5', '4', '3', '2']
+
+
+class ChordSymbol:
+    """
+    A chord name split into its parts, e.g. 'F♯m7♭5/C' has root 'F♯', quality 'min', extensions
+    ('7',), alterations ('♭5',) and bass 'C'. Anything after the root that couldn't be made sense
+    of is kept in `remainder`; if the name doesn't start with a note at all, root is None.
+    suffix is everything between the root and the bass exactly as it was written.
+
+    These are shared and must not be changed: use parseChordSymbol to get one.
+    """
+    __slots__ = ('name', 'root', 'suffix', 'quality', 'extensions', 'alterations', 'bass',
+                 'remainder')
+
+    def __init__(self, name, root=None, suffix='', quality=None, extensions=(), alterations=(),
+                 bass=None, remainder=''):
+        self.name = name
+        self.root = root
+        self.suffix = suffix
+        self.quality = quality
+        self.extensions = extensions
+        self.alterations = alterations
+        self.bass = bass
+        self.remainder = remainder
+
+    def __repr__(self):
+        return "ChordSymbol({n!r}, root={r!r}, quality={q!r}, extensions={e!r}, alterations={a!r}, bass={b!r})".format(
+            n=self.name, r=self.root, q=self.quality, e=self.extensions, a=self.alterations, b=self.bass)
+
+    @property
+    def rootPitch(self):
+        return pitchClasses.get(self.root)
+
+    @property
+    def bassPitch(self):
+        return pitchClasses.get(self.bass)
+
+    @property
+    def complete(self):
+        """
+        Whether the whole name was understood.
+        """
+        return self.root is not None and not self.remainder
+
+    def key(self):
+        """
+        Return a tuple that is the same for any two names of the same chord, however they are
+        spelt, e.g. 'B♭m7' and 'A♯-7'. Useful for comparing and searching.
+        """
+        return (self.rootPitch, self.quality, self.extensions, self.alterations, self.bassPitch,
+                self.remainder)
+
+
+def splitNote(text):
+    """
+    Split a note name off the front of some text. Returns (note, rest), with note None if the
+    text doesn't start with one.
+    """
+    if not text or text[0] not in 'ABCDEFG':
+        return None, text
+    end = 1
+    while end < len(text) and text[end] in (sharp, flat):
+        end += 1
+    if text[:end] not in pitchClasses:
+        return None, text
+    return text[:end], text[end:]
+
+
+def parseSuffix(suffix):
+    """
+    Parse what comes after the root of a chord name. Returns (quality, extensions, alterations,
+    remainder).
+    """
+    text = suffix.replace('(', '').replace(')', '').replace(',', '').replace(' ', '')
+    quality = 'maj'
+    extensions = []
+    alterations = []
+
+    for symbol, kind in qualitySymbols:
+        if text.startswith(symbol) and not (symbol == 'ma' and not text[2:3].isdigit()) and \
+                not (symbol == 'o' and text.startswith('omit')):
+            text = text[len(symbol):]
+            if kind == 'maj':
+                # Cmaj7, CΔ: a major seventh chord, where the plain major triad has no symbol
+                number = next((n for n in extensionNumbers if text.startswith(n)), None)
+                if number is not None:
+                    extensions.append('maj' + number)
+                    text = text[len(number):]
+                elif symbol == 'Δ':
+                    extensions.append('maj7')
+            else:
+                quality = kind
+            break
+
+    while text:
+        if quality == 'min' and text[:4] in ('maj7', 'Maj7') or quality == 'min' and text[:2] == 'M7':
+            # minor major seventh, e.g. Cm(maj7)
+            extensions.append('maj7')
+            text = text[4:] if text[:4] in ('maj7', 'Maj7') else text[2:]
+            continue
+        if text.startswith('6/9') or text.startswith('69'):
+            extensions.append('6/9')
+            text = text[3:] if text.startswith('6/9') else text[2:]
+            continue
+        number = next((n for n in extensionNumbers if text.startswith(n)), None)
+        if number is not None:
+            if number == '5' and quality == 'maj' and not extensions:
+                quality = 'power'
+            else:
+                extensions.append(number)
+            text = text[len(number):]
+            continue
+        suspension = next((s for s in suspensions if text.startswith(s[0])), None)
+        if suspension is not None:
+            quality = suspension[1]
+            text = text[len(suspension[0]):]
+            continue
+        addition = next((a for a in additions if text.startswith(a)), None)
+        if addition is not None:
+            rest = text[len(addition):]
+            number = next((n for n in additionNumbers if rest.startswith(n)), None)
+            if number is not None:
+                extensions.append(addition + number)
+                text = rest[len(number):]
+                continue
+        if text[0] in (sharp, flat, '+', '-') and len(text) > 1:
+            number = next((n for n in extensionNumbers if text[1:].startswith(n)), None)
+            if number is not None:
+                accidental = {'+': sharp, '-': flat}.get(text[0], text[0])
+                alterations.append(accidental + number)
+                text = text[1 + len(number):]
+                continue
+        if text.startswith('alt'):
+            alterations.append('alt')
+            text = text[3:]
+            continue
+        break
+
+    if quality == 'hdim' and '7' not in extensions:
+        # ø on its own means a half diminished seventh
+        extensions.insert(0, '7')
+    return quality, tuple(extensions), tuple(alterations), text
+
+
+@lru_cache(maxsize=4096)
+def parseChordSymbol(name):
+    """
+    Parse a chord name into a ChordSymbol. The most recent results are cached by name, and names
+    that only differ in using b/# rather than ♭/♯ share the same ChordSymbol, so asking again is
+    cheap.
+    """
+    normalised = parseName(name)
+    if normalised != name:
+        return parseChordSymbol(normalised)
+
+    root, rest = splitNote(name)
+    if root is None:
+        return ChordSymbol(name, remainder=name)
+
+    bass = None
+    slash = rest.rfind('/')
+    if slash != -1:
+        note, after = splitNote(rest[slash+1:])
+        if note is not None and not after:
+            bass = note
+            rest = rest[:slash]
+
+    quality, extensions, alterations, remainder = parseSuffix(rest)
+    return ChordSymbol(name, root, rest, quality, extensions, alterations, bass, remainder)
+
+
+def parseChordSymbols(names):
+    """
+    Parse many chord names at once, returning a list of ChordSymbols in the same order. Each
+    distinct name is only parsed once.
+    """
+    return [parseChordSymbol(name) for name in names]
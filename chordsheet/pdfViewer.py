@@ -2,7 +2,10 @@ from PyQt5.QtWidgets import QScrollArea, QLabel, QVBoxLayout, QWidget
 from PyQt5.QtCore import Qt
 from PyQt5.QtGui import QPixmap, QImage
 
-import fitz
+from chordsheet.renderCache import MemoryCache
+
+# memory kept for the pages of recently shown PDFs, so showing one again skips rasterising
+pageCacheBytes = 64*1024*1024
 
 class PDFViewer(QScrollArea):
     def __init__(self, parent):
@@ -15,14 +18,27 @@ class PDFViewer(QScrollArea):
 
         self.scrollAreaContents.setLayout(self.scrollAreaLayout)
         self.pixmapList = []
+        self.pageCache = MemoryCache(pageCacheBytes)
 
     def resizeEvent(self, event):
         pass
-        # do something about this later
-    
-    def update(self, pdf):
-        self.render(pdf)
+        # do something about this later
+
+    def update(self, pdf, key=None):
+        """
+        Show a PDF. If a key identifying its content is given (see renderCache.renderKey), pages
+        rasterised for the same key at the same size are reused.
+        """
         self.clear()
+        cacheKey = (key, self.width(), self.height()) if key else None
+        pixmapList = self.pageCache.get(cacheKey) if cacheKey else None
+        if pixmapList is not None:
+            self.pixmapList = pixmapList
+        else:
+            self.render(pdf)
+            if cacheKey:
+                self.pageCache.put(cacheKey, self.pixmapList, size=sum(
+                    p.width() * p.height() * p.depth() // 8 for p in self.pixmapList))
         self.show()
 
     def render(self, pdf):
@@ -30,27 +46,46 @@ class PDFViewer(QScrollArea):
         Update the preview shown by rendering a new PDF and drawing it to the scroll area.
         """
 
+        # imported here as PyMuPDF is slow to load and isn't needed until the first preview
+        import fitz
+
+        # drop the previous pages before rasterising the new ones
         self.pixmapList = []
         pdfView = fitz.Document(stream=pdf, filetype='pdf')
-        # render at 4x resolution and scale
+        # render at 4x resolution and scale, one page at a time so only one
+        # full size raster is ever alive
         for page in pdfView:
-            self.pixmapList.append(page.getPixmap(matrix=fitz.Matrix(4, 4), alpha=False))
-                    
+            p = page.get_pixmap(matrix=fitz.Matrix(4, 4), alpha=False)
+            self.pixmapList.append(self.scalePixmap(p))
+            del p
+        pdfView.close()
+
+    def scalePixmap(self, p):
+        """
+        Turn a fitz pixmap into a QPixmap at display size. The QImage wraps the fitz buffer
+        directly, so the only copy made is the scaled one that is kept.
+        """
+        samples = p.samples_mv if hasattr(p, 'samples_mv') else memoryview(p.samples)
+        qtimg = QImage(samples, p.width, p.height, p.stride, QImage.Format_RGB888)
+        # -45 because of various margins... value obtained by trial and error.
+        scaled = qtimg.scaled(self.width()-45, self.height()*2, Qt.KeepAspectRatio, transformMode=Qt.SmoothTransformation)
+        # drop the wrapper so nothing refers to the fitz buffer once the caller frees it
+        del qtimg, samples
+        return QPixmap.fromImage(scaled)
+
     def clear(self):
         while self.scrollAreaLayout.count():
             item = self.scrollAreaLayout.takeAt(0)
             w = item.widget()
             if w:
                 w.deleteLater()
-    
+
     def show(self):
-        for p in self.pixmapList:
+        for pixmap in self.pixmapList:
             label = QLabel(parent=self.scrollAreaContents)
             label.setAlignment(Qt.AlignHCenter)
-            qtimg = QImage(p.samples, p.width, p.height, p.stride, QImage.Format_RGB888)
-            # -45 because of various margins... value obtained by trial and error.
-            label.setPixmap(QPixmap.fromImage(qtimg).scaled(self.width()-45, self.height()*2, Qt.KeepAspectRatio, transformMode=Qt.SmoothTransformation))
+            label.setPixmap(pixmap)
             self.scrollAreaLayout.addWidget(label)
-        
+
         # necessary on Mojave with PyInstaller (or previous contents will be shown)
-        self.repaint()
\ No newline at end of file
+        self.repaint()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Chord progressions written key-independently, as the interval from each chord's root to the next
+and what kind of chord each one is, so that e.g. Dm7 G7 Cmaj7 and Em7 A7 Dmaj7 are both a ii-V-I.
+The library indexes every short stretch (n-gram) of every song's progressions, so a search only
+has to look closely at the few songs that contain all of the query's n-grams.
+
+A progression is stored as a string of two characters per chord: the interval up from the root
+of the chord before (in hex, 'x' for the first chord) and the chord's family. ii-V-I is 'xm7M5M'.
+Everything after the first character is the same in any key, so n-grams are slices of it and
+finding a progression in a song is a substring search.
+"""
+
+import re
+
+from chordsheet.parsers import parseChordSymbol, sharp, flat
+
+# the n-gram lengths indexed, in chords. Queries need at least the shortest
+gramSizes = (2, 3)
+
+# broad families of chord, so a query for V matches V7 or V9 too unless asked to be strict
+chordFamilies = {'maj': 'M', 'aug': 'M', 'power': 'M', 'sus2': 'M', 'sus4': 'M',
+                 'min': 'm', 'dim': 'o', 'hdim': 'o'}
+
+romanDegrees = {'I': 0, 'II': 2, 'III': 4, 'IV': 5, 'V': 7, 'VI': 9, 'VII': 11}
+romanPattern = re.compile('^([b#{f}{s}]?)(VII|VI|V|IV|III|II|I|vii|vi|v|iv|iii|ii|i)(.*)$'.format(f=flat, s=sharp))
+# suffixes that say what kind of chord a lower case numeral is, instead of it being minor
+romanQualities = ('°', 'ø', 'o', 'dim', '+', 'aug')
+cNames = ('C', 'C' + sharp, 'D', 'D' + sharp, 'E', 'F', 'F' + sharp, 'G', 'G' + sharp, 'A', 'A' + sharp, 'B')
+
+# splits a query into chords, e.g. "ii–V–I" or "Dm7 G7 Cmaj7". A hyphen is only a separator
+# where it isn't part of a chord name (Cm7-5), see splitQuery
+querySeparators = re.compile('[\\s,–—]+')
+
+
+class ProgressionChord:
+    """
+    One chord of a progression: the block it starts at, its root as a pitch class, its family
+    ('M', 'm' or 'o') and what exactly it is, apart from its root and bass.
+    """
+    __slots__ = ('block', 'pitch', 'family', 'detail')
+
+    def __init__(self, block, pitch, family, detail):
+        self.block = block
+        self.pitch = pitch
+        self.family = family
+        self.detail = detail
+
+    def __repr__(self):
+        return "ProgressionChord(block={b}, pitch={p}, family={f!r})".format(
+            b=self.block, p=self.pitch, f=self.family)
+
+
+def progressionChord(name, block=None):
+    """
+    Return a ProgressionChord for a chord name, or None if the name isn't a chord (e.g. N.C.).
+    """
+    symbol = parseChordSymbol(name)
+    if not symbol.complete:
+        return None
+    return ProgressionChord(block, symbol.rootPitch, chordFamilies[symbol.quality],
+                            repr((symbol.quality, symbol.extensions, symbol.alterations)))
+
+
+def documentProgressions(document):
+    """
+    Return the progressions in a document as (section index, [ProgressionChord]) lists. A chord
+    held over several blocks only counts once, and blocks without a chord (or with one that
+    isn't understood) end a progression.
+    """
+    progressions = []
+    for n, s in enumerate(document.sectionList):
+        chords = []
+        for b, block in enumerate(s.blockList):
+            chord = progressionChord(block.chord.name, b) if block.chord is not None else None
+            if chord is None:
+                if chords:
+                    progressions.append((n, chords))
+                chords = []
+            elif not chords or (chords[-1].pitch, chords[-1].detail) != (chord.pitch, chord.detail):
+                chords.append(chord)
+        if chords:
+            progressions.append((n, chords))
+    return progressions
+
+
+def progressionString(chords):
+    """
+    Return the string a progression is stored and searched as (see the top of this module).
+    """
+    text = ['x' + chords[0].family] if chords else []
+    text.extend('{i:x}{f}'.format(i=(c.pitch - p.pitch) % 12, f=c.family) for p, c in zip(chords, chords[1:]))
+    return ''.join(text)
+
+
+def storedProgressions(progressions):
+    """
+    Return progressions in the form the library stores them in, which can be written as JSON:
+    for each, [section index, string, blocks, root pitches, details].
+    """
+    return [[n, progressionString(chords), [c.block for c in chords], [c.pitch for c in chords],
+             [c.detail for c in chords]] for n, chords in progressions]
+
+
+def grams(text, size):
+    """
+    Return the n-grams of a progression string: every run of size chords, without the
+    interval to the first of them.
+    """
+    return [text[2*start + 1:2*(start + size)] for start in range(len(text)//2 - size + 1)]
+
+
+def progressionGrams(stored):
+    """
+    Return the set of every n-gram in some stored progressions, for all the indexed lengths.
+    """
+    return set(g for n, text, *rest in stored for size in gramSizes for g in grams(text, size))
+
+
+def queryGrams(chords):
+    """
+    Return the n-grams a song must have to contain a progression: all of the longest indexed
+    length that fits.
+    """
+    size = max(s for s in gramSizes if s <= len(chords))
+    return sorted(set(grams(progressionString(chords), size)))
+
+
+def romanToName(numeral):
+    """
+    Turn a Roman numeral chord into a chord name in C, e.g. 'ii7' into 'Dm7' and '♭VII' into
+    'A♯'. Returns None if it isn't a Roman numeral.
+    """
+    match = romanPattern.match(numeral)
+    if match is None:
+        return None
+    accidental, degree, suffix = match.groups()
+    pitch = romanDegrees[degree.upper()] + {'b': -1, flat: -1, '#': 1, sharp: 1}.get(accidental, 0)
+    minor = degree.islower() and not suffix.startswith(romanQualities)
+    return cNames[pitch % 12] + ('m' if minor else '') + suffix
+
+
+def splitQuery(query):
+    """
+    Split a query into the names of its chords. Hyphens separate them too ('ii-V-I'), unless
+    the hyphenated word is a chord name itself ('C-7', 'Cm7-5').
+    """
+    names = []
+    for word in querySeparators.split(query):
+        if '-' in word and progressionChord(romanToName(word) or word) is None:
+            names.extend(word.split('-'))
+        else:
+            names.append(word)
+    return [n for n in names if n]
+
+
+def parseProgression(query):
+    """
+    Turn a query into a list of ProgressionChords. It can be chord names ('Dm7 G7 Cmaj7'),
+    Roman numerals ('ii-V-I', 'iiø7 V7 i') or a list of either. Raises ValueError if any of
+    it isn't understood or it is too short to search for.
+    """
+    if isinstance(query, str):
+        query = splitQuery(query)
+    chords = []
+    for name in query:
+        chord = progressionChord(romanToName(name) or name)
+        if chord is None:
+            raise ValueError("{c} isn't a chord that can be searched for.".format(c=name))
+        # a chord held over several blocks is only stored once
+        if not chords or (chords[-1].pitch, chords[-1].detail) != (chord.pitch, chord.detail):
+            chords.append(chord)
+    if len(chords) < gramSizes[0]:
+        raise ValueError("A progression needs at least {n} chords.".format(n=gramSizes[0]))
+    return chords
+
+
+def findProgression(chords, stored, anyKey=True, strict=False):
+    """
+    Return (section index, block) for everywhere a progression appears in some stored ones.
+    Unless anyKey is set it must be in the same key, not just have the same shape; with strict
+    set every chord must be the same as in the query, not just of the same family.
+    """
+    needle = progressionString(chords)[1:]
+    details = [c.detail for c in chords]
+    found = []
+    for n, text, blocks, pitches, songDetails in stored:
+        position = text.find(needle, 1)
+        while position != -1:
+            # only a match if it lines up with the start of a chord
+            if position % 2 == 1:
+                start = position // 2
+                if (anyKey or pitches[start] == chords[0].pitch) and \
+                        (not strict or songDetails[start:start + len(chords)] == details):
+                    found.append((n, blocks[start]))
+            position = text.find(needle, position + 1)
+    return found
@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 
-from math import trunc, ceil
+from math import trunc
 from io import BytesIO
+from functools import lru_cache
 
+import reportlab
+from reportlab import rl_config
 from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfdoc
 from reportlab.lib.units import mm
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.colors import black, white
@@ -63,15 +67,61 @@ class Tempo(Flowable):
         canvas.drawString(0, self.leading * 0.25, self.text)
 
 
+@lru_cache(maxsize=1024)
+def paragraphSize(text, style, availWidth):
+    """
+    Return the height and plain text of a paragraph laid out at a width. Remembered, as
+    paginating measures the same headings over and over (e.g. for every beat width autofit
+    tries), and parsing a Paragraph's markup costs more than laying out the rest of the page.
+    """
+    # styles are compared by identity, which works as the stylesheets are shared and unchanging
+    paragraph = Paragraph(text, style)
+    width, height = paragraph.wrap(availWidth, 0x7fffffff)
+    return height, paragraph.getPlainText()
+
+
+class MeasuredParagraph(Flowable):
+    """
+    Stands in for a Paragraph when only the layout is needed, see Renderer.paginate. It takes
+    the same space as the Paragraph would, but can't be drawn.
+    """
+    kind = 'Paragraph'
+
+    def __init__(self, text, style):
+        self.text = text
+        self.style = style
+
+    def wrap(self, availWidth, availHeight):
+        self.width = availWidth
+        self.height, self.plainText = paragraphSize(self.text, self.style, availWidth)
+        return (self.width, self.height)
+
+    def split(self, availWidth, availHeight):
+        # rare enough (a heading taller than what is left of the page) to do properly
+        return Paragraph(self.text, self.style).split(availWidth, availHeight)
+
+    def getSpaceBefore(self):
+        return self.style.spaceBefore
+
+    def getSpaceAfter(self):
+        return self.style.spaceAfter
+
+    def getPlainText(self):
+        return self.plainText
+
+
 class GuitarChart(Flowable):
     """
     Flowable that draws a guitar chord voicing chart.
     """
 
-    def __init__(self, style, chordList):
+    def __init__(self, style, chordList, rows=None, rowsWidth=None):
         self.style = style
         self.guitarChordList = [
             c for c in chordList if 'guitar' in c.voicings.keys()]
+        # the chords split into rows, and the width they were split for
+        self.rows = rows
+        self.rowsWidth = rowsWidth
         self.chartMargin = 13*mm
         self.nStrings = 6
 
@@ -89,27 +139,41 @@ class GuitarChart(Flowable):
     def wrap(self, availWidth, availHeight):
         self.nChords = trunc((availWidth - self.chartMargin -
                               self.stringHzGap) / self.stringHzSp)
+        if self.rows is None or self.rowsWidth != availWidth:
+            self.rows = list(self.splitChordList(self.guitarChordList, self.nChords))
+            self.rowsWidth = availWidth
         # the height of one layer of chart
         self.oneHeight = self.stringHeight * (self.nStrings+1)
-        # only one line needed
-        if len(self.guitarChordList) <= self.nChords:
-            self.width = self.chartMargin + self.stringHzGap + self.stringHzSp * \
-                len(self.guitarChordList)  # calculate the width
-            self.height = self.oneHeight  # and its height
-        # multiple lines needed
-        else:
-            self.width = self.chartMargin + self.stringHzGap + \
-                self.stringHzSp * self.nChords
-            self.height = self.oneHeight * ceil(len(self.guitarChordList) / self.nChords) + \
-                (self.stringHeight *
-                 trunc(len(self.guitarChordList) / self.nChords))
+        self.width = self.chartMargin + self.stringHzGap + self.stringHzSp * \
+            max([len(row) for row in self.rows], default=0)
+        self.height = self.rowsHeight(len(self.rows))
         return (self.width, self.height)
 
+    def rowsHeight(self, nRows):
+        """
+        Return the height taken up by a number of rows of charts.
+        """
+        return self.oneHeight * nRows + self.stringHeight * max(nRows - 1, 0)
+
+    def split(self, availWidth, availHeight):
+        """
+        Split between rows, with as many rows as will fit in the first part.
+        """
+        self.wrap(availWidth, availHeight)
+        fits = trunc((availHeight + self.stringHeight) /
+                     (self.oneHeight + self.stringHeight))
+        if fits >= len(self.rows):
+            return [self]
+        if fits < 1:
+            return []
+        return [self.__class__(self.style, [c for row in rows for c in row], rows, availWidth)
+                for rows in (self.rows[:fits], self.rows[fits:])]
+
     def draw(self):
         canvas = self.canv
         chartmargin = self.chartMargin
 
-        for count, gcl in enumerate(self.splitChordList(self.guitarChordList, self.nChords)):
+        for count, gcl in enumerate(self.rows):
             v_origin = self.height - count * \
                 (self.oneHeight + self.stringHeight)
 
@@ -162,10 +226,13 @@ class PianoChart(Flowable):
     Flowable that draws a series of piano chord charts.
     """
 
-    def __init__(self, style, chordList):
+    def __init__(self, style, chordList, rows=None, rowsWidth=None):
         self.style = style
         self.pianoChordList = [
             c for c in chordList if 'piano' in c.voicings.keys()]
+        # the chords split into rows, and the width they were split for
+        self.rows = rows
+        self.rowsWidth = rowsWidth
 
         self.whiteKeyWidth = 2.5 * mm
         self.blackKeyWidth = 1.5 * mm
@@ -189,29 +256,36 @@ class PianoChart(Flowable):
 
     def wrap(self, availWidth, availHeight):
         self.availWidth = availWidth
-        vUnits = 1
-        currentWidth = self.chartMargin
-        widest = 0
-        for index, c in enumerate(self.pianoChordList):
-            cKL, vL, fKN, iconWidth = self.calculate(c)
-            if currentWidth + iconWidth >= availWidth:
-                vUnits += 1
-                currentWidth = self.chartMargin
-            else:
-                currentWidth += self.iconHzSpacing
-            currentWidth += iconWidth
-
-            if currentWidth > widest:
-                widest = currentWidth
-                if vUnits == 1:
-                    widest -= self.iconHzSpacing  #  chop off the trailing space
+        if self.rows is None or self.rowsWidth != availWidth:
+            self.rows = self.splitChordList(self.pianoChordList, availWidth)
+            self.rowsWidth = availWidth
         self.oneHeight = self.chordNameFontSize * self.lineSpacing + \
             self.whiteKeyHeight + self.indicatorFontSize * self.lineSpacing
 
-        self.width = widest
-        self.height = self.oneHeight * vUnits + self.vSpacing * (vUnits - 1)
+        self.width = max([width for row, width in self.rows], default=0)
+        self.height = self.rowsHeight(len(self.rows))
         return (self.width, self.height)
 
+    def rowsHeight(self, nRows):
+        """
+        Return the height taken up by a number of rows of charts.
+        """
+        return self.oneHeight * nRows + self.vSpacing * max(nRows - 1, 0)
+
+    def split(self, availWidth, availHeight):
+        """
+        Split between rows, with as many rows as will fit in the first part.
+        """
+        self.wrap(availWidth, availHeight)
+        fits = trunc((availHeight + self.vSpacing) /
+                     (self.oneHeight + self.vSpacing))
+        if fits >= len(self.rows):
+            return [self]
+        if fits < 1:
+            return []
+        return [self.__class__(self.style, [c for row, width in rows for c, chart in row], rows, availWidth)
+                for rows in (self.rows[:fits], self.rows[fits:])]
+
     def replaceFlats(self, fingering):
         # note name replacements
         noteReplacements = {"B♭": "A♯", "D♭": "C♯",
@@ -224,22 +298,28 @@ class PianoChart(Flowable):
         return parsedFingering
 
     def splitChordList(self, chordList, width):
+        """
+        Split the chords into rows that fit in the given width. Returns a list of
+        (row, row width) where each row is a list of (chord, what calculate returned for it).
+        """
         bigList = []
         currentList = []
         currentWidth = self.chartMargin
-        for c in self.pianoChordList:
-            cKL, vL, fKN, iconWidth = self.calculate(c)
+        for c in chordList:
+            chart = self.calculate(c)
+            iconWidth = chart[3]
 
-            if currentWidth + iconWidth >= width + self.iconHzSpacing:
-                bigList.append(currentList)
-                currentList = [c]
+            if currentList and currentWidth + self.iconHzSpacing + iconWidth >= width:
+                bigList.append((currentList, currentWidth))
+                currentList = []
                 currentWidth = self.chartMargin
-            else:
-                currentList.append(c)
+            if currentList:
                 currentWidth += self.iconHzSpacing
+            currentList.append((c, chart))
             currentWidth += iconWidth
 
-        bigList.append(currentList)
+        if currentList:
+            bigList.append((currentList, currentWidth))
         return bigList
 
     def calculate(self, c):
@@ -291,14 +371,12 @@ class PianoChart(Flowable):
     def draw(self):
         canvas = self.canv
 
-        for index, cL in enumerate(self.splitChordList(self.pianoChordList, self.width)):
+        for index, (cL, rowWidth) in enumerate(self.rows):
             h_offset = self.chartMargin
             v_offset = self.height - self.oneHeight * index - self.vSpacing * \
                 index - self.chordNameFontSize * self.lineSpacing
 
-            for c in cL:
-                chartKeyList, voicingList, firstKeyName, iconWidth = self.calculate(
-                    c)
+            for c, (chartKeyList, voicingList, firstKeyName, iconWidth) in cL:
                 # draw chord names
                 canvas.setFont(self.style.font, self.chordNameFontSize)
                 canvas.drawCentredString(h_offset + iconWidth/2, v_offset+(
@@ -365,6 +443,8 @@ class ChordProgression(Flowable):
 
         self.unitHeight = 20*mm
         self.beatsHeight = 5*mm
+        # which of the document's sections this is, see Renderer.paginate
+        self.sectionIndex = None
 
         self.spaceAfter = self.style.separatorSize
 
@@ -431,9 +511,11 @@ class ChordProgression(Flowable):
             firstPart, secondPart = self.splitBlockList(
                 self.blockList, vUnits * self.widthInBeats)
 
-            return [ChordProgression(self.style, self.heading, firstPart, self.timeSignature),
-                    PageBreak(),
-                    ChordProgression(self.style, self.heading, secondPart, self.timeSignature)]
+            parts = [ChordProgression(self.style, self.heading, firstPart, self.timeSignature),
+                     ChordProgression(self.style, self.heading, secondPart, self.timeSignature)]
+            for p in parts:
+                p.sectionIndex = self.sectionIndex
+            return [parts[0], PageBreak(), parts[1]]
 
     def draw(self):
         canvas = self.canv
@@ -491,69 +573,293 @@ def instChartCheck(cL, inst):
     return chordsPresent
 
 
+def pageFrame(style):
+    """
+    Return a Frame filling the page inside the margins.
+    """
+    return Frame(style.leftMargin*mm, style.bottomMargin*mm,
+                 style.pageSize[0] - style.leftMargin*mm - style.rightMargin*mm,
+                 style.pageSize[1] - style.topMargin*mm - style.bottomMargin*mm,
+                 leftPadding=0, bottomPadding=0, rightPadding=0, topPadding=0)
+
+
+def availableWidth(style):
+    """
+    Return the width flowables have to fit in on the page, in points.
+    """
+    frame = pageFrame(style)
+    return frame.width - frame.leftPadding - frame.rightPadding
+
+
+def chartFlowables(style, styles, chordList, paragraph=Paragraph):
+    """
+    Return the headings and charts for the guitar and piano voicings in a list of chords.
+    """
+    rlDocList = []
+
+    if instChartCheck(chordList, 'guitar'):
+        rlDocList.extend([
+            paragraph('Guitar chord voicings', styles['Heading']),
+            GuitarChart(style, chordList)])
+
+    if instChartCheck(chordList, 'piano'):
+        rlDocList.extend([
+            paragraph('Piano chord voicings', styles['Heading']),
+            PianoChart(style, chordList)])
+
+    return rlDocList
+
+
+class Placement:
+    """
+    Where a flowable landed: its page (counting from 1), and the position of its bottom left
+    corner and its size on that page, in points.
+    """
+    __slots__ = ('kind', 'text', 'sectionIndex', 'page', 'x', 'y', 'width', 'height')
+
+    def __init__(self, flowable, page, x, y):
+        self.kind = getattr(flowable, 'kind', flowable.__class__.__name__)
+        if hasattr(flowable, 'getPlainText'):
+            self.text = flowable.getPlainText()
+        else:
+            self.text = getattr(flowable, 'heading', None)
+        self.sectionIndex = getattr(flowable, 'sectionIndex', None)
+        self.page = page
+        self.x = x
+        self.y = y
+        self.width = getattr(flowable, 'width', 0)
+        self.height = getattr(flowable, 'height', 0)
+
+    def __repr__(self):
+        return "Placement({k}, {t!r}, page={p}, x={x:.1f}, y={y:.1f}, width={w:.1f}, height={h:.1f})".format(
+            k=self.kind, t=self.text, p=self.page, x=self.x, y=self.y, w=self.width, h=self.height)
+
+
+class Pagination:
+    """
+    The result of Renderer.paginate: the number of pages, and a Placement for every flowable in
+    the order they were laid out. A section split across pages has a placement for each part.
+    """
+
+    def __init__(self, pages, placements):
+        self.pages = pages
+        self.placements = placements
+
+    def sectionPages(self):
+        """
+        Return (first page, last page) for each section of the document, by section index.
+        """
+        spans = {}
+        for p in self.placements:
+            if p.sectionIndex is not None:
+                first, last = spans.get(p.sectionIndex, (p.page, p.page))
+                spans[p.sectionIndex] = (min(first, p.page), max(last, p.page))
+        return spans
+
+
+class LayoutFrame(Frame):
+    """
+    Frame that records where each flowable would go instead of drawing it. ReportLab's own
+    fitting, splitting and keepWithNext logic is used, so the result matches a real render.
+    """
+
+    def __init__(self, placements, style):
+        frame = pageFrame(style)
+        super().__init__(frame._x1, frame._y1, frame._width, frame._height,
+                         leftPadding=0, bottomPadding=0, rightPadding=0, topPadding=0)
+        self.placements = placements
+
+    def __deepcopy__(self, memo):
+        # KeepTogether measures its contents on a deep copy of the frame. Everything in it is
+        # plain numbers apart from the placements, which the copy should share, so a shallow
+        # copy will do and is a lot cheaper
+        frame = self.__class__.__new__(self.__class__)
+        frame.__dict__.update(self.__dict__)
+        memo[id(self)] = frame
+        return frame
+
+    def add(self, flowable, canv, trySplit=0):
+        def record(canvas, x, y, _sW=0):
+            self.placements.append(Placement(flowable, canvas.getPageNumber(), x, y))
+
+        # Frame.add calls drawOn once the flowable has been placed, so intercept it
+        flowable.drawOn = record
+        try:
+            return super().add(flowable, canv, trySplit)
+        finally:
+            del flowable.drawOn
+
+
+class LayoutCanvas(canvas.Canvas):
+    """
+    Canvas that keeps count of the pages but throws away what would have been drawn on them.
+    """
+
+    def showPage(self):
+        self._startPage()
+
+    def save(self):
+        pass
+
+
+# CompressingCanvas reaches into ReportLab's PDFPage, so it only does so with the releases that
+# tests/test_render.py has shown give the same PDF as a plain Canvas
+compressingReportLabVersions = ('5.0',)
+compressPagesEarly = '.'.join(reportlab.Version.split('.')[:2]) in compressingReportLabVersions
+
+
+class CompressingCanvas(canvas.Canvas):
+    """
+    Canvas that compresses each page as soon as it is finished. ReportLab otherwise holds on to
+    every page uncompressed until the whole PDF is written out. The PDF is byte for byte the
+    same either way. With a release of ReportLab it hasn't been checked against, it leaves the
+    pages to be compressed as usual.
+    """
+
+    def showPage(self):
+        super().showPage()
+        if not compressPagesEarly:
+            return
+        page = self._doc.Pages.pages[-1]
+        if page.compression and page.stream and not page.Contents:
+            filters = [pdfdoc.PDFBase85Encode, pdfdoc.PDFZCompress] if rl_config.useA85 else [pdfdoc.PDFZCompress]
+            content = page.stream
+            for f in reversed(filters):
+                content = f.encode(content)
+            # the Filter entry tells PDFStream the filters have already been applied
+            contents = pdfdoc.PDFStream(content=content)
+            contents.dictionary['Filter'] = pdfdoc.PDFArray([pdfdoc.PDFName(f.pdfname) for f in filters])
+            contents.__Comment__ = "page stream"
+            page.Contents = contents
+            page.stream = None
+
+
+class StreamingDocTemplate(BaseDocTemplate):
+    """
+    Doc template that takes its flowables from an iterator as the build goes, rather than
+    needing them all in a list up front. Only a few are held that haven't been laid out yet,
+    and each one is let go of once it has been drawn, so memory use doesn't grow with the
+    length of the document.
+    """
+    # enough to see a run of keepWithNext flowables through to the one they're kept with
+    lookahead = 16
+
+    def build(self, flowables, filename=None, canvasmaker=canvas.Canvas):
+        self.source = iter(flowables)
+        self.queue = []
+        self.fillQueue()
+        super().build(self.queue, filename, canvasmaker)
+
+    def fillQueue(self):
+        while self.source is not None and len(self.queue) < self.lookahead:
+            f = next(self.source, None)
+            if f is None:
+                self.source = None
+            else:
+                self.queue.append(f)
+
+    def handle_flowable(self, flowables):
+        # build stops when the queue is empty, so top it up before and after each one. This
+        # is also used for flowables left hanging at the end of a page, which aren't queued
+        queued = flowables is self.queue
+        if queued:
+            self.fillQueue()
+        super().handle_flowable(flowables)
+        if queued:
+            self.fillQueue()
+
+
 class Renderer:
-    def __init__(self, document, style):
+    def __init__(self, document, style, invariant=False):
         self.document = document
-        self.style = style
-
-    def savePDF(self, pathToPDF):
-        template = PageTemplate(id='AllPages', frames=[Frame(self.style.leftMargin*mm, self.style.bottomMargin*mm,
-                                                             self.style.pageSize[0] - self.style.leftMargin *
-                                                             mm - self.style.rightMargin*mm,
-                                                             self.style.pageSize[1] - self.style.topMargin *
-                                                             mm - self.style.bottomMargin*mm,
-                                                             leftPadding=0, bottomPadding=0, rightPadding=0, topPadding=0)])
+        # a snapshot, so the render isn't affected by the style being edited meanwhile
+        self.style = style.snapshot()
+        # with invariant set, the same document and style always give exactly the same bytes:
+        # ReportLab uses a fixed creation date and derives the document ID from the content
+        self.invariant = invariant
 
-        rlDocList = []
-        rlDoc = BaseDocTemplate(
-            pathToPDF, pagesize=self.style.pageSize, pageTemplates=[template])
+    def flowables(self, styles=None, charts=True):
+        """
+        Return the list of flowables that make up the document. Leave out the chord charts if
+        charts is False, e.g. when they are drawn somewhere else.
+        """
+        return list(self.iterFlowables(styles, charts))
 
-        styles = getStyleSheet(self.style)
+    def iterFlowables(self, styles=None, charts=True, paragraph=Paragraph):
+        """
+        Generate the flowables that make up the document one at a time, each section's only
+        when it is asked for. The document's sectionList can be any iterable, e.g. one that
+        reads the sections from a file as it goes. paragraph is the class text is made into.
+        """
+        if styles is None:
+            styles = getStyleSheet(self.style)
 
         if self.document.title:
-            rlDocList.append(Paragraph(self.document.title, styles['Title']))
+            yield paragraph(self.document.title, styles['Title'])
 
         if self.document.subtitle:
-            rlDocList.append(
-                Paragraph(self.document.subtitle, styles['Subtitle']))
+            yield paragraph(self.document.subtitle, styles['Subtitle'])
 
         if self.document.composer or self.document.arranger:
-            rlDocList.append(Spacer(0, 2*mm))
+            yield Spacer(0, 2*mm)
 
         if self.document.composer:
-            rlDocList.append(Paragraph("Composer: {c}".format(
-                c=self.document.composer), styles['Credits']))
+            yield paragraph("Composer: {c}".format(
+                c=self.document.composer), styles['Credits'])
 
         if self.document.arranger:
-            rlDocList.append(Paragraph("Arranger: {a}".format(
-                a=self.document.arranger), styles['Credits']))
+            yield paragraph("Arranger: {a}".format(
+                a=self.document.arranger), styles['Credits'])
 
         if self.document.tempo:
-            rlDocList.append(Tempo(self.document.tempo, styles['Tempo']))
+            yield Tempo(self.document.tempo, styles['Tempo'])
 
         if self.document.title or self.document.subtitle or self.document.composer or self.document.arranger or self.document.tempo:
-            rlDocList.append(Spacer(0, self.style.separatorSize))
+            yield Spacer(0, self.style.separatorSize)
 
-        if instChartCheck(self.document.chordList, 'guitar'):
-            rlDocList.extend([
-                Paragraph('Guitar chord voicings', styles['Heading']),
-                GuitarChart(self.style, self.document.chordList)])
+        if charts:
+            yield from chartFlowables(self.style, styles, self.document.chordList, paragraph)
 
-        if instChartCheck(self.document.chordList, 'piano'):
-            rlDocList.extend([
-                Paragraph('Piano chord voicings', styles['Heading']),
-                PianoChart(self.style, self.document.chordList)])
-
-        for s in self.document.sectionList:
-            rlDocList.append(Paragraph(s.name, styles['Heading']))
+        for n, s in enumerate(self.document.sectionList):
+            heading = paragraph(s.name, styles['Heading'])
+            heading.sectionIndex = n
+            yield heading
             # only draw the chord progression if there are blocks
             if s.blockList:
-                rlDocList.append(ChordProgression(
-                    self.style, s.name, s.blockList, self.document.timeSignature))
+                progression = ChordProgression(
+                    self.style, s.name, s.blockList, self.document.timeSignature)
+                progression.sectionIndex = n
+                yield progression
 
-        rlDoc.build(rlDocList)
+    def savePDF(self, pathToPDF):
+        """
+        Render the document to a file (or file-like object). Returns the number of pages.
+        """
+        template = PageTemplate(id='AllPages', frames=[pageFrame(self.style)])
+
+        # None rather than False, so reportlab.rl_config.invariant still applies
+        rlDoc = StreamingDocTemplate(
+            pathToPDF, pagesize=self.style.pageSize, pageTemplates=[template], invariant=self.invariant or None)
+
+        rlDoc.build(self.iterFlowables(), canvasmaker=CompressingCanvas)
+        return rlDoc.page
+
+    def paginate(self):
+        """
+        Work out how the document will be laid out on the page, without drawing anything or
+        writing a PDF, for when only the page count or where things land is needed. Text is
+        measured with MeasuredParagraph, so text seen before isn't parsed again: the first
+        pagination of a document is around ten times quicker than a render, and later ones, as
+        when fitStyle tries several widths, fifteen to thirty times.
+        """
+        placements = []
+        template = PageTemplate(id='AllPages', frames=[LayoutFrame(placements, self.style)])
+        rlDoc = StreamingDocTemplate(BytesIO(), pagesize=self.style.pageSize, pageTemplates=[template])
+        rlDoc.build(self.iterFlowables(paragraph=MeasuredParagraph), canvasmaker=LayoutCanvas)
+        return Pagination(rlDoc.page, placements)
 
     def stream(self):
         virtualFile = BytesIO()
         self.savePDF(virtualFile)
+        virtualFile.seek(0)
         return virtualFile
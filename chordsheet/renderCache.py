@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of rendered PDFs, keyed by fingerprints of the document, the style and the renderer, so
+that rendering something that has been rendered before doesn't touch ReportLab at all.
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import reportlab
+
+# bump this whenever a change to render.py changes what ends up in the PDF
+rendererVersion = 2
+
+
+def documentFingerprint(document):
+    """
+    Return a string that is the same for any two documents that render the same.
+    """
+    chordIndex = {id(c): n for n, c in enumerate(document.chordList)}
+    return repr((
+        document.title, document.subtitle, document.composer, document.arranger,
+        document.timeSignature, document.tempo,
+        [(c.name, sorted((inst, list(f)) for inst, f in c.voicings.items())) for c in document.chordList],
+        [(s.name, [(b.length, chordIndex.get(id(b.chord), b.chord.name if b.chord else None), b.notes)
+                   for b in s.blockList]) for s in document.sectionList]))
+
+
+def styleFingerprint(style):
+    """
+    Return a string that is the same for any two styles with the same settings.
+    """
+    return repr(style.snapshot().items())
+
+
+def renderKey(document, style):
+    """
+    Return the cache key for rendering a document with a style.
+    """
+    fingerprint = "\n".join([str(rendererVersion), reportlab.Version,
+                             documentFingerprint(document), styleFingerprint(style)])
+    return hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()
+
+
+class MemoryCache:
+    """
+    Least recently used cache limited by the total size of what it holds. The size of each
+    value is len(value) unless given.
+    """
+
+    def __init__(self, maxBytes):
+        self.maxBytes = maxBytes
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        size = len(value) if size is None else size
+        if size > self.maxBytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.maxBytes:
+                self.size -= self.entries.popitem(last=False)[1][1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+class DiskCache:
+    """
+    Content addressed store of files on disk, limited by their total size. Files that haven't
+    been used for the longest are deleted first.
+    """
+
+    def __init__(self, directory, maxBytes, suffix='.pdf'):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.suffix = suffix
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(os.path.getsize(p) for p, mtime in self.files())
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def files(self):
+        """
+        Return (path, last used) for every file in the store.
+        """
+        found = []
+        for root, dirs, files in os.walk(self.directory):
+            for f in files:
+                if f.endswith(self.suffix):
+                    path = os.path.join(root, f)
+                    try:
+                        found.append((path, os.path.getmtime(path)))
+                    except OSError:
+                        pass
+        return found
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path)  # mark it as recently used
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        if len(data) > self.maxBytes:
+            return
+        path = self.path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so a half written file is never picked up
+        tmpPath = "{p}.{pid}.{t}.tmp".format(p=path, pid=os.getpid(), t=threading.get_ident())
+        with open(tmpPath, 'wb') as f:
+            f.write(data)
+        os.replace(tmpPath, path)
+        with self.lock:
+            self.size += len(data)
+            if self.size > self.maxBytes:
+                self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used files until the store is back under its limit. Other
+        processes may share the store, so the real size is counted again first.
+        """
+        files = sorted(self.files(), key=lambda f: f[1])
+        sizes = []
+        for path, mtime in files:
+            try:
+                sizes.append(os.path.getsize(path))
+            except OSError:
+                sizes.append(0)
+        self.size = sum(sizes)
+        for (path, mtime), size in zip(files, sizes):
+            if self.size <= self.maxBytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+    def clear(self):
+        with self.lock:
+            for path, mtime in self.files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.size = 0
+
+
+class RenderCache:
+    """
+    Rendered PDFs, kept in memory for the most recent ones and optionally on disk for the rest.
+    """
+
+    def __init__(self, memoryBytes=32*1024*1024, directory=None, diskBytes=256*1024*1024):
+        self.memory = MemoryCache(memoryBytes)
+        self.disk = DiskCache(directory, diskBytes) if directory else None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        data = self.memory.get(key)
+        if data is None and self.disk is not None:
+            data = self.disk.get(key)
+            if data is not None:
+                self.memory.put(key, data)
+        return data
+
+    def put(self, key, data):
+        self.memory.put(key, data)
+        if self.disk is not None:
+            try:
+                self.disk.put(key, data)
+            except OSError:  # a full or read-only disk only costs us the cache
+                pass
+
+    def render(self, document, style):
+        """
+        Return the PDF for a document as bytes, and its key. ReportLab is only loaded and run if
+        the PDF isn't in the cache.
+        """
+        style = style.snapshot()
+        key = renderKey(document, style)
+        data = self.get(key)
+        if data is not None:
+            self.hits += 1
+            return data, key
+
+        from chordsheet.fonts import registerFonts
+        from chordsheet.render import Renderer
+
+        self.misses += 1
+        registerFonts()
+        data = Renderer(document, style).stream().getvalue()
+        self.put(key, data)
+        return data, key
@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
 
+from functools import lru_cache
+
 from reportlab.lib.styles import StyleSheet1, ParagraphStyle
 from reportlab.lib.enums import *
 from reportlab.lib.units import mm
 from reportlab.lib.colors import black
 
 def getStyleSheet(csStyle):
-    """Returns a stylesheet object"""
+    """Returns a stylesheet object, shared by every render with the same style settings"""
+    return buildStyleSheet(csStyle.snapshot())
+
+
+@lru_cache(maxsize=16)
+def buildStyleSheet(csStyle):
+    """Builds the stylesheet for a FrozenStyle. Don't change what it returns, as it is shared."""
     stylesheet = StyleSheet1()
 
     stylesheet.add(ParagraphStyle(name='Master',
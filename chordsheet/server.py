@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP render service. Documents are POSTed as XML or macro text and rendered to PDF or PNG
+by a pool of worker processes that are started, and warmed up, before the first request.
+
+    POST /render?type=xml|cma|chordpro&format=pdf|png[&page=N][&dpi=N]   body: the document
+    GET  /metrics   counters in the Prometheus text format
+    GET  /health
+
+It is meant for tools on the same machine, so it only ever listens on the loopback interface
+or a Unix socket.
+"""
+
+import os
+import stat
+import time
+import hashlib
+import threading
+import socketserver
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from chordsheet.renderCache import MemoryCache
+
+contentTypes = {'pdf': 'application/pdf', 'png': 'image/png'}
+documentTypes = ('xml', 'cma', 'chordpro')
+maxRequestSize = 4*1024*1024
+
+
+class DocumentError(Exception):
+    """
+    The document sent could not be understood.
+    """
+    pass
+
+
+class BusyError(Exception):
+    """
+    Too many requests are already waiting to be rendered.
+    """
+    pass
+
+
+def warmWorker(n):
+    """
+    Load everything a render needs, so the first real request doesn't pay for it.
+    """
+    from chordsheet.cli import initWorker
+    initWorker()
+    return os.getpid()
+
+
+def renderText(data, documentType, outputFormat, style, page=1, dpi=150):
+    """
+    Render a document sent as bytes to PDF or PNG bytes. Run in the worker processes.
+    """
+    from chordsheet.document import Document
+    from chordsheet.render import Renderer
+
+    doc = Document()
+    try:
+        if documentType == 'cma':
+            doc.loadCSMacroText(data.decode('utf-8'))
+        elif documentType == 'chordpro':
+            doc.loadChordProText(data.decode('utf-8-sig'))
+        else:
+            doc.loadXML(BytesIO(data))
+    except Exception as e:
+        raise DocumentError("could not load the document: {e}".format(e=e))
+
+    # invariant, so identical requests get identical bytes whether or not they were cached
+    pdf = Renderer(doc, style, invariant=True).stream().getvalue()
+    if outputFormat == 'pdf':
+        return pdf
+
+    import fitz
+    pdfDoc = fitz.open(stream=pdf, filetype='pdf')
+    if not 1 <= page <= pdfDoc.page_count:
+        raise DocumentError("the document has no page {p}".format(p=page))
+    return pdfDoc[page - 1].get_pixmap(dpi=dpi).tobytes('png')
+
+
+class RenderService:
+    """
+    The render pool, with its request queue and result cache. At most `jobs` documents are
+    rendered at a time and at most `queueSize` more are left waiting; requests beyond that are
+    turned away straight away rather than piling up.
+    """
+
+    def __init__(self, style, jobs=None, queueSize=16, cacheBytes=64*1024*1024):
+        self.style = style
+        self.jobs = jobs or os.cpu_count() or 1
+        self.queueSize = queueSize
+        self.slots = threading.BoundedSemaphore(self.jobs + queueSize)
+        self.cache = MemoryCache(cacheBytes)
+        self.pool = None
+
+        self.lock = threading.Lock()
+        self.inFlight = 0
+        self.requests = {}  # status code -> count
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.rejected = 0
+        self.renderSeconds = 0.0
+        self.renders = 0
+
+    def start(self):
+        """
+        Start the worker processes and wait until they are all ready.
+        """
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs)
+        list(self.pool.map(warmWorker, range(self.jobs)))
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+
+    def count(self, status):
+        with self.lock:
+            self.requests[status] = self.requests.get(status, 0) + 1
+
+    def render(self, data, documentType, outputFormat, page=1, dpi=150):
+        """
+        Return the rendered output for a document, from the cache if it's been rendered before.
+        Raises BusyError if the queue is full, or DocumentError if the document is no good.
+        """
+        key = hashlib.sha256(repr((documentType, outputFormat, page, dpi)).encode() + data).hexdigest()
+        result = self.cache.get(key)
+        with self.lock:
+            if result is not None:
+                self.cacheHits += 1
+                return result
+            self.cacheMisses += 1
+
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            raise BusyError()
+        try:
+            with self.lock:
+                self.inFlight += 1
+            start = time.perf_counter()
+            result = self.pool.submit(renderText, data, documentType, outputFormat, self.style,
+                                      page, dpi).result()
+            with self.lock:
+                self.renders += 1
+                self.renderSeconds += time.perf_counter() - start
+        finally:
+            with self.lock:
+                self.inFlight -= 1
+            self.slots.release()
+
+        self.cache.put(key, result)
+        return result
+
+    def metrics(self):
+        """
+        Return the service's counters in the Prometheus text format.
+        """
+        with self.lock:
+            lines = ['# TYPE chordsheet_requests_total counter']
+            for status, n in sorted(self.requests.items()):
+                lines.append('chordsheet_requests_total{{status="{s}"}} {n}'.format(s=status, n=n))
+            lines.extend([
+                '# TYPE chordsheet_rejected_total counter',
+                'chordsheet_rejected_total {n}'.format(n=self.rejected),
+                '# TYPE chordsheet_cache_hits_total counter',
+                'chordsheet_cache_hits_total {n}'.format(n=self.cacheHits),
+                '# TYPE chordsheet_cache_misses_total counter',
+                'chordsheet_cache_misses_total {n}'.format(n=self.cacheMisses),
+                '# TYPE chordsheet_cache_bytes gauge',
+                'chordsheet_cache_bytes {n}'.format(n=self.cache.size),
+                '# TYPE chordsheet_cache_entries gauge',
+                'chordsheet_cache_entries {n}'.format(n=len(self.cache)),
+                '# TYPE chordsheet_renders_in_flight gauge',
+                'chordsheet_renders_in_flight {n}'.format(n=self.inFlight),
+                '# TYPE chordsheet_render_capacity gauge',
+                'chordsheet_render_capacity {n}'.format(n=self.jobs + self.queueSize),
+                '# TYPE chordsheet_workers gauge',
+                'chordsheet_workers {n}'.format(n=self.jobs),
+                '# TYPE chordsheet_render_seconds summary',
+                'chordsheet_render_seconds_sum {n:.6f}'.format(n=self.renderSeconds),
+                'chordsheet_render_seconds_count {n}'.format(n=self.renders),
+            ])
+        return '\n'.join(lines) + '\n'
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    server_version = "Chordsheet"
+    protocol_version = "HTTP/1.1"
+
+    def address_string(self):
+        # Unix socket clients don't have an address
+        return self.client_address[0] if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def reply(self, status, body, contentType='text/plain; charset=utf-8', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.server.service.count(status)
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/metrics':
+            self.reply(200, self.server.service.metrics(), 'text/plain; version=0.0.4')
+        elif path == '/health':
+            self.reply(200, "ok\n")
+        else:
+            self.reply(404, "not found\n")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/render':
+            self.reply(404, "not found\n")
+            return
+
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        documentType = query.get('type', 'xml')
+        outputFormat = query.get('format', 'pdf')
+        try:
+            page = int(query.get('page', 1))
+            dpi = int(query.get('dpi', 150))
+        except ValueError:
+            self.reply(400, "page and dpi must be whole numbers\n")
+            return
+        if documentType not in documentTypes or outputFormat not in contentTypes or not 10 <= dpi <= 1200:
+            self.reply(400, "type must be xml, cma or chordpro, format pdf or png, and dpi from 10 to 1200\n")
+            return
+
+        # the body can't be skipped without a usable length, so the connection is closed after
+        # any of these
+        lengthHeader = self.headers.get('Content-Length')
+        if lengthHeader is None:
+            self.close_connection = True
+            self.reply(411, "Content-Length is needed\n")
+            return
+        try:
+            length = int(lengthHeader)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.close_connection = True
+            self.reply(400, "Content-Length must be a whole number of bytes\n")
+            return
+        if length > maxRequestSize:
+            self.close_connection = True
+            self.reply(413, "document too large\n")
+            return
+        data = self.rfile.read(length)
+
+        try:
+            result = self.server.service.render(data, documentType, outputFormat, page, dpi)
+        except BusyError:
+            self.reply(503, "too many requests waiting, try again shortly\n", headers={'Retry-After': '1'})
+        except DocumentError as e:
+            self.reply(400, "{e}\n".format(e=e))
+        except ImportError:
+            self.reply(501, "PNG output needs PyMuPDF to be installed\n")
+        except Exception as e:
+            self.reply(500, "could not render the document: {e}\n".format(e=e))
+        else:
+            self.reply(200, result, contentTypes[outputFormat])
+
+
+class HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def makeServer(service, port=None, socketPath=None, quiet=False):
+    """
+    Create a server for the service on a localhost port or a Unix socket.
+    """
+    if socketPath:
+        # clear away a socket left behind by an earlier run, but nothing else
+        if os.path.exists(socketPath) and stat.S_ISSOCK(os.stat(socketPath).st_mode):
+            os.remove(socketPath)
+        server = UnixHTTPServer(socketPath, RequestHandler)
+    else:
+        server = HTTPServer(('127.0.0.1', port), RequestHandler)
+    server.service = service
+    server.quiet = quiet
+    return server
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Combines many documents into a single PDF songbook with a table of contents.
+"""
+
+import os
+from io import BytesIO
+from xml.sax.saxutils import escape
+from concurrent.futures import ProcessPoolExecutor
+
+from reportlab.lib.units import mm
+from reportlab.lib.enums import TA_LEFT, TA_RIGHT
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.platypus import BaseDocTemplate, PageTemplate, Paragraph, Flowable, PageBreak, Table, TableStyle
+
+from chordsheet.document import Document
+from chordsheet.render import Renderer, StreamingDocTemplate, CompressingCanvas, pageFrame, chartFlowables
+from chordsheet.rlStylesheet import getStyleSheet
+
+
+def chordKey(chord):
+    """
+    Two chords are the same voicing if they have the same name and fingerings.
+    """
+    return (chord.name, tuple(sorted((inst, tuple(f)) for inst, f in chord.voicings.items())))
+
+
+def countPages(style, flowables):
+    """
+    Lay out a list of flowables on their own and return how many pages they take up.
+    """
+    template = PageTemplate(id='AllPages', frames=[pageFrame(style)])
+    rlDoc = BaseDocTemplate(BytesIO(), pagesize=style.pageSize, pageTemplates=[template])
+    rlDoc.build(flowables)
+    return rlDoc.page
+
+
+def layoutSong(path, style, sharedCharts):
+    """
+    Load a document and work out how many pages it takes up. Run in the worker processes.
+    """
+    from chordsheet.fonts import registerFonts
+    registerFonts()
+
+    document = Document.newFromFile(path)
+    return document, countPages(style, Renderer(document, style).flowables(charts=not sharedCharts))
+
+
+class Bookmark(Flowable):
+    """
+    Invisible flowable that adds a PDF bookmark (and outline entry) where it lands.
+    """
+
+    def __init__(self, key, title, level=0):
+        super().__init__()
+        self.key = key
+        self.title = title
+        self.level = level
+
+    def wrap(self, availWidth, availHeight):
+        return (0, 0)
+
+    def draw(self):
+        self.canv.bookmarkPage(self.key)
+        self.canv.addOutlineEntry(self.title, self.key, level=self.level)
+
+
+class Song:
+    def __init__(self, path, document, pages):
+        self.path = path
+        self.document = document
+        self.pages = pages
+        self.startPage = None
+
+    @property
+    def title(self):
+        return self.document.title or os.path.splitext(os.path.basename(self.path))[0]
+
+
+class Songbook:
+    """
+    A book of songs. Each song starts on a new page. With sharedCharts, chord voicings are
+    drawn once in an appendix at the back instead of at the top of every song, and voicings
+    used by more than one song only appear once.
+    """
+
+    def __init__(self, songs, style, title=None, sharedCharts=False, invariant=False):
+        self.songs = songs
+        self.style = style
+        self.title = title
+        self.sharedCharts = sharedCharts
+        self.invariant = invariant
+        self.appendixPage = None
+
+    @classmethod
+    def newFromFiles(cls, paths, style, title=None, sharedCharts=False, jobs=None, invariant=False):
+        """
+        Load documents and lay them out in parallel, one song per worker process.
+        """
+        jobs = min(jobs or os.cpu_count() or 1, len(paths))
+        if jobs > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                results = list(pool.map(layoutSong, paths, [style] * len(paths),
+                                        [sharedCharts] * len(paths)))
+        else:
+            results = [layoutSong(p, style, sharedCharts) for p in paths]
+        songs = [Song(p, document, pages) for p, (document, pages) in zip(paths, results)]
+        return cls(songs, style, title=title, sharedCharts=sharedCharts, invariant=invariant)
+
+    def sharedChordList(self):
+        """
+        Return every chord voicing used in the book, each only once, in order of appearance.
+        """
+        seen = {}
+        for song in self.songs:
+            for c in song.document.chordList:
+                seen.setdefault(chordKey(c), c)
+        return list(seen.values())
+
+    def contentsFlowables(self, styles, links=True):
+        """
+        Return the title and table of contents, linked to each song unless links is False.
+        Page numbers are filled in from the songs' startPage, so this can be laid out before
+        they are known.
+        """
+        rlDocList = []
+        if self.title:
+            rlDocList.append(Paragraph(escape(self.title), styles['Title']))
+        # keepWithNext would try to fit the whole table on the first page with the heading
+        rlDocList.append(Paragraph("Contents", ParagraphStyle(
+            name='ContentsHeading', parent=styles['Heading'], keepWithNext=0)))
+
+        numberStyle = ParagraphStyle(name='ContentsNumber', parent=styles['Credits'], alignment=TA_RIGHT)
+        entryStyle = ParagraphStyle(name='ContentsEntry', parent=styles['Credits'], alignment=TA_LEFT)
+        entries = [("song{n}".format(n=n), song.title, song.startPage) for n, song in enumerate(self.songs)]
+        if self.sharedCharts and self.sharedChordList():
+            entries.append(("chords", "Chord voicings", self.appendixPage))
+
+        rows = []
+        for key, title, page in entries:
+            text = escape(title)
+            if links:
+                text = '<a href="#{k}">{t}</a>'.format(k=key, t=text)
+            rows.append([Paragraph(text, entryStyle), Paragraph(str(page or ''), numberStyle)])
+
+        frameWidth = pageFrame(self.style).width
+        if rows:
+            table = Table(rows, colWidths=[frameWidth - 20*mm, 20*mm])
+            table.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                                       ('LEFTPADDING', (0, 0), (0, -1), 0),
+                                       ('RIGHTPADDING', (-1, 0), (-1, -1), 0)]))
+            rlDocList.append(table)
+        return rlDocList
+
+    def numberPages(self):
+        """
+        Work out which page each song starts on from the page counts of the songs.
+        """
+        styles = getStyleSheet(self.style)
+        # the links can't be resolved without the songs there to link to
+        page = countPages(self.style, self.contentsFlowables(styles, links=False)) + 1
+        for song in self.songs:
+            song.startPage = page
+            page += song.pages
+        self.appendixPage = page
+
+    def drawPageNumber(self, canvas, rlDoc):
+        if self.style.numberPages:
+            canvas.setFont(self.style.font, self.style.creditsFontSize)
+            canvas.drawCentredString(self.style.pageSize[0] / 2, self.style.bottomMargin*mm / 2,
+                                     str(canvas.getPageNumber()))
+
+    def savePDF(self, pathToPDF):
+        """
+        Lay out the whole book in one pass and write it out. Returns the number of pages.
+        """
+        self.numberPages()
+
+        template = PageTemplate(id='AllPages', frames=[pageFrame(self.style)],
+                                onPage=self.drawPageNumber)
+        rlDoc = StreamingDocTemplate(pathToPDF, pagesize=self.style.pageSize, pageTemplates=[template],
+                                     title=self.title or '', invariant=self.invariant or None)
+        rlDoc.build(self.iterFlowables(getStyleSheet(self.style)), canvasmaker=CompressingCanvas)
+        return rlDoc.page
+
+    def iterFlowables(self, styles):
+        """
+        Generate the flowables for the whole book, each song's only when they are needed.
+        """
+        yield from self.contentsFlowables(styles)
+        for n, song in enumerate(self.songs):
+            yield PageBreak()
+            yield Bookmark("song{n}".format(n=n), song.title)
+            yield from Renderer(song.document, self.style).iterFlowables(
+                styles, charts=not self.sharedCharts)
+
+        if self.sharedCharts:
+            chordList = self.sharedChordList()
+            if chordList:
+                yield PageBreak()
+                yield Bookmark("chords", "Chord voicings")
+                yield from chartFlowables(self.style, styles, chordList)
@@ -1,16 +1,162 @@
-from PyQt5 import QtWidgets, QtGui
+from PyQt5 import QtWidgets, QtCore
 
 
-class MItemModel(QtGui.QStandardItemModel):
+class MTableModel(QtCore.QAbstractTableModel):
     """
-    Special item model to ensure whole row is moved.
+    Table model that reads from and writes to a list of document objects directly. Only the
+    rows the view asks for are ever looked at, so binding a new list costs nothing.
     """
+    headerLabels = []
+    rowMimeType = 'application/x-chordsheet-rows'
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.itemList = []
+
+    def setItemList(self, itemList):
+        """
+        Bind the model to a list. The list is used as is, not copied.
+        """
+        self.beginResetModel()
+        self.itemList = itemList
+        self.endResetModel()
+
+    def text(self, row, column):
+        """
+        Return the text shown in a cell.
+        """
+        return ""
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.itemList)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.headerLabels)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if index.isValid() and role == QtCore.Qt.DisplayRole:
+            return self.text(index.row(), index.column())
+        return None
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.headerLabels[section]
+        return super().headerData(section, orientation, role)
+
+    def flags(self, index):
+        """
+        Rows can be dragged, but only dropped between other rows.
+        """
+        if index.isValid():
+            return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsDragEnabled
+        return QtCore.Qt.ItemIsDropEnabled
+
+    def supportedDropActions(self):
+        return QtCore.Qt.MoveAction
+
+    def mimeTypes(self):
+        return [self.rowMimeType]
+
+    def mimeData(self, indexes):
+        data = QtCore.QMimeData()
+        rows = sorted({index.row() for index in indexes})
+        data.setData(self.rowMimeType, ",".join(str(r) for r in rows).encode())
+        return data
 
     def dropMimeData(self, data, action, row, col, parent):
         """
-        Always move the entire row, and don't allow column "shifting"
+        Always move the entire row, and don't allow column "shifting". The move is done here,
+        so False is returned to stop the view removing the dragged rows afterwards.
+        """
+        if action != QtCore.Qt.MoveAction or not data.hasFormat(self.rowMimeType):
+            return False
+        rows = [int(r) for r in bytes(data.data(self.rowMimeType)).decode().split(",")]
+        if row == -1:
+            row = len(self.itemList)
+        # rows are moved one at a time, last first, so each lands above the ones after it
+        for sourceRow in reversed(rows):
+            self.moveRows(QtCore.QModelIndex(), sourceRow, 1, QtCore.QModelIndex(), row)
+            if sourceRow < row:
+                row -= 1
+        return False
+
+    def insertItems(self, row, items):
+        """
+        Insert a run of items into the list at the given row.
+        """
+        if not items:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), row, row + len(items) - 1)
+        self.itemList[row:row] = items
+        self.endInsertRows()
+
+    def appendItem(self, item):
+        self.insertItems(len(self.itemList), [item])
+
+    def replaceItem(self, row, item):
+        self.itemList[row] = item
+        self.refresh(row, row)
+
+    def removeRows(self, row, count, parent=QtCore.QModelIndex()):
+        if parent.isValid() or count < 1 or row < 0 or row + count > len(self.itemList):
+            return False
+        self.beginRemoveRows(parent, row, row + count - 1)
+        del self.itemList[row:row + count]
+        self.endRemoveRows()
+        return True
+
+    def moveRows(self, sourceParent, sourceRow, count, destinationParent, destinationChild):
+        if count < 1 or not self.beginMoveRows(sourceParent, sourceRow, sourceRow + count - 1,
+                                               destinationParent, destinationChild):
+            return False
+        moved = self.itemList[sourceRow:sourceRow + count]
+        del self.itemList[sourceRow:sourceRow + count]
+        if destinationChild > sourceRow:
+            destinationChild -= count
+        self.itemList[destinationChild:destinationChild] = moved
+        self.endMoveRows()
+        return True
+
+    def refresh(self, first=0, last=None):
+        """
+        Tell the view that the items in a range of rows have been changed in place.
         """
-        return super().dropMimeData(data, action, row, 0, parent)
+        if last is None:
+            last = len(self.itemList) - 1
+        if last >= first:
+            self.dataChanged.emit(self.index(first, 0), self.index(
+                last, self.columnCount() - 1))
+
+
+class ChordTableModel(MTableModel):
+    headerLabels = ['Chord', 'Guitar voicing', 'Piano voicing']
+
+    def text(self, row, column):
+        c = self.itemList[row]
+        if column == 0:
+            return c.name
+        inst = ['guitar', 'piano'][column - 1]
+        return ",".join(c.voicings[inst]) if inst in c.voicings.keys() else ""
+
+
+class SectionTableModel(MTableModel):
+    headerLabels = ['Name']
+
+    def text(self, row, column):
+        return self.itemList[row].name
+
+
+class BlockTableModel(MTableModel):
+    headerLabels = ['Chord', 'Length', 'Notes']
+
+    def text(self, row, column):
+        b = self.itemList[row]
+        if column == 0:
+            return b.chord.name if b.chord else ""
+        elif column == 1:
+            return str(b.length)
+        else:
+            return b.notes or ""
 
 
 class MProxyStyle(QtWidgets.QProxyStyle):
@@ -36,14 +182,17 @@ class MTableView(QtWidgets.QTableView):
     """
     Subclass the built in TableView to customise it.
     """
+    modelClass = MTableModel
 
     def __init__(self, parent):
         super().__init__(parent)
 
-        self.model = MItemModel()
+        self.model = self.modelClass()
         self.setModel(self.model)
 
         self.verticalHeader().hide()
+        # rows are all the same height, so don't measure them
+        self.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
         self.horizontalHeader().show()
         self.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Interactive)
         self.horizontalHeader().setStretchLastSection(True)
@@ -55,78 +204,29 @@ class MTableView(QtWidgets.QTableView):
         # Set our custom style - this draws the drop indicator across the whole row
         self.setStyle(MProxyStyle())
 
+    def populate(self, itemList):
+        """
+        Show a list of document objects in the table. The table edits the list in place.
+        """
+        self.model.setItemList(itemList)
+
 
 class ChordTableView(MTableView):
     """
     Subclass MTableView to add properties just for the chord table.
     """
-
-    def __init__(self, parent):
-        super().__init__(parent)
-
-        self.model.setHorizontalHeaderLabels(['Chord', 'Guitar voicing', 'Piano voicing'])
-
-    def populate(self, cList):
-        """
-        Fill the table from a list of Chord objects.
-        """
-        self.model.removeRows(0, self.model.rowCount())
-        for c in cList:
-            rowList = [QtGui.QStandardItem(c.name), QtGui.QStandardItem(
-                ",".join(c.voicings['guitar'] if 'guitar' in c.voicings.keys() else "")),
-                QtGui.QStandardItem(
-                ",".join(c.voicings['piano'] if 'piano' in c.voicings.keys() else ""))]
-            for item in rowList:
-                item.setEditable(False)
-                item.setDropEnabled(False)
-
-            self.model.appendRow(rowList)
+    modelClass = ChordTableModel
 
 
 class SectionTableView(MTableView):
     """
     Subclass MTableView to add properties just for the section table.
     """
-
-    def __init__(self, parent):
-        super().__init__(parent)
-
-        self.model.setHorizontalHeaderLabels(['Name'])
-
-    def populate(self, sList):
-        """
-        Fill the table from a list of Section objects.
-        """
-        self.model.removeRows(0, self.model.rowCount())
-        for s in sList:
-            rowList = [QtGui.QStandardItem(s.name)]
-            for item in rowList:
-                item.setEditable(False)
-                item.setDropEnabled(False)
-
-            self.model.appendRow(rowList)
+    modelClass = SectionTableModel
 
 
 class BlockTableView(MTableView):
     """
     Subclass MTableView to add properties just for the block table.
     """
-
-    def __init__(self, parent):
-        super().__init__(parent)
-
-        self.model.setHorizontalHeaderLabels(['Chord', 'Length', 'Notes'])
-
-    def populate(self, bList):
-        """
-        Fill the table from a list of Block objects.
-        """
-        self.model.removeRows(0, self.model.rowCount())
-        for b in bList:
-            rowList = [QtGui.QStandardItem((b.chord.name if b.chord else "")), QtGui.QStandardItem(
-                str(b.length)), QtGui.QStandardItem(b.notes)]
-            for item in rowList:
-                item.setEditable(False)
-                item.setDropEnabled(False)
-
-            self.model.appendRow(rowList)
+    modelClass = BlockTableModel
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Transposition of chord names and voicings, for single documents or whole libraries. Names are
+parsed once and every note is looked up in tables worked out in advance, so transposing many
+documents that share chords costs little more than transposing one.
+"""
+
+import os
+from functools import lru_cache
+
+from chordsheet.document import Document, Chord, Block, Section
+from chordsheet.parsers import sharp, flat, pitchClasses, parseChordSymbol
+
+# the note names used for each of the twelve pitch classes, counting from C. Only these
+# spellings are written, as they are the ones PianoChart.replaceFlats understands
+noteNames = {
+    'sharp': ('C', 'C' + sharp, 'D', 'D' + sharp, 'E', 'F', 'F' + sharp, 'G', 'G' + sharp, 'A', 'A' + sharp, 'B'),
+    'flat': ('C', 'D' + flat, 'D', 'E' + flat, 'E', 'F', 'G' + flat, 'G', 'A' + flat, 'A', 'B' + flat, 'B'),
+}
+# transpositionTables[spelling][semitones][note name] -> transposed note name
+transpositionTables = {
+    spelling: [{note: names[(pc + n) % 12] for note, pc in pitchClasses.items()} for n in range(12)]
+    for spelling, names in noteNames.items()
+}
+# every note left as it is written, only for transposing by whole octaves (see documentSpelling)
+transpositionTables['asWritten'] = [{note: note for note in pitchClasses}]
+
+
+def transposeNote(note, semitones, spelling='sharp'):
+    """
+    Transpose a note name. Names that aren't notes are left as they are.
+    """
+    return transpositionTables[spelling][semitones % 12].get(note, note)
+
+
+@lru_cache(maxsize=65536)
+def transposeName(name, semitones, spelling='sharp'):
+    """
+    Transpose a chord name, e.g. transposeName('B♭m/F', 2) is 'Cm/G'. Names that don't start
+    with a note (e.g. 'N.C.') are left as they are.
+    """
+    symbol = parseChordSymbol(name)
+    if symbol.root is None:
+        return name
+    table = transpositionTables[spelling][semitones % 12]
+    if symbol.bass is None:
+        return table[symbol.root] + symbol.suffix
+    return table[symbol.root] + symbol.suffix + '/' + table[symbol.bass]
+
+
+@lru_cache(maxsize=65536)
+def transposeFingering(fingering, semitones):
+    """
+    Move a guitar fingering (a tuple of frets or 'x') up or down the neck, by semitones up or
+    down an octave from that, whichever keeps the frets lowest without going below the nut.
+    """
+    frets = [int(f) for f in fingering if f.isdigit()]
+    if not frets:
+        return fingering
+    shift = semitones % 12
+    if min(frets) + shift - 12 >= 0:
+        shift -= 12
+    return tuple(str(int(f) + shift) if f.isdigit() else f for f in fingering)
+
+
+def transposeVoicing(instrument, voicing, semitones, spelling='sharp'):
+    """
+    Transpose a voicing as held by Chord.voicings.
+    """
+    if instrument == 'guitar':
+        return list(transposeFingering(tuple(voicing), semitones))
+    elif instrument == 'piano':
+        table = transpositionTables[spelling][semitones % 12]
+        return [table.get(note, note) for note in voicing]
+    return list(voicing)
+
+
+def documentSpelling(document, semitones=None):
+    """
+    Return 'flat' if a document's chord names and piano voicings mostly use flats, otherwise
+    'sharp', so a transposed document is spelt the way the original was. If it is transposed by
+    whole octaves the key doesn't change, so 'asWritten' is returned and every note keeps the
+    spelling it has.
+    """
+    if semitones is not None and semitones % 12 == 0:
+        return 'asWritten'
+    sharps = flats = 0
+    for c in document.chordList:
+        symbol = parseChordSymbol(c.name)
+        notes = [symbol.root, symbol.bass]
+        notes.extend(c.voicings.get('piano', []))
+        for note in notes:
+            if note:
+                sharps += note.count(sharp)
+                flats += note.count(flat)
+    return 'flat' if flats > sharps else 'sharp'
+
+
+def transposeDocument(document, semitones, spelling=None):
+    """
+    Transpose every chord in a document by a number of semitones, in place. The blocks refer
+    to the chords in chordList, so they follow along. spelling is 'sharp' or 'flat', or None
+    to spell the notes the way the document mostly does already (see documentSpelling).
+    Returns the document.
+    """
+    if spelling is None:
+        spelling = documentSpelling(document, semitones)
+    for c in document.chordList:
+        c.name = transposeName(c.name, semitones, spelling)
+        for instrument, voicing in c.voicings.items():
+            c.voicings[instrument] = transposeVoicing(instrument, voicing, semitones, spelling)
+    return document
+
+
+def transposedCopy(document, semitones, spelling=None):
+    """
+    Return a transposed copy of a document, leaving the original as it is. Chords, blocks and
+    sections are all new objects, as the undo history needs.
+    """
+    if spelling is None:
+        spelling = documentSpelling(document, semitones)
+    chords = {}
+    for c in document.chordList:
+        chords[id(c)] = Chord(transposeName(c.name, semitones, spelling), **{
+            instrument: transposeVoicing(instrument, voicing, semitones, spelling)
+            for instrument, voicing in c.voicings.items()})
+    sectionList = [Section(blockList=[Block(b.length, chord=chords.get(id(b.chord), b.chord), notes=b.notes)
+                                      for b in s.blockList], name=s.name)
+                   for s in document.sectionList]
+    return Document(chordList=[chords[id(c)] for c in document.chordList], sectionList=sectionList,
+                    title=document.title, subtitle=document.subtitle, composer=document.composer,
+                    arranger=document.arranger, timeSignature=document.timeSignature, tempo=document.tempo)
+
+
+def transposedPathFor(inputPath, semitones, outputDir=None):
+    """
+    Work out where the transposed copy of a document goes, e.g. song+2.xml next to song.xml or
+    in outputDir. It is always saved as XML.
+    """
+    name = "{n}{s:+d}.xml".format(n=os.path.splitext(os.path.basename(inputPath))[0], s=semitones)
+    return os.path.join(outputDir if outputDir else os.path.dirname(inputPath), name)
+
+
+def transposeFile(inputPath, outputPath, semitones, spelling=None):
+    """
+    Load a document, transpose it and save it to outputPath as XML. Returns an error message,
+    or None if it worked. Run in worker processes, so it must not raise.
+    """
+    try:
+        doc = Document.newFromFile(inputPath)
+    except Exception as e:
+        return "{f}: could not be loaded: {e}".format(f=inputPath, e=e)
+    try:
+        transposeDocument(doc, semitones, spelling)
+        doc.saveXML(outputPath)
+    except Exception as e:
+        return "{f}: could not be transposed: {e}".format(f=inputPath, e=e)
+    return None
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+Watches a directory tree of Chordsheet documents and re-renders the ones that change.
+"""
+
+import os
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+from chordsheet.chordpro import chordProExtensions
+
+documentExtensions = ('.xml', '.cml', '.cma')
+# everything that is rendered when it changes: Chordsheet's own formats and ChordPro
+watchedExtensions = documentExtensions + chordProExtensions
+
+
+def hashFile(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class WatchedFile:
+    """
+    What the watcher knows about one source file.
+    """
+    __slots__ = ('stat', 'changedAt', 'hash', 'pending')
+
+    def __init__(self, stat):
+        self.stat = stat
+        self.changedAt = time.monotonic()
+        self.hash = None  # hash of the content that was last rendered, or failed to render
+        self.pending = False  # waiting for the file to settle before rendering
+
+
+class Watcher:
+    """
+    Polls a directory tree for document files and renders each one to PDF when its content
+    changes. A file is only rendered once it has stopped changing for `debounce` seconds, so
+    an editor saving in several steps only causes one render. Renders run on a pool of worker
+    processes that are started once and kept for the life of the watcher, so ReportLab and the
+    fonts are only loaded once.
+    """
+
+    def __init__(self, directory, style, outputDir=None, interval=0.5, debounce=0.3, jobs=None,
+                 invariant=False, report=print):
+        self.directory = directory
+        self.style = style
+        self.invariant = invariant
+        self.outputDir = outputDir
+        self.interval = interval
+        self.debounce = debounce
+        self.jobs = jobs or os.cpu_count() or 1
+        self.report = report
+        self.files = {}
+        self.running = {}  # future -> (path, hash)
+        self.pool = None
+
+    def outputPathFor(self, path):
+        """
+        PDFs go next to their source, or into the same place in the tree under outputDir.
+        """
+        name = os.path.splitext(path)[0] + '.pdf'
+        if self.outputDir:
+            return os.path.join(self.outputDir, os.path.relpath(name, self.directory))
+        return name
+
+    def scan(self):
+        """
+        Return the stat result of every document file in the tree.
+        """
+        found = {}
+        for root, dirs, files in os.walk(self.directory):
+            # don't descend into hidden directories (.git etc.) or the output directory
+            dirs[:] = [d for d in dirs if not d.startswith('.') and
+                       not (self.outputDir and os.path.abspath(os.path.join(root, d)) == os.path.abspath(self.outputDir))]
+            for f in files:
+                if f.lower().endswith(watchedExtensions) and not f.startswith('.'):
+                    path = os.path.join(root, f)
+                    try:
+                        found[path] = os.stat(path)
+                    except OSError:  # removed between listing and stat
+                        pass
+        return found
+
+    def poll(self, initial=False):
+        """
+        Look for files that have been added, changed or removed since the last poll. On the
+        first poll, files whose PDF is already newer than the source are left alone.
+        """
+        found = self.scan()
+        for path in list(self.files.keys()):
+            if path not in found:
+                del self.files[path]
+        for path, stat in found.items():
+            known = self.files.get(path)
+            if known is None:
+                known = self.files[path] = WatchedFile(stat)
+                if initial:
+                    # nothing is being edited yet, so there's no need to wait for it to settle
+                    known.changedAt = float('-inf')
+                    try:
+                        upToDate = os.stat(self.outputPathFor(path)).st_mtime >= stat.st_mtime
+                    except OSError:
+                        upToDate = False
+                    if upToDate:
+                        known.hash = hashFile(path)
+                        continue
+                known.pending = True
+            elif (stat.st_mtime_ns, stat.st_size) != (known.stat.st_mtime_ns, known.stat.st_size):
+                known.stat = stat
+                known.changedAt = time.monotonic()
+                known.pending = True
+
+    def dispatch(self):
+        """
+        Start rendering files that have settled and whose content has actually changed.
+        """
+        from chordsheet.cli import renderFile
+
+        now = time.monotonic()
+        busy = {path for path, h in self.running.values()}
+        for path, known in self.files.items():
+            if not known.pending or path in busy or now - known.changedAt < self.debounce:
+                continue
+            known.pending = False
+            try:
+                h = hashFile(path)
+            except OSError:
+                continue
+            if h == known.hash:  # touched or saved without changes
+                continue
+            outputPath = self.outputPathFor(path)
+            os.makedirs(os.path.dirname(outputPath) or '.', exist_ok=True)
+            future = self.pool.submit(renderFile, path, outputPath, self.style, self.invariant)
+            self.running[future] = (path, h)
+
+    def collect(self):
+        """
+        Report on renders that have finished.
+        """
+        for future in [f for f in self.running.keys() if f.done()]:
+            path, h = self.running.pop(future)
+            try:
+                e = future.result()
+            except Exception as ex:  # the worker died
+                e = "{f}: could not be rendered: {e}".format(f=path, e=ex)
+            # a file that failed isn't tried again until its content changes
+            if path in self.files:
+                self.files[path].hash = h
+            if e is None:
+                self.report("{i} -> {o}".format(i=path, o=self.outputPathFor(path)))
+            else:
+                self.report(e)
+
+    def step(self, initial=False):
+        self.collect()
+        self.poll(initial)
+        self.dispatch()
+
+    def run(self, once=False):
+        """
+        Watch until interrupted. With once=True, render whatever is out of date and return.
+        """
+        from chordsheet.cli import initWorker
+
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs, initializer=initWorker)
+        try:
+            self.step(initial=True)
+            while True:
+                if once and not self.running and not any(f.pending for f in self.files.values()):
+                    break
+                time.sleep(min(self.interval, self.debounce) if once else self.interval)
+                self.step()
+        finally:
+            self.pool.shutdown(wait=True)
+            self.collect()
+            self.pool = None
@@ -0,0 +1,16 @@
+# Compiles the .ui files in ui/ to Python modules in chordsheet/forms, so the GUI doesn't have to
+# parse the XML at startup. Run this before building a release; gui.py falls back to loading
+# the .ui files directly if the compiled modules are missing.
+import os
+
+from PyQt5 import uic
+
+uiDir = 'ui'
+formsDir = os.path.join('chordsheet', 'forms')
+
+for uiFile in sorted(os.listdir(uiDir)):
+    name, ext = os.path.splitext(uiFile)
+    if ext != '.ui':
+        continue
+    with open(os.path.join(uiDir, uiFile), 'r') as uif, open(os.path.join(formsDir, name + '.py'), 'w') as pyf:
+        uic.compileUi(uif, pyf)
@@ -7,28 +7,27 @@ Created on Wed May 29 00:02:24 2019
 """
 
 import sys
-import fitz
 import io
+import importlib
 import subprocess
 import os
 import time
-from copy import copy
+from copy import deepcopy
+from functools import partial
 
-from PyQt5.QtWidgets import QApplication, QAction, QLabel, QDialogButtonBox, QDialog, QFileDialog, QMessageBox, QPushButton, QLineEdit, QCheckBox, QSpinBox, QDoubleSpinBox, QTableWidgetItem, QTabWidget, QComboBox, QWidget, QScrollArea, QMainWindow, QShortcut
-from PyQt5.QtCore import QFile, QObject, Qt, pyqtSlot, QSettings
+from PyQt5.QtWidgets import QApplication, QAction, QLabel, QDialogButtonBox, QDialog, QFileDialog, QMessageBox, QPushButton, QLineEdit, QCheckBox, QSpinBox, QDoubleSpinBox, QInputDialog, QTableWidgetItem, QTabWidget, QComboBox, QWidget, QScrollArea, QMainWindow, QShortcut
+from PyQt5.QtCore import QFile, QObject, Qt, pyqtSlot, QSettings, QTimer
 from PyQt5.QtGui import QPixmap, QImage, QKeySequence
-from PyQt5 import uic
 from chordsheet.tableView import ChordTableView, BlockTableView
 from chordsheet.comboBox import MComboBox
 from chordsheet.pdfViewer import PDFViewer
 
 from reportlab.lib.units import mm, cm, inch, pica
 from reportlab.lib.pagesizes import A4, A5, LETTER, LEGAL
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 
 from chordsheet.document import Document, Style, Chord, Block, Section
-from chordsheet.render import Renderer
+from chordsheet.history import History
+from chordsheet.chordpro import chordProExtensions
 from chordsheet.parsers import parseFingering, parseName
 
 import _version
@@ -46,17 +45,42 @@ QApplication.setOrganizationDomain("ivanholmes.co.uk")
 QApplication.setApplicationName("Chordsheet")
 settings = QSettings()
 
-pdfmetrics.registerFont(
-    TTFont('FreeSans', os.path.join(scriptDir, 'fonts', 'FreeSans.ttf')))
-if sys.platform == "darwin":
-    pdfmetrics.registerFont(
-        TTFont('HelveticaNeue', 'HelveticaNeue.ttc', subfontIndex=0))
-
 # dictionaries for combo boxes
 pageSizeDict = {'A4': A4, 'A5': A5, 'Letter': LETTER, 'Legal': LEGAL}
 # point is 1 because reportlab's native unit is points.
 unitDict = {'mm': mm, 'cm': cm, 'inch': inch, 'point': 1, 'pica': pica}
 
+# live preview waits this long (in ms) after the last edit before rendering
+livePreviewDelay = 500
+# ...or this many times as long as the last render took, whichever is longer
+livePreviewLoadFactor = 2
+
+# fields read from the UI by updateDocument, tracked so only edited ones are read
+documentFields = ('title', 'subtitle', 'composer', 'arranger', 'tempo', 'timeSignature', 'pageSize', 'unit',
+                  'leftMargin', 'rightMargin', 'topMargin', 'bottomMargin', 'lineSpacing', 'unitWidth', 'font')
+
+
+def loadUi(name, baseClass):
+    """
+    Create a window or dialogue from ui/<name>.ui. The module generated by compile_ui.py is used
+    if there is one, which is much quicker than parsing the XML at runtime.
+    """
+    try:
+        form = importlib.import_module('chordsheet.forms.' + name)
+    except ImportError:
+        from PyQt5 import uic  # only needed when the forms haven't been compiled
+
+        ui_file = QFile(os.path.join(scriptDir, 'ui', name + '.ui'))
+        ui_file.open(QFile.ReadOnly)
+        widget = uic.loadUi(ui_file)
+        ui_file.close()
+        return widget
+
+    formClass = next(getattr(form, n) for n in dir(form) if n.startswith('Ui_'))
+    widget = type(formClass.__name__[3:], (baseClass, formClass), {})()
+    widget.setupUi(widget)
+    return widget
+
 
 class DocumentWindow(QMainWindow):
     """
@@ -75,26 +99,49 @@ class DocumentWindow(QMainWindow):
 
         self.doc = doc
         self.style = style
-        self.renderer = Renderer(self.doc, self.style)
+        # created on first use
+        self.renderCache = None
 
-        self.lastDoc = copy(self.doc)
+        self.lastDoc = deepcopy(self.doc)
         self.currentFilePath = filename
 
-        self.UIFileLoader(str(os.path.join(scriptDir, 'ui', 'mainwindow.ui')))
+        # set when the user edits anything, cleared when the preview is rendered
+        self.documentDirty = False
+        # fields edited since the last updateDocument, everything needs reading the first time
+        self.dirtyFields = set(documentFields)
+        # sections whose blocks have been edited since the last updateDocument, keyed by id
+        self.dirtySections = {}
+        self.lastRenderTime = 0
+        # values in the UI that couldn't be used the last time the document was updated
+        self.inputProblems = []
+        # coalesces bursts of edits into a single live preview render
+        self.previewTimer = QTimer(self)
+        self.previewTimer.setSingleShot(True)
+        self.previewTimer.timeout.connect(self.livePreviewAction)
+
+        # document-level undo history, capped at a configurable number of megabytes
+        self.history = History(
+            maxBytes=settings.value("undoMemoryLimit", 64, type=int) * 1024 * 1024)
+
+        self.UIFileLoader('mainwindow')
         self.UIInitStyle()
         self.updateChordDict()
         self.updateSectionDict()
         self.currentSection = None
+        self.history.clear(self.doc)
 
         self.setCentralWidget(self.window.centralWidget)
         self.setMenuBar(self.window.menuBar)
         self.setWindowTitle("Chordsheet")
 
         if filename:
-            try:
-                self.openFile(filename)
-            except Exception:
-                UnreadableMessageBox().exec()
+            self.openStartupFile(filename)
+
+    def openStartupFile(self, filename):
+        try:
+            self.openFile(filename)
+        except Exception:
+            UnreadableMessageBox().exec()
 
     def closeEvent(self, event):
         """
@@ -103,15 +150,11 @@ class DocumentWindow(QMainWindow):
         if self.saveWarning():
             self.close()
 
-    def UIFileLoader(self, ui_file):
+    def UIFileLoader(self, name):
         """
-        Loads the .ui file for this window and connects the UI elements to their actions.
+        Loads the UI for this window and connects the UI elements to their actions.
         """
-        ui_file = QFile(ui_file)
-        ui_file.open(QFile.ReadOnly)
-
-        self.window = uic.loadUi(ui_file)
-        ui_file.close()
+        self.window = loadUi(name, QMainWindow)
 
         # link all the UI elements
         self.window.actionAbout.triggered.connect(self.menuFileAboutAction)
@@ -129,6 +172,7 @@ class DocumentWindow(QMainWindow):
         self.window.actionCut.triggered.connect(self.menuEditCutAction)
         self.window.actionCopy.triggered.connect(self.menuEditCopyAction)
         self.window.actionPaste.triggered.connect(self.menuEditPasteAction)
+        self.window.actionTranspose.triggered.connect(self.menuEditTransposeAction)
 
         self.window.actionNew.setShortcut(QKeySequence.New)
         self.window.actionOpen.setShortcut(QKeySequence.Open)
@@ -152,6 +196,7 @@ class DocumentWindow(QMainWindow):
             self.includedFontAction)
 
         self.window.generateButton.clicked.connect(self.generateAction)
+        self.window.fitButton.clicked.connect(self.fitBeatWidthAction)
 
         # update whole document when any tab is selected
         self.window.tabWidget.tabBarClicked.connect(self.tabBarUpdateAction)
@@ -162,9 +207,6 @@ class DocumentWindow(QMainWindow):
         self.window.removeChordButton.clicked.connect(self.removeChordAction)
         self.window.updateChordButton.clicked.connect(self.updateChordAction)
 
-        # connecting clicked only works for this combo box because it's my own modified version (MComboBox)
-        self.window.blockSectionComboBox.clicked.connect(
-            self.blockSectionClickedAction)
         self.window.blockSectionComboBox.currentIndexChanged.connect(
             self.blockSectionChangedAction)
         self.window.addBlockButton.clicked.connect(self.addBlockAction)
@@ -181,6 +223,65 @@ class DocumentWindow(QMainWindow):
         self.window.sectionTableView.clicked.connect(self.sectionClickedAction)
         self.window.blockTableView.clicked.connect(self.blockClickedAction)
 
+        self.window.livePreviewCheckBox.setChecked(
+            settings.value("livePreview", False, type=bool))
+        self.window.livePreviewCheckBox.stateChanged.connect(
+            self.livePreviewToggledAction)
+
+        # anything that changes the document marks it dirty for the live preview
+        for lineEdit in [self.window.titleLineEdit, self.window.subtitleLineEdit, self.window.composerLineEdit,
+                         self.window.arrangerLineEdit, self.window.tempoLineEdit, self.window.leftMarginLineEdit,
+                         self.window.rightMarginLineEdit, self.window.topMarginLineEdit,
+                         self.window.bottomMarginLineEdit, self.window.beatWidthLineEdit]:
+            lineEdit.textEdited.connect(self.documentChangedAction)
+        self.window.timeSignatureSpinBox.valueChanged.connect(
+            self.documentChangedAction)
+        self.window.lineSpacingDoubleSpinBox.valueChanged.connect(
+            self.documentChangedAction)
+        self.window.pageSizeComboBox.currentIndexChanged.connect(
+            self.documentChangedAction)
+        self.window.documentUnitsComboBox.currentIndexChanged.connect(
+            self.documentChangedAction)
+        self.window.includedFontCheckBox.stateChanged.connect(
+            self.documentChangedAction)
+        for tableView in [self.window.chordTableView, self.window.sectionTableView, self.window.blockTableView]:
+            tableView.model.dataChanged.connect(self.documentChangedAction)
+            tableView.model.rowsInserted.connect(self.documentChangedAction)
+            tableView.model.rowsRemoved.connect(self.documentChangedAction)
+            tableView.model.rowsMoved.connect(self.documentChangedAction)
+
+        # keep track of which fields have been edited so updateDocument only reads those
+        for field, signal in [('title', self.window.titleLineEdit.textChanged),
+                              ('subtitle', self.window.subtitleLineEdit.textChanged),
+                              ('composer', self.window.composerLineEdit.textChanged),
+                              ('arranger', self.window.arrangerLineEdit.textChanged),
+                              ('tempo', self.window.tempoLineEdit.textChanged),
+                              ('timeSignature', self.window.timeSignatureSpinBox.valueChanged),
+                              ('pageSize', self.window.pageSizeComboBox.currentIndexChanged),
+                              ('unit', self.window.documentUnitsComboBox.currentIndexChanged),
+                              ('leftMargin', self.window.leftMarginLineEdit.textChanged),
+                              ('rightMargin', self.window.rightMarginLineEdit.textChanged),
+                              ('topMargin', self.window.topMarginLineEdit.textChanged),
+                              ('bottomMargin', self.window.bottomMarginLineEdit.textChanged),
+                              ('lineSpacing', self.window.lineSpacingDoubleSpinBox.valueChanged),
+                              ('unitWidth', self.window.beatWidthLineEdit.textChanged),
+                              ('font', self.window.includedFontCheckBox.stateChanged)]:
+            signal.connect(partial(self.fieldChangedAction, field))
+
+        # any change to the block table means the section it shows has changed
+        self.window.blockTableView.model.dataChanged.connect(
+            self.blocksChangedAction)
+        self.window.blockTableView.model.rowsInserted.connect(
+            self.blocksChangedAction)
+        self.window.blockTableView.model.rowsRemoved.connect(
+            self.blocksChangedAction)
+        self.window.blockTableView.model.rowsMoved.connect(
+            self.blocksChangedAction)
+
+        # drag and drop happens without any of our actions, so record it when it's done
+        for tableView in [self.window.chordTableView, self.window.sectionTableView, self.window.blockTableView]:
+            tableView.model.rowsMoved.connect(self.recordHistory)
+
     def UIInitDocument(self):
         """
         Fills the window's fields with the values from its document.
@@ -204,6 +305,8 @@ class DocumentWindow(QMainWindow):
             self.currentSection.blockList if self.currentSection else [])
         self.updateSectionDict()
         self.updateChordDict()
+        # these are all new objects, so there is nothing to replace
+        self.dirtySections = {}
 
     def UIInitStyle(self):
         """
@@ -231,7 +334,37 @@ class DocumentWindow(QMainWindow):
         self.window.beatWidthLineEdit.setText(str(self.style.unitWidth))
 
     def tabBarUpdateAction(self, index):
-        self.updateDocument()
+        self.recordHistory()
+
+    def fieldChangedAction(self, field, *args):
+        self.dirtyFields.add(field)
+
+    def blocksChangedAction(self, *args):
+        if self.currentSection is not None:
+            self.dirtySections[id(self.currentSection)] = self.currentSection
+
+    def documentChangedAction(self, *args):
+        """
+        Mark the document as edited and, in live preview mode, (re)start the preview timer.
+        """
+        self.documentDirty = True
+        if self.window.livePreviewCheckBox.isChecked():
+            # back off on documents that take a long time to render so typing stays smooth
+            self.previewTimer.start(
+                max(livePreviewDelay, int(livePreviewLoadFactor * self.lastRenderTime * 1000)))
+
+    def livePreviewToggledAction(self):
+        settings.setValue(
+            "livePreview", self.window.livePreviewCheckBox.isChecked())
+        if self.window.livePreviewCheckBox.isChecked() and self.documentDirty:
+            self.previewTimer.start(livePreviewDelay)
+        else:
+            self.previewTimer.stop()
+
+    def livePreviewAction(self):
+        if self.documentDirty:
+            self.recordHistory(live=True)
+            self.updatePreview(live=True)
     
     def pageSizeAction(self, index):
         self.pageSizeSelected = self.window.pageSizeComboBox.itemText(index)
@@ -248,27 +381,22 @@ class DocumentWindow(QMainWindow):
     def chordClickedAction(self, index):
         # set the controls to the values from the selected chord
         self.window.chordNameLineEdit.setText(
-            self.window.chordTableView.model.item(index.row(), 0).text())
+            self.window.chordTableView.model.text(index.row(), 0))
         self.window.guitarVoicingLineEdit.setText(
-            self.window.chordTableView.model.item(index.row(), 1).text())
+            self.window.chordTableView.model.text(index.row(), 1))
         self.window.pianoVoicingLineEdit.setText(
-            self.window.chordTableView.model.item(index.row(), 2).text())
+            self.window.chordTableView.model.text(index.row(), 2))
 
     def sectionClickedAction(self, index):
         # set the controls to the values from the selected section
         self.window.sectionNameLineEdit.setText(
-            self.window.sectionTableView.model.item(index.row(), 0).text())
+            self.window.sectionTableView.model.text(index.row(), 0))
         # also set the combo box on the block page to make it flow well
-        curSecName = self.window.sectionTableView.model.item(
-            index.row(), 0).text()
+        curSecName = self.window.sectionTableView.model.text(index.row(), 0)
         if curSecName:
             self.window.blockSectionComboBox.setCurrentText(
                 curSecName)
 
-    def blockSectionClickedAction(self, text):
-        if text:
-            self.updateBlocks(self.sectionDict[text])
-
     def blockSectionChangedAction(self, index):
         sName = self.window.blockSectionComboBox.currentText()
         if sName:
@@ -279,13 +407,13 @@ class DocumentWindow(QMainWindow):
 
     def blockClickedAction(self, index):
         # set the controls to the values from the selected block
-        bChord = self.window.blockTableView.model.item(index.row(), 0).text()
+        bChord = self.window.blockTableView.model.text(index.row(), 0)
         self.window.blockChordComboBox.setCurrentText(
             bChord if bChord else "None")
         self.window.blockLengthLineEdit.setText(
-            self.window.blockTableView.model.item(index.row(), 1).text())
+            self.window.blockTableView.model.text(index.row(), 1))
         self.window.blockNotesLineEdit.setText(
-            self.window.blockTableView.model.item(index.row(), 2).text())
+            self.window.blockTableView.model.text(index.row(), 2))
 
     def getPath(self, value):
         """
@@ -303,18 +431,17 @@ class DocumentWindow(QMainWindow):
         if self.saveWarning(): # ask the user if they want to save 
             self.doc = Document()  #  new document object
             # copy this object as reference to check against on quitting
-            self.lastDoc = copy(self.doc)
+            self.lastDoc = deepcopy(self.doc)
             #  reset file path (this document hasn't been saved yet)
             self.currentFilePath = None
-            # new renderer
-            self.renderer = Renderer(self.doc, self.style)
             self.UIInitDocument()
+            self.history.clear(self.doc)
             self.updatePreview()
 
     def menuFileOpenAction(self):
         if self.saveWarning(): # ask the user if they want to save 
             filePath = QFileDialog.getOpenFileName(self.window.tabWidget, 'Open file', self.getPath(
-                "workingPath"), "Chordsheet Markup Language files (*.xml *.cml);;Chordsheet Macro files (*.cma)")[0]
+                "workingPath"), "Chordsheet Markup Language files (*.xml *.cml);;Chordsheet Macro files (*.cma);;ChordPro files (*.cho *.chopro *.chordpro *.crd *.pro)")[0]
             if filePath:
                 self.openFile(filePath)
 
@@ -328,12 +455,15 @@ class DocumentWindow(QMainWindow):
         
         if fileExt == ".cma":
             self.doc.loadCSMacro(self.currentFilePath)
+        elif fileExt in chordProExtensions:
+            self.doc.loadChordPro(self.currentFilePath)
         else: # if fileExt in [".xml", ".cml"]:
             self.doc.loadXML(self.currentFilePath)
             
-        self.lastDoc = copy(self.doc)
+        self.lastDoc = deepcopy(self.doc)
         self.setPath("workingPath", self.currentFilePath)
         self.UIInitDocument()
+        self.history.clear(self.doc)
         self.updatePreview()
 
     def menuFileSaveAction(self):
@@ -341,8 +471,8 @@ class DocumentWindow(QMainWindow):
 
         fileExt = os.path.splitext(self.currentFilePath)[1].lower()
 
-        if self.currentFilePath and fileExt != ".cma":
-            # Chordsheet Macro files can't be saved at this time
+        if self.currentFilePath and fileExt != ".cma" and fileExt not in chordProExtensions:
+            # Chordsheet Macro and ChordPro files can't be saved at this time
             self.saveFile(self.currentFilePath)
         else:
             filePath = QFileDialog.getSaveFileName(self.window.tabWidget, 'Save file', self.getPath(
@@ -371,7 +501,7 @@ class DocumentWindow(QMainWindow):
         else: # if fileExt in [".xml", ".cml"]:
             self.doc.saveXML(self.currentFilePath)
             
-        self.lastDoc = copy(self.doc)
+        self.lastDoc = deepcopy(self.doc)
         self.setPath("workingPath", self.currentFilePath)
         self.updateTitleBar()  # as we may have a new filename
 
@@ -381,7 +511,10 @@ class DocumentWindow(QMainWindow):
         filePath = QFileDialog.getSaveFileName(self.window.tabWidget, 'Save file', self.getPath(
             "lastExportPath"), "PDF files (*.pdf)")[0]
         if filePath:
-            self.renderer.savePDF(filePath)
+            # the preview has just rendered this, so it comes straight from the cache
+            pdf, key = self.getRenderCache().render(self.doc, self.style)
+            with open(filePath, 'wb') as f:
+                f.write(pdf)
             self.setPath("lastExportPath", filePath)
 
     def menuFilePrintAction(self):
@@ -399,16 +532,21 @@ class DocumentWindow(QMainWindow):
         AboutDialog()
 
     def menuEditUndoAction(self):
-        try:
-            QApplication.focusWidget().undo()  # see if the built in widget supports it
-        except Exception:
-            pass  #  if not just fail silently
+        focusWidget = QApplication.focusWidget()
+        # let a line edit undo its own typing first, then undo changes to the document
+        if isinstance(focusWidget, QLineEdit) and focusWidget.isUndoAvailable():
+            focusWidget.undo()
+        else:
+            self.recordHistory()  # catch any changes that haven't been recorded yet
+            self.restoreSnapshot(self.history.undo())
 
     def menuEditRedoAction(self):
-        try:
-            QApplication.focusWidget().redo()
-        except Exception:
-            pass
+        focusWidget = QApplication.focusWidget()
+        if isinstance(focusWidget, QLineEdit) and focusWidget.isRedoAvailable():
+            focusWidget.redo()
+        else:
+            self.recordHistory()
+            self.restoreSnapshot(self.history.redo())
 
     def menuEditCutAction(self):
         try:
@@ -428,6 +566,28 @@ class DocumentWindow(QMainWindow):
         except Exception:
             pass
 
+    def menuEditTransposeAction(self):
+        """
+        Transpose every chord in the document by a number of semitones chosen by the user.
+        """
+        semitones, ok = QInputDialog.getInt(
+            self, "Transpose", "Semitones to transpose by (negative for down):", 0, -11, 11)
+        if not ok or not semitones:
+            return
+        from chordsheet.transpose import transposedCopy
+
+        self.recordHistory()
+        sectionName = self.currentSection.name if self.currentSection else None
+        # new objects rather than changing the old ones, so the undo history is left intact
+        transposed = transposedCopy(self.doc, semitones)
+        self.doc.chordList = transposed.chordList
+        self.doc.sectionList = transposed.sectionList
+        self.UIInitDocument()
+        if sectionName in self.sectionDict:
+            self.window.blockSectionComboBox.setCurrentText(sectionName)
+        self.dirtyFields = set()
+        self.generateAction()
+
     def saveWarning(self):
         """
         Function to check if the document has unsaved data in it and offer to save it.
@@ -501,41 +661,33 @@ class DocumentWindow(QMainWindow):
 
     def removeChordAction(self):
         if self.window.chordTableView.selectionModel().hasSelection():  #  check for selection
-            self.updateChords()
-
             row = self.window.chordTableView.selectionModel().currentIndex().row()
-            oldName = self.window.chordTableView.model.item(row, 0).text()
-            self.doc.chordList.pop(row)
+            oldChord = self.doc.chordList[row]
+            self.window.chordTableView.model.removeRows(row, 1)
 
-            self.window.chordTableView.populate(self.doc.chordList)
             # remove the chord if any of the blocks have it attached
-            for s in self.doc.sectionList:
-                    for b in s.blockList:
-                        if b.chord:
-                            if b.chord.name == oldName:
-                                b.chord = None
-            self.window.blockTableView.populate(self.currentSection.blockList)
+            self.replaceBlockChords(oldChord, None)
             self.clearChordLineEdits()
             self.updateChordDict()
+        self.recordHistory()
 
     def addChordAction(self):
         success = False  # initialise
-        self.updateChords()
 
         cName = parseName(self.window.chordNameLineEdit.text())
         if cName:
-            self.doc.chordList.append(Chord(cName))
+            newChord = Chord(cName)
             if self.window.guitarVoicingLineEdit.text() or self.window.pianoVoicingLineEdit.text():
                 if self.window.guitarVoicingLineEdit.text():
                     try:
-                        self.doc.chordList[-1].voicings['guitar'] = parseFingering(
+                        newChord.voicings['guitar'] = parseFingering(
                             self.window.guitarVoicingLineEdit.text(), 'guitar')
                         success = True  #  chord successfully parsed
                     except Exception:
                         VoicingWarningMessageBox().exec()  # Voicing is malformed,  warn user
                 if self.window.pianoVoicingLineEdit.text():
                     try:
-                        self.doc.chordList[-1].voicings['piano'] = parseFingering(
+                        newChord.voicings['piano'] = parseFingering(
                             self.window.pianoVoicingLineEdit.text(), 'piano')
                         success = True  #  chord successfully parsed
                     except Exception:
@@ -546,30 +698,31 @@ class DocumentWindow(QMainWindow):
             ChordNameWarningMessageBox().exec()  # Chord has no name, warn user
 
         if success == True:  # if chord was parsed properly
-            self.window.chordTableView.populate(self.doc.chordList)
+            self.window.chordTableView.model.appendItem(newChord)
             self.clearChordLineEdits()
             self.updateChordDict()
+        self.recordHistory()
 
     def updateChordAction(self):
         success = False  # see comments above
         if self.window.chordTableView.selectionModel().hasSelection():  #  check for selection
-            self.updateChords()
             row = self.window.chordTableView.selectionModel().currentIndex().row()
-            oldName = self.window.chordTableView.model.item(row, 0).text()
+            oldChord = self.doc.chordList[row]
             cName = parseName(self.window.chordNameLineEdit.text())
             if cName:
-                self.doc.chordList[row].name = cName
+                # the edited chord is a new object, keeping any voicing that isn't re-entered
+                newChord = Chord(cName, **oldChord.voicings)
                 if self.window.guitarVoicingLineEdit.text() or self.window.pianoVoicingLineEdit.text():
                     if self.window.guitarVoicingLineEdit.text():
                         try:
-                            self.doc.chordList[row].voicings['guitar'] = parseFingering(
+                            newChord.voicings['guitar'] = parseFingering(
                                 self.window.guitarVoicingLineEdit.text(), 'guitar')
                             success = True  #  chord successfully parsed
                         except Exception:
                             VoicingWarningMessageBox().exec()  # Voicing is malformed,  warn user
                     if self.window.pianoVoicingLineEdit.text():
                         try:
-                            self.doc.chordList[row].voicings['piano'] = parseFingering(
+                            newChord.voicings['piano'] = parseFingering(
                                 self.window.pianoVoicingLineEdit.text(), 'piano')
                             success = True  #  chord successfully parsed
                         except Exception:
@@ -580,69 +733,69 @@ class DocumentWindow(QMainWindow):
                 ChordNameWarningMessageBox().exec()
 
             if success == True:
+                self.window.chordTableView.model.replaceItem(row, newChord)
                 self.updateChordDict()
-                self.window.chordTableView.populate(self.doc.chordList)
-                # update the names of chords in all blocklists in case they've already been used
-                for s in self.doc.sectionList:
-                    for b in s.blockList:
-                        if b.chord:
-                            if b.chord.name == oldName:
-                                b.chord.name = cName
-                if self.currentSection and self.currentSection.blockList:
-                    self.window.blockTableView.populate(self.currentSection.blockList)
+                # update the chords in all blocklists in case they've already been used
+                self.replaceBlockChords(oldChord, newChord)
                 self.clearChordLineEdits()
+        self.recordHistory()
+
+    def replaceBlockChords(self, oldChord, newChord):
+        """
+        Point every block using oldChord at newChord instead. Only those blocks are rebuilt,
+        and their sections are marked as changed.
+        """
+        for s in self.doc.sectionList:
+            for i, b in enumerate(s.blockList):
+                if b.chord and b.chord.name == oldChord.name:
+                    s.blockList[i] = Block(b.length, chord=newChord, notes=b.notes)
+                    self.dirtySections[id(s)] = s
+        self.window.blockTableView.model.refresh()
 
     def removeSectionAction(self):
         if self.window.sectionTableView.selectionModel().hasSelection():  #  check for selection
-            self.updateSections()
-
             row = self.window.sectionTableView.selectionModel().currentIndex().row()
-            self.doc.sectionList.pop(row)
+            self.window.sectionTableView.model.removeRows(row, 1)
 
-            self.window.sectionTableView.populate(self.doc.sectionList)
             self.clearSectionLineEdits()
             self.updateSectionDict()
+        self.recordHistory()
 
     def addSectionAction(self):
-        self.updateSections()
-
         sName = self.window.sectionNameLineEdit.text()
         if sName and sName not in [s.name for s in self.doc.sectionList]:
-            self.doc.sectionList.append(Section(name=sName))
-            self.window.sectionTableView.populate(self.doc.sectionList)
+            self.window.sectionTableView.model.appendItem(Section(name=sName))
             self.clearSectionLineEdits()
             self.updateSectionDict()
         else:
             # Section has no name or non unique, warn user
             SectionNameWarningMessageBox().exec()
+        self.recordHistory()
 
     def updateSectionAction(self):
         if self.window.sectionTableView.selectionModel().hasSelection():  #  check for selection
-            self.updateSections()
             row = self.window.sectionTableView.selectionModel().currentIndex().row()
 
             sName = self.window.sectionNameLineEdit.text()
             if sName and sName not in [s.name for s in self.doc.sectionList]:
-                self.doc.sectionList[row].name = sName
-                self.window.sectionTableView.populate(self.doc.sectionList)
+                oldSection = self.doc.sectionList[row]
+                self.dirtySections.pop(id(oldSection), None)
+                self.window.sectionTableView.model.replaceItem(
+                    row, Section(blockList=oldSection.blockList, name=sName))
                 self.clearSectionLineEdits()
                 self.updateSectionDict()
             else:
                 # Section has no name or non unique, warn user
                 SectionNameWarningMessageBox().exec()
+        self.recordHistory()
 
     def removeBlockAction(self):
         if self.window.blockTableView.selectionModel().hasSelection():  #  check for selection
-            self.updateBlocks(self.currentSection)
-
             row = self.window.blockTableView.selectionModel().currentIndex().row()
-            self.currentSection.blockList.pop(row)
-
-            self.window.blockTableView.populate(self.currentSection.blockList)
+            self.window.blockTableView.model.removeRows(row, 1)
+        self.recordHistory()
 
     def addBlockAction(self):
-        self.updateBlocks(self.currentSection)
-
         try:
             #  can the value entered for block length be cast as a float
             bLength = float(self.window.blockLengthLineEdit.text())
@@ -650,20 +803,18 @@ class DocumentWindow(QMainWindow):
             bLength = False
 
         if bLength:  # create the block
-            self.currentSection.blockList.append(Block(bLength,
-                                                       chord=self.chordDict[self.window.blockChordComboBox.currentText(
-                                                       )],
-                                                       notes=(self.window.blockNotesLineEdit.text() if not "" else None)))
-            self.window.blockTableView.populate(self.currentSection.blockList)
+            self.window.blockTableView.model.appendItem(Block(bLength,
+                                                              chord=self.chordDict[self.window.blockChordComboBox.currentText(
+                                                              )],
+                                                              notes=(self.window.blockNotesLineEdit.text() or None)))
             self.clearBlockLineEdits()
         else:
             # show warning that length was not entered or in wrong format
             LengthWarningMessageBox().exec()
+        self.recordHistory()
 
     def updateBlockAction(self):
         if self.window.blockTableView.selectionModel().hasSelection():  #  check for selection
-            self.updateBlocks(self.currentSection)
-
             try:
                 #  can the value entered for block length be cast as a float
                 bLength = float(self.window.blockLengthLineEdit.text())
@@ -672,31 +823,99 @@ class DocumentWindow(QMainWindow):
 
             row = self.window.blockTableView.selectionModel().currentIndex().row()
             if bLength:
-                self.currentSection.blockList[row] = (Block(bLength,
-                                                            chord=self.chordDict[self.window.blockChordComboBox.currentText(
-                                                            )],
-                                                            notes=(self.window.blockNotesLineEdit.text() if not "" else None)))
-                self.window.blockTableView.populate(
-                    self.currentSection.blockList)
+                self.window.blockTableView.model.replaceItem(row, Block(bLength,
+                                                                        chord=self.chordDict[self.window.blockChordComboBox.currentText(
+                                                                        )],
+                                                                        notes=(self.window.blockNotesLineEdit.text() or None)))
                 self.clearBlockLineEdits()
             else:
                 LengthWarningMessageBox().exec()
+        self.recordHistory()
 
     def generateAction(self):
-        self.updateDocument()
+        self.recordHistory()
         self.updatePreview()
 
-    def updatePreview(self):
+    def fitBeatWidthAction(self):
+        """
+        Set the beat width to the widest that fits the document on the number of pages chosen,
+        or on as few pages as possible, and show the result.
+        """
+        from chordsheet.fonts import registerFonts
+        from chordsheet.autofit import fitStyle
+
+        self.updateDocument()
+        registerFonts()
+        targetPages = self.window.fitPagesSpinBox.value() or None
+        fit = fitStyle(self.doc, self.style, targetPages=targetPages)
+        self.window.beatWidthLineEdit.setText(str(fit.style.unitWidth))
+        if targetPages and fit.pages > targetPages:
+            QMessageBox.warning(self, "Does not fit", "The document can't be fitted on {t} page(s). It takes at least {p}.".format(
+                t=targetPages, p=fit.pages), buttons=QMessageBox.Ok, defaultButton=QMessageBox.Ok)
+        self.generateAction()
+
+    def recordHistory(self, *args, live=False):
+        """
+        Bring the document up to date with the UI and add it to the undo history.
+        """
+        self.updateDocument(live)
+        self.history.record(self.doc)
+
+    def restoreSnapshot(self, snapshot):
+        """
+        Put the document back into the state held by an undo history snapshot and update the window.
+        """
+        if snapshot is None:
+            return
+        sectionName = self.currentSection.name if self.currentSection else None
+        self.history.apply(snapshot, self.doc)
+        self.UIInitDocument()
+        if sectionName in self.sectionDict:
+            self.window.blockSectionComboBox.setCurrentText(sectionName)
+        # the fields have just been filled from the document, so there's nothing to read back
+        self.dirtyFields = set()
+        self.documentChangedAction()
+
+    def updatePreview(self, live=False):
         """
-        Update the preview shown by rendering a new PDF and drawing it to the scroll area.
+        Update the preview shown by rendering a new PDF and drawing it to the scroll area. Live
+        previews happen while the user is typing, so if they fail it is only mentioned in the
+        status bar, rather than interrupting with a dialog.
         """
+        # anything pending is covered by this render
+        self.previewTimer.stop()
+        self.documentDirty = False
+
+        renderStart = time.perf_counter()
+        key = None
         try:
-            self.currentPreview = self.renderer.stream()
+            pdf, key = self.getRenderCache().render(self.doc, self.style)
+            self.currentPreview = io.BytesIO(pdf)
+            self.window.statusBar().showMessage(" ".join(self.inputProblems))
         except Exception:
-            QMessageBox.warning(self, "Preview failed", "Could not update the preview.",
-                                buttons=QMessageBox.Ok, defaultButton=QMessageBox.Ok)
+            if live:
+                self.window.statusBar().showMessage(" ".join(["Could not update the preview."] + self.inputProblems))
+            else:
+                QMessageBox.warning(self, "Preview failed", "Could not update the preview.",
+                                    buttons=QMessageBox.Ok, defaultButton=QMessageBox.Ok)
 
-        self.window.pdfArea.update(self.currentPreview)
+        self.window.pdfArea.update(self.currentPreview, key)
+        self.lastRenderTime = time.perf_counter() - renderStart
+
+    def getRenderCache(self):
+        """
+        Return the cache of rendered PDFs, creating it the first time. Recent PDFs are kept in
+        memory and the rest on disk, up to a configurable number of megabytes.
+        """
+        if self.renderCache is None:
+            from PyQt5.QtCore import QStandardPaths
+            from chordsheet.renderCache import RenderCache
+
+            cacheDir = QStandardPaths.writableLocation(QStandardPaths.CacheLocation)
+            self.renderCache = RenderCache(
+                directory=os.path.join(cacheDir, "renders") if cacheDir else None,
+                diskBytes=settings.value("renderCacheLimit", 256, type=int) * 1024 * 1024)
+        return self.renderCache
 
     def updateTitleBar(self):
         """
@@ -708,117 +927,111 @@ class DocumentWindow(QMainWindow):
         else:
             self.setWindowTitle(_version.appName)
 
-    def updateChords(self):
+    def readNumber(self, lineEdit, field, name, current, problems):
         """
-        Update the chord list by reading the table.
+        Return the number in a line edit, or current if it is empty. If it isn't a number,
+        current is returned too and the field is left to be read again next time.
         """
-        chordTableList = []
-        for i in range(self.window.chordTableView.model.rowCount()):
-            chordTableList.append(
-                Chord(parseName(self.window.chordTableView.model.item(i, 0).text()))),
-            if self.window.chordTableView.model.item(i, 1).text():
-                chordTableList[-1].voicings['guitar'] = parseFingering(
-                    self.window.chordTableView.model.item(i, 1).text(), 'guitar')
-            if self.window.chordTableView.model.item(i, 2).text():
-                chordTableList[-1].voicings['piano'] = parseFingering(
-                    self.window.chordTableView.model.item(i, 2).text(), 'piano')
-
-        self.doc.chordList = chordTableList
+        text = lineEdit.text()
+        if not text:
+            return current
+        try:
+            return float(text)
+        except ValueError:
+            problems.append("{n} must be a number.".format(n=name))
+            self.dirtyFields.add(field)
+            return current
 
-    def matchSection(self, nameToMatch):
+    def updateDocument(self, live=False):
         """
-        Given the name of a section, this function checks if it is already present in the document. 
-        If it is, it's returned. If not, a new section with the given name is returned.
+        Update the Document object by reading values from the UI. Only fields that have been
+        edited since the last update are read. Sections whose blocks have been edited are
+        replaced by new Section objects, and everything else keeps its identity.
+
+        Values that can't be used keep the last good one. Unless this is a live update, which
+        happens while the user is still typing, they are warned about with a dialog.
         """
-        section = None
-        for s in self.doc.sectionList:
-            if s.name == nameToMatch:
-                section = s
-                break
-        if section is None:
-            section = Section(name=nameToMatch)
-        return section
-
-    def updateSections(self):
-        """
-        Update the section list by reading the table
-        """
-        sectionTableList = []
-        for i in range(self.window.sectionTableView.model.rowCount()):
-            sectionTableList.append(self.matchSection(
-                self.window.sectionTableView.model.item(i, 0).text()))
-
-        self.doc.sectionList = sectionTableList
-
-    def updateBlocks(self, section):
-        """
-        Update the block list by reading the table.
-        """
-
-        blockTableList = []
-        for i in range(self.window.blockTableView.model.rowCount()):
-            blockLength = float(
-                self.window.blockTableView.model.item(i, 1).text())
-            blockChord = self.chordDict[(self.window.blockTableView.model.item(
-                i, 0).text() if self.window.blockTableView.model.item(i, 0).text() else "None")]
-            blockNotes = self.window.blockTableView.model.item(i, 2).text(
-            ) if self.window.blockTableView.model.item(i, 2).text() else None
-            blockTableList.append(
-                Block(blockLength, chord=blockChord, notes=blockNotes))
-
-        section.blockList = blockTableList
-
-    def updateDocument(self):
-        """
-        Update the Document object by reading values from the UI.
-        """
-        self.doc.title = self.window.titleLineEdit.text(
-        )  # Title can be empty string but not None
-        self.doc.subtitle = (self.window.subtitleLineEdit.text(
-        ) if self.window.subtitleLineEdit.text() else None)
-        self.doc.composer = (self.window.composerLineEdit.text(
-        ) if self.window.composerLineEdit.text() else None)
-        self.doc.arranger = (self.window.arrangerLineEdit.text(
-        ) if self.window.arrangerLineEdit.text() else None)
-        self.doc.tempo = (self.window.tempoLineEdit.text()
-                          if self.window.tempoLineEdit.text() else None)
-        self.doc.timeSignature = int(self.window.timeSignatureSpinBox.value(
-        )) if self.window.timeSignatureSpinBox.value() else self.doc.timeSignature
-
-        self.style.pageSize = pageSizeDict[self.pageSizeSelected]
-        self.style.unit = unitDict[self.unitSelected]
-        self.style.leftMargin = float(self.window.leftMarginLineEdit.text(
-        )) if self.window.leftMarginLineEdit.text() else self.style.leftMargin
-        self.style.rightMargin = float(self.window.rightMarginLineEdit.text(
-        )) if self.window.rightMarginLineEdit.text() else self.style.rightMargin
-        self.style.topMargin = float(self.window.topMarginLineEdit.text(
-        )) if self.window.topMarginLineEdit.text() else self.style.topMargin
-        self.style.bottomMargin = float(self.window.bottomMarginLineEdit.text(
-        )) if self.window.bottomMarginLineEdit.text() else self.style.bottomMargin
-        self.style.lineSpacing = float(self.window.lineSpacingDoubleSpinBox.value(
-        )) if self.window.lineSpacingDoubleSpinBox.value() else self.style.lineSpacing
-
-        # make sure the unit width isn't too wide to draw!
-        if self.window.beatWidthLineEdit.text():
-            if (self.style.pageSize[0] - 2 * self.style.leftMargin * mm) >= (float(self.window.beatWidthLineEdit.text()) * 2 * self.doc.timeSignature * mm):
-                self.style.unitWidth = float(
-                    self.window.beatWidthLineEdit.text())
+        dirty = self.dirtyFields
+        self.dirtyFields = set()
+        problems = []
+
+        if 'title' in dirty:
+            self.doc.title = self.window.titleLineEdit.text(
+            )  # Title can be empty string but not None
+        if 'subtitle' in dirty:
+            self.doc.subtitle = (self.window.subtitleLineEdit.text(
+            ) if self.window.subtitleLineEdit.text() else None)
+        if 'composer' in dirty:
+            self.doc.composer = (self.window.composerLineEdit.text(
+            ) if self.window.composerLineEdit.text() else None)
+        if 'arranger' in dirty:
+            self.doc.arranger = (self.window.arrangerLineEdit.text(
+            ) if self.window.arrangerLineEdit.text() else None)
+        if 'tempo' in dirty:
+            self.doc.tempo = (self.window.tempoLineEdit.text()
+                              if self.window.tempoLineEdit.text() else None)
+        if 'timeSignature' in dirty:
+            self.doc.timeSignature = int(self.window.timeSignatureSpinBox.value(
+            )) if self.window.timeSignatureSpinBox.value() else self.doc.timeSignature
+
+        if 'pageSize' in dirty:
+            self.style.pageSize = pageSizeDict[self.pageSizeSelected]
+        if 'unit' in dirty:
+            self.style.unit = unitDict[self.unitSelected]
+        if 'leftMargin' in dirty:
+            self.style.leftMargin = self.readNumber(
+                self.window.leftMarginLineEdit, 'leftMargin', "Left margin", self.style.leftMargin, problems)
+        if 'rightMargin' in dirty:
+            self.style.rightMargin = self.readNumber(
+                self.window.rightMarginLineEdit, 'rightMargin', "Right margin", self.style.rightMargin, problems)
+        if 'topMargin' in dirty:
+            self.style.topMargin = self.readNumber(
+                self.window.topMarginLineEdit, 'topMargin', "Top margin", self.style.topMargin, problems)
+        if 'bottomMargin' in dirty:
+            self.style.bottomMargin = self.readNumber(
+                self.window.bottomMarginLineEdit, 'bottomMargin', "Bottom margin", self.style.bottomMargin, problems)
+        if 'lineSpacing' in dirty:
+            self.style.lineSpacing = float(self.window.lineSpacingDoubleSpinBox.value(
+            )) if self.window.lineSpacingDoubleSpinBox.value() else self.style.lineSpacing
+
+        # make sure the unit width isn't too wide to draw! This depends on the page and time signature too.
+        # Measured the same way as the layout and autofit, so a fitted width always passes
+        if dirty & {'unitWidth', 'unit', 'pageSize', 'leftMargin', 'rightMargin', 'timeSignature'} and \
+                self.window.beatWidthLineEdit.text():
+            from chordsheet.autofit import beatsPerLine
+            from chordsheet.render import availableWidth
+
+            unitWidth = self.readNumber(
+                self.window.beatWidthLineEdit, 'unitWidth', "Beat width", None, problems)
+            if unitWidth is None:  # not a number, which has been reported
+                unitWidth = self.style.unitWidth
+            elif unitWidth > 0 and beatsPerLine(self.style, self.doc.timeSignature, unitWidth) > 0:
+                self.style.unitWidth = unitWidth
             else:
-                maxBeatWidth = (
-                    self.style.pageSize[0] - 2 * self.style.leftMargin * mm) / (2 * self.doc.timeSignature * mm)
-                QMessageBox.warning(self, "Out of range", "Beat width is out of range. It can be a maximum of {}.".format(
-                    maxBeatWidth), buttons=QMessageBox.Ok, defaultButton=QMessageBox.Ok)
-
-        # update chords, sections, blocks
-        self.updateChords()
-        self.updateSections()
-        if self.currentSection:
-            self.updateBlocks(self.currentSection)
-
-        self.style.font = (
-            'FreeSans' if self.style.useIncludedFont else 'HelveticaNeue')
+                # rounded down, so the width suggested does fit
+                maxBeatWidth = int(10 * availableWidth(self.style) / (2 * self.doc.timeSignature * self.style.unit)) / 10
+                problems.append("Beat width is out of range. It can be a maximum of {}.".format(maxBeatWidth))
+                self.dirtyFields.add('unitWidth')
+
+        if 'font' in dirty:
+            self.style.font = (
+                'FreeSans' if self.style.useIncludedFont else 'HelveticaNeue')
         # something for the font box here
 
+        for i, s in enumerate(self.doc.sectionList):
+            if id(s) in self.dirtySections:
+                newSection = Section(blockList=s.blockList, name=s.name)
+                self.doc.sectionList[i] = newSection
+                self.sectionDict[s.name] = newSection
+                if self.currentSection is s:
+                    self.currentSection = newSection
+        self.dirtySections = {}
+
+        self.inputProblems = problems
+        if problems and not live:
+            QMessageBox.warning(self, "Invalid value", "\n".join(problems),
+                                buttons=QMessageBox.Ok, defaultButton=QMessageBox.Ok)
+
 
 class GuitarDialog(QDialog):
     """
@@ -828,15 +1041,10 @@ class GuitarDialog(QDialog):
 
     def __init__(self):
         super().__init__()
-        self.UIFileLoader(
-            str(os.path.join(scriptDir, 'ui', 'guitardialog.ui')))
+        self.UIFileLoader('guitardialog')
 
-    def UIFileLoader(self, ui_file):
-        ui_file = QFile(ui_file)
-        ui_file.open(QFile.ReadOnly)
-
-        self.dialog = uic.loadUi(ui_file)
-        ui_file.close()
+    def UIFileLoader(self, name):
+        self.dialog = loadUi(name, QDialog)
 
     def getVoicing(self):
         """
@@ -862,7 +1070,7 @@ class AboutDialog(QDialog):
 
     def __init__(self):
         super().__init__()
-        self.UIFileLoader(str(os.path.join(scriptDir, 'ui', 'aboutdialog.ui')))
+        self.UIFileLoader('aboutdialog')
 
         icon = QImage(str(os.path.join(scriptDir, 'ui', 'icon.png')))
         self.dialog.iconLabel.setPixmap(QPixmap.fromImage(icon).scaled(self.dialog.iconLabel.width(
@@ -872,12 +1080,8 @@ class AboutDialog(QDialog):
 
         self.dialog.exec()
 
-    def UIFileLoader(self, ui_file):
-        ui_file = QFile(ui_file)
-        ui_file.open(QFile.ReadOnly)
-
-        self.dialog = uic.loadUi(ui_file)
-        ui_file.close()
+    def UIFileLoader(self, name):
+        self.dialog = loadUi(name, QDialog)
 
 
 class UnsavedMessageBox(QMessageBox):
@@ -982,14 +1186,20 @@ class LengthWarningMessageBox(QMessageBox):
 
 
 if __name__ == '__main__':
+    if os.environ.get('CHORDSHEET_MEMORY_PROFILE'):
+        from chordsheet.memoryProfile import profileFromEnvironment
+        profileFromEnvironment()
+
     app = QApplication(sys.argv)
 
     d = Document()
     s = Style()
 
     # pass first argument as filename
-    w = DocumentWindow(d, s, filename=(
-        sys.argv[1] if len(sys.argv) > 1 else None))
+    w = DocumentWindow(d, s)
     w.show()
+    # open the file once the window is up, so it appears straight away
+    if len(sys.argv) > 1:
+        QTimer.singleShot(0, partial(w.openStartupFile, sys.argv[1]))
 
     sys.exit(app.exec_())
@@ -10,7 +10,7 @@ a = Analysis(['gui.py'],
                 ('fonts', 'fonts'),
                 ('ui', 'ui')
 	     ],
-             hiddenimports=[],
+             hiddenimports=['chordsheet.forms.mainwindow', 'chordsheet.forms.guitardialog', 'chordsheet.forms.aboutdialog'],
              hookspath=[],
              runtime_hooks=[],
              excludes=[],
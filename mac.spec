@@ -13,7 +13,7 @@ a = Analysis(['/Users/ivan/Code/chordsheet/gui.py'],
                 ('fonts', 'fonts'),
                 ('ui', 'ui')
              ],
-             hiddenimports=[],
+             hiddenimports=['chordsheet.forms.mainwindow', 'chordsheet.forms.guitardialog', 'chordsheet.forms.aboutdialog'],
              hookspath=[],
              runtime_hooks=[],
              excludes=[],
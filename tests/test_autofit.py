@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Fitting the beat width to a page count: the candidates tried, and the fit landing on its target.
+"""
+
+import os
+import glob
+import unittest
+
+from chordsheet.document import Document, Style
+from chordsheet.render import Renderer
+from chordsheet.fonts import registerFonts
+from chordsheet.autofit import fitStyle, candidateWidths, beatsPerLine, tightenedStyles, minMargin
+
+rootDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+examples = sorted(glob.glob(os.path.join(rootDir, 'examples', '*.xml')))
+
+# long enough for the time limit never to be what stops a search
+timeLimit = 60
+
+
+def pages(document, style):
+    return Renderer(document, style).paginate().pages
+
+
+class CandidateTest(unittest.TestCase):
+    def test_widths(self):
+        style = Style().snapshot()
+        for timeSignature in (2, 3, 4, 6):
+            with self.subTest(timeSignature=timeSignature):
+                widths = candidateWidths(style, timeSignature)
+                self.assertEqual(widths, sorted(widths, reverse=True))
+                self.assertGreaterEqual(widths[-1], 5)
+                beats = [beatsPerLine(style, timeSignature, w) for w in widths]
+                # one width for each number of bars on a line, each as wide as it can be
+                self.assertEqual(beats, [2 * timeSignature * bars for bars in range(1, len(widths) + 1)])
+                for width, n in zip(widths, beats):
+                    self.assertLess(beatsPerLine(style, timeSignature, round(width + 0.1, 1)), n)
+
+    def test_width_limits(self):
+        style = Style().snapshot()
+        widths = candidateWidths(style, 4, minWidth=6, maxWidth=12)
+        self.assertEqual(widths, [w for w in candidateWidths(style, 4) if 6 <= w <= 12])
+
+    def test_tightened_styles(self):
+        style = Style().snapshot()
+        self.assertEqual(tightenedStyles(style), [style])
+        styles = tightenedStyles(style, margins=True, lineSpacing=True)
+        self.assertEqual(styles[0], style)
+        self.assertEqual((styles[-1].leftMargin, styles[-1].lineSpacing), (minMargin, 1.0))
+
+
+class FitTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        registerFonts()
+
+    def test_target(self):
+        for path in examples:
+            document = Document.newFromFile(path)
+            style = Style().snapshot()
+            widths = candidateWidths(style, document.timeSignature)
+            counts = [pages(document, style.replace(unitWidth=w)) for w in widths]
+            for target in range(1, max(counts) + 1):
+                with self.subTest(path=os.path.basename(path), target=target):
+                    fit = fitStyle(document, Style(), target, timeLimit=timeLimit)
+                    self.assertEqual(fit.pages, pages(document, fit.style))
+                    if min(counts) > target:
+                        # out of reach, so the fewest pages found
+                        self.assertEqual(fit.pages, min(counts))
+                        continue
+                    self.assertLessEqual(fit.pages, target)
+                    # and the widest width that does it
+                    index = widths.index(fit.style.unitWidth)
+                    self.assertTrue(index == 0 or counts[index - 1] > target)
+
+    def test_fewest_pages(self):
+        for path in examples:
+            with self.subTest(path=os.path.basename(path)):
+                document = Document.newFromFile(path)
+                style = Style().snapshot()
+                fewest = min(pages(document, style.replace(unitWidth=w))
+                             for w in candidateWidths(style, document.timeSignature))
+                fit = fitStyle(document, Style(), timeLimit=timeLimit)
+                self.assertEqual(fit.pages, fewest)
+                self.assertGreater(fit.evaluations, 0)
+
+    def test_tightening(self):
+        document = Document.newFromFile(os.path.join(rootDir, 'examples', 'ahlong.xml'))
+        style = Style(leftMargin=30, rightMargin=30, topMargin=40, bottomMargin=40, lineSpacing=2)
+        loose = fitStyle(document, style, 1, timeLimit=timeLimit)
+        tight = fitStyle(document, style, 1, margins=True, lineSpacing=True, timeLimit=timeLimit)
+        self.assertLess(tight.pages, loose.pages)
+        self.assertEqual(tight.pages, pages(document, tight.style))
+        # margins left alone unless asked for
+        self.assertEqual(loose.style.leftMargin, 30)
+
+    def test_no_candidates(self):
+        document = Document.newFromFile(os.path.join(rootDir, 'examples', 'example.xml'))
+        fit = fitStyle(document, Style(unitWidth=10), 1, minWidth=500, timeLimit=timeLimit)
+        self.assertEqual(fit.style.unitWidth, 10)
+        self.assertEqual(fit.pages, pages(document, Style(unitWidth=10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Reading and writing ChordPro: lyric lines, grids, chord definitions and files with several songs.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from chordsheet.document import Document
+from chordsheet.chordpro import (iterChordPro, iterChordProFile, documentToChordPro, importChordPro,
+                                 saveChordPro)
+
+gridSong = """{title: Grid}
+{time: 4/4}
+{start_of_grid: shape="1+4x2+4" label="Intro"}
+A    || G7 . | % | C~F . | G . :|| repeat 2
+     | Am . | / . | N.C. . | D7 Em |
+{end_of_grid}
+{sog}
+| C D E | F | % |
+{eog}
+{start_of_grid}
+Coda | C | G D | x2
+{end_of_grid}
+"""
+
+definitions = """{title: Voicings}
+{define: Am base-fret 1 frets x 0 2 2 1 0}
+{define: D/F# base-fret 5 frets 1 3 3 2 1 1}
+{define: G frets 3 2 0 0 N 3}
+{chord: E7 keys 0 4 7 10}
+{define: Bb keys 0 4 7}
+{define: C7 keys 0 4 7 10}
+[Am]one [E7]two [D/F#]three [G]four [Bb]five [C7]six
+"""
+
+songbook = """{title: One}
+[C]one [G]two
+
+{new_song}
+{title: Two}
+{time: 3/4}
+[Am]three
+{ns}
+{t: Three}
+{start_of_chorus: label="Refrain"}
+{comment: softly}
+[F]four [*riff] [N.C.]five
+{end_of_chorus}
+"""
+
+
+def read(text, **kwargs):
+    return list(iterChordPro(text.splitlines(), **kwargs))
+
+
+def blocks(section):
+    return [(b.chord.name if b.chord is not None else None, b.length) for b in section.blockList]
+
+
+class ChordProReadTest(unittest.TestCase):
+    def test_grid_shape_and_margins(self):
+        intro = read(gridSong)[0].sectionList[0]
+        self.assertEqual(intro.name, "Intro")
+        # the left margin (A) and right margin (repeat 2) are left out, and the shape gives
+        # two cells to a bar, so each is two beats
+        self.assertEqual(blocks(intro)[:2], [('G7', 4), ('G7', 4)])
+        self.assertEqual(blocks(intro)[-2:], [('D7', 2), ('Em', 2)])
+
+    def test_grid_without_shape(self):
+        grid, coda = read(gridSong)[0].sectionList[1:]
+        # each bar is shared between its cells
+        self.assertEqual(blocks(grid), [('C', 4/3), ('D', 4/3), ('E', 4/3), ('F', 4), ('F', 4)])
+        # words outside the bars that aren't chords are margins
+        self.assertEqual(blocks(coda), [('C', 4), ('G', 2), ('D', 2)])
+        self.assertEqual(grid.name, "Grid")
+
+    def test_grid_repeats_and_shared_cells(self):
+        intro = read(gridSong)[0].sectionList[0]
+        self.assertEqual(blocks(intro), [
+            ('G7', 4), ('G7', 4),  # % repeats the bar before
+            ('C', 1), ('F', 3),  # C~F shares the first cell, then . carries F on
+            ('G', 4),
+            ('Am', 8),  # / and . carry Am on through the next bar
+            (None, 4),
+            ('D7', 2), ('Em', 2),
+        ])
+
+    def test_define_frets(self):
+        chords = {c.name: c.voicings for c in read(definitions)[0].chordList}
+        self.assertEqual(chords['Am']['guitar'], ['x', '0', '2', '2', '1', '0'])
+        # counted from the base fret
+        self.assertEqual(chords['D/F♯']['guitar'], ['5', '7', '7', '6', '5', '5'])
+        self.assertEqual(chords['G']['guitar'], ['3', '2', '0', '0', 'x', '3'])
+
+    def test_define_keys(self):
+        chords = {c.name: c.voicings for c in read(definitions)[0].chordList}
+        self.assertEqual(chords['E7']['piano'], ['E', 'G♯', 'B', 'D'])
+        self.assertEqual(chords['B♭']['piano'], ['B♭', 'D', 'F'])
+        # the seventh of C7 is B♭, not A♯
+        self.assertEqual(chords['C7']['piano'], ['C', 'E', 'G', 'B♭'])
+
+    def test_new_song(self):
+        songs = read(songbook, lyrics=True)
+        self.assertEqual([s.title for s in songs], ["One", "Two", "Three"])
+        self.assertEqual([s.timeSignature for s in songs], [4, 3, 4])
+        self.assertEqual(blocks(songs[0].sectionList[0]), [('C', 4), ('G', 4)])
+        self.assertEqual([c.name for c in songs[1].chordList], ['Am'])
+        refrain = songs[2].sectionList[0]
+        self.assertEqual(refrain.name, "Refrain")
+        self.assertEqual([(b.chord.name if b.chord else None, b.notes) for b in refrain.blockList],
+                         [('F', 'softly four'), (None, 'five')])
+
+    def test_beats_per_chord(self):
+        self.assertEqual(blocks(read(songbook, beatsPerChord=2)[0].sectionList[0]), [('C', 2), ('G', 2)])
+
+    def test_empty(self):
+        self.assertEqual(read("{new_song}\n# nothing here\n{ns}\n"), [])
+
+    def test_round_trip(self):
+        # without the grid of triplets, as grids are written in quarter beats at the finest
+        for text in (gridSong.split('{sog}')[0], definitions, songbook):
+            for original in read(text, lyrics=True):
+                with self.subTest(title=original.title):
+                    copy, = read(documentToChordPro(original))
+                    self.assertEqual([blocks(s) for s in copy.sectionList], [blocks(s) for s in original.sectionList])
+                    self.assertEqual([(c.name, c.voicings) for c in copy.chordList],
+                                     [(c.name, c.voicings) for c in original.chordList])
+                    self.assertEqual([s.name for s in copy.sectionList], [s.name for s in original.sectionList])
+                    self.assertEqual([b.notes for s in copy.sectionList for b in s.blockList],
+                                     [b.notes for s in original.sectionList for b in s.blockList])
+
+
+class ChordProFileTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='chordsheet-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        return path
+
+    def test_import_one_song(self):
+        written = importChordPro(self.write('single.cho', gridSong))
+        self.assertEqual(written, [os.path.join(self.dir, 'single.xml')])
+        self.assertEqual(Document.newFromFile(written[0]).title, "Grid")
+
+    def test_import_several_songs(self):
+        outputDir = os.path.join(self.dir, 'out')
+        os.mkdir(outputDir)
+        written = importChordPro(self.write('book.cho', songbook), outputDir)
+        # the first song is renamed once a second one turns up
+        self.assertEqual(written, [os.path.join(outputDir, 'book-{n}.xml'.format(n=n)) for n in (1, 2, 3)])
+        self.assertEqual(sorted(os.listdir(outputDir)), ['book-1.xml', 'book-2.xml', 'book-3.xml'])
+        self.assertEqual([Document.newFromFile(p).title for p in written], ["One", "Two", "Three"])
+
+    def test_save_several_songs(self):
+        path = os.path.join(self.dir, 'saved.cho')
+        saveChordPro(iter(read(songbook)), path)
+        self.assertEqual([d.title for d in iterChordProFile(path)], ["One", "Two", "Three"])
+        # only the first song is opened as a document
+        self.assertEqual(Document.newFromFile(path).title, "One")
+
+
+if __name__ == '__main__':
+    unittest.main()
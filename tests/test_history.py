@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+The undo history: stepping back and forward, forgetting old steps, and sharing what hasn't
+changed between snapshots.
+"""
+
+import unittest
+
+from chordsheet.document import Document, Section, Block, Chord
+from chordsheet.history import History
+
+
+def makeDocument():
+    c = Chord('C')
+    g = Chord('G')
+    return Document(chordList=[c, g], title="Song",
+                    sectionList=[Section([Block(4, chord=c), Block(4, chord=g)], name="Verse"),
+                                 Section([Block(8, chord=g)], name="Chorus")])
+
+
+def setTitle(history, doc, title):
+    doc.title = title
+    return history.record(doc)
+
+
+def addBlock(history, doc, index, block):
+    # sections are replaced rather than changed in place, as DocumentWindow.updateDocument does
+    old = doc.sectionList[index]
+    doc.sectionList[index] = Section(old.blockList + [block], name=old.name)
+    return history.record(doc)
+
+
+class HistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.doc = makeDocument()
+        self.history = History()
+        self.history.clear(self.doc)
+
+    def test_undo_redo_round_trip(self):
+        setTitle(self.history, self.doc, "Second")
+        addBlock(self.history, self.doc, 1, Block(2, chord=self.doc.chordList[0]))
+        self.assertEqual(len(self.doc.sectionList[1].blockList), 2)
+
+        self.history.apply(self.history.undo(), self.doc)
+        self.assertEqual(self.doc.title, "Second")
+        self.assertEqual(len(self.doc.sectionList[1].blockList), 1)
+
+        self.history.apply(self.history.undo(), self.doc)
+        self.assertEqual(self.doc.title, "Song")
+        self.assertFalse(self.history.canUndo())
+        self.assertIsNone(self.history.undo())
+
+        self.history.apply(self.history.redo(), self.doc)
+        self.history.apply(self.history.redo(), self.doc)
+        self.assertEqual(self.doc.title, "Second")
+        self.assertEqual([b.length for b in self.doc.sectionList[1].blockList], [8, 2])
+        self.assertFalse(self.history.canRedo())
+        self.assertIsNone(self.history.redo())
+
+    def test_unchanged_document_is_not_recorded(self):
+        self.assertIsNone(self.history.record(self.doc))
+        self.assertFalse(self.history.canUndo())
+
+    def test_new_edit_drops_redo(self):
+        setTitle(self.history, self.doc, "Second")
+        setTitle(self.history, self.doc, "Third")
+        self.history.apply(self.history.undo(), self.doc)
+        self.assertTrue(self.history.canRedo())
+
+        setTitle(self.history, self.doc, "Other")
+        self.assertFalse(self.history.canRedo())
+        self.assertEqual(self.history.totalSize, sum(s.size for s in self.history.undoStack))
+
+        self.history.apply(self.history.undo(), self.doc)
+        self.assertEqual(self.doc.title, "Second")
+
+    def test_max_steps(self):
+        self.history = History(maxSteps=3)
+        self.history.clear(self.doc)
+        for n in range(10):
+            setTitle(self.history, self.doc, str(n))
+
+        undone = []
+        while self.history.canUndo():
+            undone.append(self.history.apply(self.history.undo(), self.doc).title)
+        self.assertEqual(undone, ["8", "7", "6"])
+
+    def test_max_bytes(self):
+        self.history = History(maxBytes=0)
+        self.history.clear(self.doc)
+        for n in range(5):
+            addBlock(self.history, self.doc, 0, Block(1))
+        # the current state is always kept, however big
+        self.assertEqual(len(self.history.undoStack), 1)
+        self.assertFalse(self.history.canUndo())
+
+        self.history = History()
+        self.history.clear(self.doc)
+        sizes = [addBlock(self.history, self.doc, 0, Block(1)).size for n in range(5)]
+        self.history.maxBytes = self.history.totalSize - sizes[0]
+        self.history.trim()
+        self.assertEqual(len(self.history.undoStack), 5)
+        self.assertLessEqual(self.history.totalSize, self.history.maxBytes)
+
+    def test_unchanged_sections_are_shared(self):
+        first = self.history.undoStack[-1]
+        second = setTitle(self.history, self.doc, "Second")
+        self.assertIs(second.chordList, first.chordList)
+        self.assertIs(second.sectionList[0], first.sectionList[0])
+        self.assertIs(second.sectionList[1], first.sectionList[1])
+
+        third = addBlock(self.history, self.doc, 1, Block(2))
+        self.assertIs(third.sectionList[0], second.sectionList[0])
+        self.assertIsNot(third.sectionList[1], second.sectionList[1])
+        # the blocks that were already there are shared too, and only the new one costs anything
+        self.assertIs(third.sectionList[1].blockList[0], second.sectionList[1].blockList[0])
+        self.assertLess(third.size, first.size)
+
+    def test_undo_reuses_live_sections(self):
+        verse = self.doc.sectionList[0]
+        addBlock(self.history, self.doc, 1, Block(2))
+        self.history.apply(self.history.undo(), self.doc)
+        self.assertIs(self.doc.sectionList[0], verse)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Renders with invariant set must depend only on the document and the style.
+"""
+
+import os
+import sys
+import glob
+import unittest
+import subprocess
+
+from reportlab import rl_config
+
+from chordsheet.document import Document, Style
+from chordsheet.render import Renderer
+from chordsheet.fonts import registerFonts
+
+rootDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+examples = sorted(glob.glob(os.path.join(rootDir, 'examples', '*.xml')) +
+                  glob.glob(os.path.join(rootDir, 'examples', '*.cma')))
+
+
+def render(path, invariant=True):
+    return Renderer(Document.newFromFile(path), Style(), invariant).stream().getvalue()
+
+
+def renderInNewProcess(path):
+    return subprocess.run([sys.executable, '-m', 'chordsheet', 'render', '--invariant', '-o', '-', path],
+                          cwd=rootDir, capture_output=True, check=True).stdout
+
+
+class InvariantTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        registerFonts()
+
+    def setUp(self):
+        # the global setting must be off, or every render is invariant anyway
+        self.globalInvariant = rl_config.invariant
+        rl_config.invariant = 0
+
+    def tearDown(self):
+        rl_config.invariant = self.globalInvariant
+
+    def test_same_bytes_in_new_processes(self):
+        for path in examples:
+            with self.subTest(path=os.path.basename(path)):
+                self.assertEqual(renderInNewProcess(path), renderInNewProcess(path))
+
+    def test_same_bytes_after_other_documents(self):
+        first = {path: render(path) for path in examples}
+        # the other way round, so everything has been rendered before the second time
+        for path in reversed(examples):
+            with self.subTest(path=os.path.basename(path)):
+                self.assertEqual(render(path), first[path])
+
+    def test_same_bytes_as_new_process(self):
+        path = examples[0]
+        self.assertEqual(render(path), renderInNewProcess(path))
+
+    def test_not_invariant_by_default(self):
+        path = examples[0]
+        self.assertNotEqual(render(path, invariant=False), render(path))
+
+    def test_global_setting_still_applies(self):
+        path = examples[0]
+        rl_config.invariant = 1
+        self.assertEqual(render(path, invariant=False), render(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
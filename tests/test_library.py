@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+The song library: its database, bringing it up to date with the files, and searching it.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from chordsheet import library
+from chordsheet.library import Library, schemaVersion
+
+songs = {
+    'twofiveone.cma': """\\chordsheet 1
+\\title Two Five One
+\\composer Someone Else
+\\timesig 4
+\\chord Dm7
+\\chord G7
+\\chord Cmaj7
+\\chord A7
+\\section Turnaround
+Dm7,4 G7,4 Cmaj7,8 A7,4
+""",
+    'sharps.cma': """\\chordsheet 1
+\\title Sharp Keys
+\\composer Somebody
+\\timesig 3
+\\chord C#m7
+\\chord E
+\\chord A
+\\section Verse
+C#m7,3 E,3 A,6
+""",
+    'minor.cma': """\\chordsheet 1
+\\title Minor Turn
+\\composer Somebody
+\\timesig 4
+\\chord Cm7-5
+\\chord F7
+\\chord Bbm
+\\section Bridge
+Cm7-5,4 F7,4 Bbm,8
+""",
+}
+
+
+def titles(entries):
+    return [e.title for e in entries]
+
+
+class LibraryTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='chordsheet-test-')
+        self.songDir = os.path.join(self.dir, 'songs')
+        os.mkdir(self.songDir)
+        for name, text in songs.items():
+            self.write(name, text)
+        self.databasePath = os.path.join(self.dir, 'library.db')
+        self.library = Library(self.databasePath)
+        self.result = self.library.importFiles([self.songDir], jobs=1)
+
+    def tearDown(self):
+        self.library.close()
+        shutil.rmtree(self.dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.songDir, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_schema(self):
+        tables = {row[0] for row in self.library.connection.execute("SELECT name FROM sqlite_master")}
+        self.assertLessEqual({'songs', 'songChords', 'songProgressions', 'progressionGrams', 'songText'}, tables)
+        self.assertEqual(self.library.connection.execute("PRAGMA user_version").fetchone()[0], schemaVersion)
+
+    def test_old_schema_is_rebuilt(self):
+        self.library.connection.execute("PRAGMA user_version = {v}".format(v=schemaVersion - 1))
+        self.library.connection.commit()
+        self.library.close()
+        self.library = Library(self.databasePath)
+        self.assertEqual(len(self.library), 0)
+        self.assertEqual(self.library.connection.execute("PRAGMA user_version").fetchone()[0], schemaVersion)
+
+    def test_import(self):
+        self.assertEqual((self.result.added, self.result.updated, self.result.unchanged, self.result.errors),
+                         (3, 0, 0, []))
+        self.assertEqual(len(self.library), 3)
+        entry = self.library.get(os.path.join(self.songDir, 'twofiveone.cma'))
+        self.assertEqual((entry.title, entry.composer, entry.timeSignature), ("Two Five One", "Someone Else", 4))
+        self.assertEqual([c.name for c in entry.document.chordList], ['Dm7', 'G7', 'Cmaj7', 'A7'])
+        self.assertEqual(titles(self.library.find(composer='somebody')), ["Minor Turn", "Sharp Keys"])
+
+    def test_unchanged_files_are_not_read(self):
+        with mock.patch.object(library, 'hashFile', wraps=library.hashFile) as hashFile:
+            result = self.library.importFiles([self.songDir], jobs=1)
+        self.assertEqual((result.added, result.updated, result.unchanged), (0, 0, 3))
+        hashFile.assert_not_called()
+
+    def test_touched_files_are_hashed(self):
+        path = os.path.join(self.songDir, 'sharps.cma')
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        with mock.patch.object(library, 'Document') as document:
+            result = self.library.importFiles([self.songDir], jobs=1)
+        self.assertEqual((result.added, result.updated, result.unchanged), (0, 0, 3))
+        document.newFromFile.assert_not_called()
+        # and the new time is remembered, so it isn't hashed again next time
+        with mock.patch.object(library, 'hashFile', wraps=library.hashFile) as hashFile:
+            self.library.importFiles([self.songDir], jobs=1)
+        hashFile.assert_not_called()
+
+    def test_changed_files_are_updated(self):
+        path = self.write('sharps.cma', songs['sharps.cma'].replace("Sharp Keys", "Sharper Keys"))
+        self.write('new.cma', songs['sharps.cma'].replace("Sharp Keys", "New"))
+        self.write('broken.cma', "\\chordsheet 1\n\\section Verse\nNoSuchChord,4\n")
+        result = self.library.importFiles([self.songDir], jobs=1)
+        self.assertEqual((result.added, result.updated, result.unchanged, len(result.errors)), (1, 1, 2, 1))
+        self.assertIn('broken.cma', result.errors[0])
+        self.assertEqual(self.library.get(path).title, "Sharper Keys")
+        self.assertEqual(len(self.library), 4)
+
+    def test_every_chordpro_song_is_imported(self):
+        path = self.write('book.cho', "{title: First}\n[C]a [G]b\n{new_song}\n{title: Second}\n[Dbm7]c [E]d\n"
+                                      "{new_song}\n{title: Third}\n[F]e\n")
+        result = self.library.importFiles([self.songDir], jobs=1)
+        self.assertEqual((result.added, result.unchanged), (1, 3))
+        self.assertEqual(len(self.library), 6)
+        self.assertEqual([(e.path, e.song) for e in self.library.find(title='second')], [(path, 2)])
+        self.assertEqual(self.library.get(path, 3).title, "Third")
+        self.assertEqual(titles(self.library.withChord('C#m7')), ["Second", "Sharp Keys"])
+
+        # songs taken out of the file are taken out of the library
+        self.write('book.cho', "{title: First}\n[C]a [G]b\n{new_song}\n{title: Other}\n[A]c\n")
+        result = self.library.importFiles([self.songDir], jobs=1)
+        self.assertEqual(result.updated, 1)
+        self.assertEqual(len(self.library), 5)
+        self.assertIsNone(self.library.get(path, 3))
+        self.assertEqual(titles(self.library.search('third')), [])
+        self.assertEqual(titles(self.library.withChord('C#m7')), ["Sharp Keys"])
+
+        self.assertTrue(self.library.remove(path))
+        self.assertEqual(len(self.library), 3)
+        self.assertNotIn(path, self.library.paths())
+
+    def test_prune(self):
+        os.remove(os.path.join(self.songDir, 'minor.cma'))
+        self.assertEqual(self.library.prune(), 1)
+        self.assertEqual(len(self.library), 2)
+        self.assertEqual(self.library.withChord('F7'), [])
+
+    def test_chord_search(self):
+        self.assertEqual(titles(self.library.withChord('Dbm7')), ["Sharp Keys"])
+        self.assertEqual(titles(self.library.withChord('C♯-7')), ["Sharp Keys"])
+        self.assertEqual(self.library.withChord('Dbm7', enharmonic=False), [])
+        self.assertEqual(titles(self.library.withChord('C#m7', enharmonic=False)), ["Sharp Keys"])
+        self.assertEqual(titles(self.library.withChord('A')), ["Sharp Keys"])
+
+    def test_progression_search(self):
+        for query in ['ii-V-I', 'ii V I', 'Dm7-G7-Cmaj7', 'Dm7 G7 Cmaj7', 'Em7 A7 Dmaj7', 'ii7–V7–I']:
+            with self.subTest(query=query):
+                matches = self.library.withProgression(query)
+                self.assertEqual([(m.entry.title, m.sectionIndex, m.block) for m in matches],
+                                 [("Two Five One", 0, 0)])
+                self.assertEqual(matches[0].section.name, "Turnaround")
+
+        self.assertEqual(self.library.withProgression('Em7 A7 Dmaj7', anyKey=False), [])
+        self.assertEqual(len(self.library.withProgression('Dm7 G7 Cmaj7', anyKey=False)), 1)
+        self.assertEqual(len(self.library.withProgression('Dm7 G7 Cmaj7', strict=True)), 1)
+        self.assertEqual(self.library.withProgression('Dm G C', strict=True), [])
+        self.assertEqual(titles(m.entry for m in self.library.withProgression('vi-I-IV')), ["Sharp Keys"])
+        self.assertEqual(self.library.withProgression('I-IV-V'), [])
+
+    def test_hyphenated_chord_names(self):
+        for query in ['Cm7-5 F7 Bbm', 'Cm7-5, F7, B♭m', 'Dm7-5 G7 Cm']:
+            with self.subTest(query=query):
+                self.assertEqual(titles(m.entry for m in self.library.withProgression(query, strict=True)),
+                                 ["Minor Turn"])
+
+    def test_text_search(self):
+        self.assertTrue(self.library.fullText)
+        # words match the start of words, so "turn" finds the Turnaround section too
+        self.assertEqual(set(titles(self.library.search('turn'))), {"Two Five One", "Minor Turn"})
+        self.assertEqual(titles(self.library.search('turn', limit=1)), titles(self.library.search('turn'))[:1])
+        self.assertEqual(titles(self.library.search('sharp verse')), ["Sharp Keys"])
+        self.assertEqual(titles(self.library.search('some"body')), [])
+        self.assertEqual(self.library.search('  '), [])
+
+
+class PlainTextLibraryTest(LibraryTest):
+    """
+    The same, for SQLite built without FTS5.
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(library, 'textSchema',
+                                    "CREATE VIRTUAL TABLE IF NOT EXISTS songText USING noSuchModule (title)")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+
+    def test_text_search(self):
+        self.assertFalse(self.library.fullText)
+        self.assertEqual(titles(self.library.search('turn')), ["Minor Turn", "Two Five One"])
+        self.assertEqual(titles(self.library.search('sharp verse')), ["Sharp Keys"])
+        self.assertEqual(titles(self.library.search('two', limit=0)), [])
+        self.assertEqual(self.library.search('  '), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
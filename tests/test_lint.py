@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Every problem the linter reports, in each format it reads, and the line it is reported on.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from chordsheet import lint
+from chordsheet.lint import lintFile, lintFiles, reportJSON
+
+goodXML = """<chordsheet>
+<title>Song</title>
+<timesignature>4</timesignature>
+<chords>
+<chord><name>C</name><voicing instrument="guitar">x,3,2,0,1,0</voicing></chord>
+<chord><name>G</name><voicing instrument="piano">G,B,D</voicing></chord>
+</chords>
+<section name="Verse">
+<block><length>4</length><chord>C</chord></block>
+<block><length>4</length><chord>G</chord></block>
+</section>
+</chordsheet>
+"""
+
+goodCMA = """\\chordsheet 1
+\\title Song
+\\timesig 4
+\\chord C guitar x32010
+\\chord G piano G,B,D
+\\section Verse
+C,4 G,4
+"""
+
+goodChordPro = """{title: Song}
+{time: 4/4}
+{define: C frets x 3 2 0 1 0}
+{start_of_verse}
+[C]one [G]two
+{end_of_verse}
+"""
+
+# code -> [(extension, text, [(line, severity, code)] for every problem in it)]
+cases = {
+    'syntax': [
+        ('.xml', goodXML.replace('</title>', '</titel>'), [(2, 'error', 'syntax')]),
+        # found where the mismatch shows, not where the tag was left open
+        ('.xml', goodXML.replace('</title>', ''), [(12, 'error', 'syntax')]),
+        ('.cho', goodChordPro.replace('{time: 4/4}', '{time: 4/4'), [(2, 'error', 'syntax')]),
+        ('.cho', goodChordPro.replace('[C]one', '[C]one [G'), [(5, 'error', 'syntax'),
+                                                               (5, 'warning', 'unknown-chord-name')]),
+    ],
+    'not-chordsheet': [
+        ('.xml', '<song>\n</song>\n', [(1, 'error', 'not-chordsheet')]),
+    ],
+    'bad-time-signature': [
+        ('.xml', goodXML.replace('<timesignature>4', '<timesignature>four'), [(3, 'error', 'bad-time-signature')]),
+        ('.xml', goodXML.replace('<timesignature>4', '<timesignature>0'), [(None, 'error', 'bad-time-signature')]),
+        ('.cma', goodCMA.replace('timesig 4', 'timesig four'), [(3, 'error', 'bad-time-signature')]),
+        ('.cho', goodChordPro.replace('4/4', 'common'), [(2, 'error', 'bad-time-signature')]),
+    ],
+    'missing-name': [
+        ('.xml', goodXML.replace('<name>G</name>', ''), [(6, 'error', 'missing-name'),
+                                                          (10, 'error', 'undefined-chord')]),
+        ('.cma', goodCMA.replace('\\chord G piano G,B,D', '\\chord  piano G,B,D'),
+         [(5, 'error', 'missing-name'), (7, 'error', 'undefined-chord')]),
+    ],
+    'bad-voicing': [
+        ('.xml', goodXML.replace('x,3,2,0,1,0', 'x,3,2,0'), [(5, 'error', 'bad-voicing')]),
+        ('.xml', goodXML.replace('x,3,2,0,1,0', 'x,3,2,0,1,?'), [(5, 'warning', 'bad-voicing')]),
+        ('.xml', goodXML.replace('G,B,D', 'G,B,Q'), [(6, 'warning', 'bad-voicing')]),
+        ('.xml', goodXML.replace(' instrument="piano"', ''), [(6, 'error', 'bad-voicing')]),
+        ('.cma', goodCMA.replace('x32010', 'x3201'), [(4, 'error', 'bad-voicing')]),
+        ('.cho', goodChordPro.replace('frets x 3 2 0 1 0', 'base-fret 3'), [(3, 'warning', 'bad-voicing')]),
+    ],
+    'unknown-instrument': [
+        ('.xml', goodXML.replace('"piano"', '"ukulele"'), [(6, 'warning', 'unknown-instrument')]),
+        ('.cma', goodCMA.replace('G piano', 'G banjo'), [(5, 'warning', 'unknown-instrument')]),
+    ],
+    'bad-length': [
+        ('.xml', goodXML.replace('<length>4</length><chord>G', '<length>long</length><chord>G'),
+         [(10, 'error', 'bad-length')]),
+        # blocks without a usable length aren't counted towards the bars as well
+        ('.xml', goodXML.replace('<length>4</length><chord>G', '<length>-4</length><chord>G'),
+         [(10, 'error', 'bad-length')]),
+        ('.xml', goodXML.replace('<length>4</length><chord>G', '<chord>G'), [(10, 'error', 'bad-length')]),
+        ('.cma', goodCMA.replace('G,4', 'G,0'), [(7, 'error', 'bad-length')]),
+    ],
+    'duplicate-chord': [
+        ('.xml', goodXML.replace('</chords>', '<chord><name>C</name></chord>\n</chords>'),
+         [(7, 'warning', 'duplicate-chord')]),
+        ('.cma', goodCMA.replace('\\section', '\\chord C\n\\section'), [(6, 'warning', 'duplicate-chord')]),
+    ],
+    'unknown-chord-name': [
+        ('.xml', goodXML.replace('<name>G</name>', '<name>Gxyz</name>').replace('<chord>G<', '<chord>Gxyz<'),
+         [(6, 'warning', 'unknown-chord-name')]),
+        ('.cma', goodCMA.replace('G piano', 'H piano').replace('G,4', 'H,4'),
+         [(5, 'warning', 'unknown-chord-name')]),
+        ('.cho', goodChordPro.replace('[G]', '[Gxyz]'), [(5, 'warning', 'unknown-chord-name')]),
+    ],
+    'empty-section': [
+        ('.xml', goodXML.replace('</chordsheet>', '<section name="Coda">\n</section>\n</chordsheet>'),
+         [(12, 'warning', 'empty-section')]),
+    ],
+    'undefined-chord': [
+        ('.xml', goodXML.replace('<chord>G</chord>', '<chord>Am</chord>'),
+         [(10, 'error', 'undefined-chord'), (6, 'warning', 'unused-chord')]),
+        ('.cma', goodCMA.replace('G,4', 'G,4\nAm,4 X,4'), [(8, 'error', 'undefined-chord')]),
+    ],
+    'incomplete-bar': [
+        ('.xml', goodXML.replace('<length>4</length><chord>G', '<length>3</length><chord>G'),
+         [(8, 'warning', 'incomplete-bar')]),
+        ('.cma', goodCMA.replace('G,4', 'G,4.5'), [(6, 'warning', 'incomplete-bar')]),
+    ],
+    'unused-chord': [
+        ('.xml', goodXML.replace('</chords>', '<chord><name>Am</name></chord>\n</chords>'),
+         [(7, 'warning', 'unused-chord')]),
+        ('.cma', goodCMA.replace('\\section', '\\chord Am\n\\section'), [(6, 'warning', 'unused-chord')]),
+    ],
+    'unknown-command': [
+        ('.cma', goodCMA.replace('\\title Song', '\\titel Song'), [(2, 'error', 'unknown-command')]),
+    ],
+    'bad-chord': [
+        ('.cma', goodCMA.replace('G piano G,B,D', 'G piano G,B,D alias'), [(5, 'warning', 'bad-chord')]),
+    ],
+    'bad-section': [
+        ('.cma', goodCMA.replace('\\section Verse\nC,4 G,4\n', '\\section Verse'),
+         [(6, 'error', 'bad-section'), (6, 'warning', 'empty-section'), (4, 'warning', 'unused-chord'),
+          (5, 'warning', 'unused-chord')]),
+    ],
+    'bad-block': [
+        ('.cma', goodCMA.replace('G,4', 'G,4\nC'), [(8, 'error', 'bad-block')]),
+    ],
+    'unclosed-environment': [
+        ('.cho', goodChordPro.replace('{end_of_verse}', ''), [(4, 'error', 'unclosed-environment')]),
+        ('.cho', goodChordPro.replace('{end_of_verse}', '{start_of_chorus}\n{end_of_chorus}'),
+         [(6, 'error', 'unclosed-environment')]),
+        ('.cho', goodChordPro.replace('{end_of_verse}', '{end_of_chorus}'), [(6, 'error', 'unclosed-environment')]),
+    ],
+    'unknown-directive': [
+        ('.cho', goodChordPro.replace('{time: 4/4}', '{tune: 4/4}'), [(2, 'warning', 'unknown-directive')]),
+    ],
+}
+
+
+class LintTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='chordsheet-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(data.encode('utf-8') if isinstance(data, str) else data)
+        return path
+
+    def problems(self, extension, text):
+        path = self.write('song' + extension, text)
+        problems = lintFile(path)
+        for p in problems:
+            self.assertEqual(p.path, path)
+        return [(p.line, p.severity, p.code) for p in problems]
+
+    def test_good_documents(self):
+        for extension, text in [('.xml', goodXML), ('.cma', goodCMA), ('.cho', goodChordPro)]:
+            with self.subTest(extension=extension):
+                self.assertEqual(self.problems(extension, text), [])
+
+    def test_every_code_is_tested(self):
+        with open(lint.__file__, encoding='utf-8') as f:
+            codes = set(re.findall(r"(?:error|warning), '([a-z-]+)'", f.read()))
+        self.assertEqual(codes - set(cases) - {'unreadable', 'internal'}, set())
+
+    def test_codes(self):
+        for code, examples in cases.items():
+            for n, (extension, text, expected) in enumerate(examples):
+                with self.subTest(code=code, example=n, extension=extension):
+                    self.assertEqual(self.problems(extension, text), expected)
+
+    def test_unreadable(self):
+        path = os.path.join(self.dir, 'missing.xml')
+        self.assertEqual([(p.line, p.code) for p in lintFile(path)], [(None, 'unreadable')])
+        self.assertEqual(self.problems('.cma', b'\\title \xff\n'), [(None, 'error', 'syntax')])
+
+    def test_internal(self):
+        # a failure inside the checks themselves is reported, not raised
+        with mock.patch.object(lint.Linter, 'checkParts', side_effect=ZeroDivisionError):
+            self.assertEqual(self.problems('.xml', goodXML), [(None, 'error', 'internal')])
+
+    def test_files(self):
+        self.write('good.xml', goodXML)
+        self.write('bad.cma', goodCMA.replace('\\title', '\\titel'))
+        self.write('notes.txt', "not a document")
+        files, problems = lintFiles([self.dir], jobs=1)
+        self.assertEqual(sorted(os.path.basename(f) for f in files), ['bad.cma', 'good.xml'])
+        self.assertEqual([p.code for p in problems], ['unknown-command'])
+        self.assertIn('"errors": 1', reportJSON(files, problems))
+        self.assertEqual(str(problems[0]), "{p}:2: error: command 'titel' not understood [unknown-command]".format(
+            p=os.path.join(self.dir, 'bad.cma')))
+
+
+if __name__ == '__main__':
+    unittest.main()
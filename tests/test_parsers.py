@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Chord symbol parsing: what each way of writing a chord is understood as.
+"""
+
+import unittest
+
+from chordsheet.parsers import parseChordSymbol, parseChordSymbols, parseName
+
+# name -> (root, quality, extensions, alterations, bass)
+symbols = {
+    'C': ('C', 'maj', (), (), None),
+    'Cmaj': ('C', 'maj', (), (), None),
+    'Cmaj7': ('C', 'maj', ('maj7',), (), None),
+    'CM7': ('C', 'maj', ('maj7',), (), None),
+    'Cma7': ('C', 'maj', ('maj7',), (), None),
+    'CΔ': ('C', 'maj', ('maj7',), (), None),
+    'Cm': ('C', 'min', (), (), None),
+    'Cmin': ('C', 'min', (), (), None),
+    'C-': ('C', 'min', (), (), None),
+    'C-7': ('C', 'min', ('7',), (), None),
+    'Cm(maj7)': ('C', 'min', ('maj7',), (), None),
+    'CmM7': ('C', 'min', ('maj7',), (), None),
+    'Cdim': ('C', 'dim', (), (), None),
+    'Co7': ('C', 'dim', ('7',), (), None),
+    'C°7': ('C', 'dim', ('7',), (), None),
+    'Cø': ('C', 'hdim', ('7',), (), None),
+    'Cø7': ('C', 'hdim', ('7',), (), None),
+    'Caug': ('C', 'aug', (), (), None),
+    'C+': ('C', 'aug', (), (), None),
+    'C5': ('C', 'power', (), (), None),
+    'Csus': ('C', 'sus4', (), (), None),
+    'Csus2': ('C', 'sus2', (), (), None),
+    'C7sus4': ('C', 'sus4', ('7',), (), None),
+    'C6': ('C', 'maj', ('6',), (), None),
+    'C6/9': ('C', 'maj', ('6/9',), (), None),
+    'C69': ('C', 'maj', ('6/9',), (), None),
+    'C9': ('C', 'maj', ('9',), (), None),
+    'C11': ('C', 'maj', ('11',), (), None),
+    'C13': ('C', 'maj', ('13',), (), None),
+    'Cadd9': ('C', 'maj', ('add9',), (), None),
+    'C(add9)': ('C', 'maj', ('add9',), (), None),
+    'C(omit3)': ('C', 'maj', ('omit3',), (), None),
+    'Cno3': ('C', 'maj', ('no3',), (), None),
+    'C7♯9': ('C', 'maj', ('7',), ('♯9',), None),
+    'C7#9': ('C', 'maj', ('7',), ('♯9',), None),
+    'C7+5': ('C', 'maj', ('7',), ('♯5',), None),
+    'C7(♭9,♯11)': ('C', 'maj', ('7',), ('♭9', '♯11'), None),
+    'C7alt': ('C', 'maj', ('7',), ('alt',), None),
+    'F♯m7♭5': ('F♯', 'min', ('7',), ('♭5',), None),
+    'C/E': ('C', 'maj', (), (), 'E'),
+    'Am7/G': ('A', 'min', ('7',), (), 'G'),
+    'B♭m7/A♭': ('B♭', 'min', ('7',), (), 'A♭'),
+    'Bbm7/Ab': ('B♭', 'min', ('7',), (), 'A♭'),
+    'E♭♭': ('E♭♭', 'maj', (), (), None),
+}
+
+# pairs of names for the same chord
+enharmonics = [
+    ('D♭m7', 'C♯m7'),
+    ('Dbm7', 'C#-7'),
+    ('B♭m7', 'A♯-7'),
+    ('G♭/B♭', 'F♯/A♯'),
+    ('E♯', 'F'),
+    ('C♭maj7', 'BΔ'),
+    ('E♭♭', 'D'),
+]
+
+# name -> the part that couldn't be understood, with root None if it wasn't a chord at all
+unparseable = {
+    '': (None, ''),
+    'H7': (None, 'H7'),
+    'N.C.': (None, 'N.C.'),
+    'x': (None, 'x'),
+    'Cxyz': ('C', 'xyz'),
+    'C3': ('C', '3'),
+    'C/X': ('C', '/X'),
+    'Cmaj7/': ('C', '/'),
+}
+
+
+class ParseChordSymbolTest(unittest.TestCase):
+    def test_symbols(self):
+        for name, expected in symbols.items():
+            with self.subTest(name=name):
+                symbol = parseChordSymbol(name)
+                self.assertEqual((symbol.root, symbol.quality, symbol.extensions, symbol.alterations,
+                                  symbol.bass), expected)
+                self.assertTrue(symbol.complete)
+
+    def test_enharmonics(self):
+        for first, second in enharmonics:
+            with self.subTest(first=first, second=second):
+                self.assertEqual(parseChordSymbol(first).key(), parseChordSymbol(second).key())
+        self.assertNotEqual(parseChordSymbol('Cm7').key(), parseChordSymbol('C♯m7').key())
+        self.assertNotEqual(parseChordSymbol('C/E').key(), parseChordSymbol('C').key())
+
+    def test_unparseable(self):
+        for name, (root, remainder) in unparseable.items():
+            with self.subTest(name=name):
+                symbol = parseChordSymbol(name)
+                self.assertEqual((symbol.root, symbol.remainder), (root, remainder))
+                self.assertFalse(symbol.complete)
+
+    def test_ascii_names_share_a_symbol(self):
+        self.assertIs(parseChordSymbol('Bbm7'), parseChordSymbol(parseName('Bbm7')))
+        self.assertEqual(parseChordSymbol('Bbm7').name, 'B♭m7')
+        self.assertEqual([s.name for s in parseChordSymbols(['C#', 'Db', 'C#'])], ['C♯', 'D♭', 'C♯'])
+
+    def test_cache_is_bounded(self):
+        self.assertIsNotNone(parseChordSymbol.cache_info().maxsize)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Reading progression queries, and the key-independent form progressions are searched in.
+"""
+
+import unittest
+
+from chordsheet.progressions import (splitQuery, parseProgression, progressionString, romanToName,
+                                     queryGrams)
+
+# query -> the chord names it is split into
+queries = {
+    'ii-V-I': ['ii', 'V', 'I'],
+    'ii–V–I': ['ii', 'V', 'I'],
+    'ii — V — I': ['ii', 'V', 'I'],
+    'Dm7 G7 Cmaj7': ['Dm7', 'G7', 'Cmaj7'],
+    'Dm7-G7-Cmaj7': ['Dm7', 'G7', 'Cmaj7'],
+    'Dm7, G7, Cmaj7': ['Dm7', 'G7', 'Cmaj7'],
+    # chord names with hyphens in are kept whole
+    'C-7 F7': ['C-7', 'F7'],
+    'Cm7-5 F7 B♭m': ['Cm7-5', 'F7', 'B♭m'],
+    'C7-9 Fmaj7': ['C7-9', 'Fmaj7'],
+    'C-7-F7': ['C', '7', 'F7'],
+}
+
+
+class ProgressionQueryTest(unittest.TestCase):
+    def test_split(self):
+        for query, names in queries.items():
+            with self.subTest(query=query):
+                self.assertEqual(splitQuery(query), names)
+
+    def test_roman_numerals(self):
+        self.assertEqual(romanToName('ii7'), 'Dm7')
+        self.assertEqual(romanToName('V7'), 'G7')
+        self.assertEqual(romanToName('♭VII'), 'A♯')
+        self.assertEqual(romanToName('iiø7'), 'Dø7')
+        self.assertEqual(romanToName('vii°'), 'B°')
+        self.assertIsNone(romanToName('Dm7'))
+
+    def test_same_shape_in_any_key(self):
+        strings = {progressionString(parseProgression(q)) for q in
+                   ['ii-V-I', 'Dm7 G7 Cmaj7', 'Em7-A7-Dmaj7', 'B♭m7 E♭7 A♭']}
+        self.assertEqual(strings, {'xm5M5M'})
+        self.assertEqual(queryGrams(parseProgression('ii-V-I')), ['m5M5M'])
+
+    def test_held_chords_count_once(self):
+        self.assertEqual(len(parseProgression('C C G G')), 2)
+
+    def test_bad_queries(self):
+        for query in ['C', 'C C', 'ii-X-I', 'C N.C. G', 'C-7-F7']:
+            with self.subTest(query=query):
+                with self.assertRaises(ValueError):
+                    parseProgression(query)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Laying documents out: chord charts split across pages, and paginate agreeing with a real render.
+"""
+
+import os
+import glob
+import collections
+import unittest
+from io import BytesIO
+from unittest import mock
+
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+from reportlab.platypus import BaseDocTemplate, PageTemplate
+
+from chordsheet import render, songbook
+from chordsheet.document import Document, Style, Chord, Block, Section
+from chordsheet.render import Renderer, GuitarChart, PianoChart, availableWidth, pageFrame
+from chordsheet.songbook import Songbook
+from chordsheet.fonts import registerFonts
+
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+rootDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+examples = sorted(glob.glob(os.path.join(rootDir, 'examples', '*.xml')) +
+                  glob.glob(os.path.join(rootDir, 'examples', '*.cma')))
+
+# plenty of chords without accidentals, so their names are easy to find in the PDF's text
+chordNames = [root + suffix for suffix in ('', 'm', '7', 'm7', 'maj7', 'sus4', '6', '9', 'dim', 'aug')
+              for root in 'CDEFGAB']
+
+
+def chartDocument(instruments=('guitar', 'piano')):
+    voicings = {'guitar': list('022100'), 'piano': ['C', 'E', 'G']}
+    chords = [Chord(name, **{i: voicings[i] for i in instruments}) for name in chordNames]
+    return Document(chordList=chords, title="Charts",
+                    sectionList=[Section([Block(4, chord=chords[0])], name="Verse")])
+
+
+def chartChords(chart):
+    if isinstance(chart, GuitarChart):
+        return [c.name for row in chart.rows for c in row]
+    return [c.name for row, width in chart.rows for c, drawing in row]
+
+
+class ChartSplitTest(unittest.TestCase):
+    def setUp(self):
+        self.style = Style()
+        self.chords = chartDocument().chordList
+        self.width = availableWidth(self.style)
+
+    def checkSplits(self, chart):
+        width, height = chart.wrap(self.width, 1000*mm)
+        rows = len(chart.rows)
+        self.assertGreater(rows, 2)
+        for fits in range(0, rows + 1):
+            with self.subTest(chart=type(chart).__name__, rows=fits):
+                parts = chart.split(self.width, chart.rowsHeight(fits) + 0.5)
+                if fits == 0:
+                    self.assertEqual(parts, [])
+                elif fits == rows:
+                    self.assertEqual(parts, [chart])
+                else:
+                    first, rest = parts
+                    first.wrap(self.width, 1000*mm)
+                    rest.wrap(self.width, 1000*mm)
+                    self.assertEqual(len(first.rows), fits)
+                    self.assertEqual(chartChords(first) + chartChords(rest), [c.name for c in self.chords])
+                    self.assertLessEqual(first.height, chart.rowsHeight(fits) + 0.5)
+
+    def test_guitar(self):
+        self.checkSplits(GuitarChart(self.style, self.chords))
+
+    def test_piano(self):
+        self.checkSplits(PianoChart(self.style, self.chords))
+
+
+class PaginateTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        registerFonts()
+
+    def test_charts_across_pages(self):
+        pagination = Renderer(chartDocument(), Style()).paginate()
+        charts = [p for p in pagination.placements if p.kind in ('GuitarChart', 'PianoChart')]
+        self.assertGreater(len({p.page for p in charts}), 1)
+        self.assertEqual(pagination.pages, max(p.page for p in pagination.placements))
+
+    @unittest.skipIf(fitz is None, "needs PyMuPDF")
+    def test_charts_lose_no_chords(self):
+        doc = chartDocument()
+        pdf = fitz.open(stream=Renderer(doc, Style()).stream().getvalue(), filetype='pdf')
+        self.assertGreater(pdf.page_count, 1)
+        self.assertEqual(pdf.page_count, Renderer(doc, Style()).paginate().pages)
+        words = collections.Counter(w[4] for page in pdf for w in page.get_text('words'))
+        # once in the guitar charts and once in the piano charts; plain letters name strings and keys too
+        for name in chordNames:
+            with self.subTest(name=name):
+                if len(name) == 1:
+                    self.assertGreaterEqual(words[name], 2)
+                else:
+                    self.assertEqual(words[name], 2)
+
+    @unittest.skipIf(fitz is None, "needs PyMuPDF")
+    def test_pages_match_a_render(self):
+        for path in examples:
+            for style in (Style(), Style(unitWidth=7, lineSpacing=1.5), Style(topMargin=40, bottomMargin=40)):
+                with self.subTest(path=os.path.basename(path), unitWidth=style.unitWidth):
+                    doc = Document.newFromFile(path)
+                    pdf = fitz.open(stream=Renderer(doc, style).stream().getvalue(), filetype='pdf')
+                    self.assertEqual(Renderer(doc, style).paginate().pages, pdf.page_count)
+
+    def test_sections_are_placed(self):
+        doc = Document.newFromFile(os.path.join(rootDir, 'examples', 'ahlong.xml'))
+        pagination = Renderer(doc, Style()).paginate()
+        spans = pagination.sectionPages()
+        self.assertEqual(sorted(spans), list(range(len(doc.sectionList))))
+        # in order, each starting no earlier than the one before
+        firsts = [spans[n][0] for n in sorted(spans)]
+        self.assertEqual(firsts, sorted(firsts))
+        self.assertEqual(spans[len(doc.sectionList) - 1][1], pagination.pages)
+
+
+class CompressingCanvasTest(unittest.TestCase):
+    """
+    CompressingCanvas relies on ReportLab's internals, so this is what says whether a release of
+    ReportLab can go in compressingReportLabVersions.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        registerFonts()
+
+    def setUp(self):
+        patcher = mock.patch.object(render, 'compressPagesEarly', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def plainBuild(self, document, style):
+        output = BytesIO()
+        template = PageTemplate(id='AllPages', frames=[pageFrame(style)])
+        rlDoc = BaseDocTemplate(output, pagesize=style.pageSize, pageTemplates=[template], invariant=True)
+        rlDoc.build(list(Renderer(document, style).iterFlowables()), canvasmaker=canvas.Canvas)
+        return output.getvalue()
+
+    def test_same_as_a_plain_build(self):
+        documents = [(os.path.basename(p), Document.newFromFile(p)) for p in examples]
+        for name, document in documents + [('charts', chartDocument())]:
+            with self.subTest(document=name):
+                self.assertEqual(Renderer(document, Style(), invariant=True).stream().getvalue(),
+                                 self.plainBuild(document, Style()))
+
+    def test_songbook_same_as_a_plain_canvas(self):
+        book = Songbook.newFromFiles(examples, Style(), title="Book", jobs=1, invariant=True)
+        compressed = BytesIO()
+        book.savePDF(compressed)
+        plain = BytesIO()
+        with mock.patch.object(songbook, 'CompressingCanvas', canvas.Canvas):
+            book.savePDF(plain)
+        self.assertEqual(compressed.getvalue(), plain.getvalue())
+
+    def test_only_with_checked_releases(self):
+        with mock.patch.object(render, 'compressPagesEarly', False):
+            self.assertEqual(Renderer(chartDocument(), Style(), invariant=True).stream().getvalue(),
+                             self.plainBuild(chartDocument(), Style()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+The render cache: what its keys depend on, and which PDFs it lets go of first.
+"""
+
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import unittest
+from unittest import mock
+
+from reportlab.lib.pagesizes import letter
+
+from chordsheet import renderCache
+from chordsheet.document import Document, Style
+from chordsheet.renderCache import renderKey, MemoryCache, DiskCache, RenderCache
+
+rootDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+examplePath = os.path.join(rootDir, 'examples', 'example.xml')
+
+
+def key(n):
+    return hashlib.sha256(str(n).encode('utf-8')).hexdigest()
+
+
+def setTitle(doc):
+    doc.title = doc.title + " again"
+
+
+def setLength(doc):
+    doc.sectionList[0].blockList[0].length += 1
+
+
+def setChord(doc):
+    doc.sectionList[0].blockList[0].chord = doc.chordList[-1]
+
+
+def setVoicing(doc):
+    chord = next(c for c in doc.chordList if 'guitar' in c.voicings)
+    chord.voicings['guitar'] = ['x'] * len(chord.voicings['guitar'])
+
+
+def setSectionName(doc):
+    doc.sectionList[0].name = "Elsewhere"
+
+
+class RenderKeyTest(unittest.TestCase):
+    def setUp(self):
+        self.document = Document.newFromFile(examplePath)
+        self.key = renderKey(self.document, Style())
+
+    def test_same_for_the_same_render(self):
+        self.assertEqual(renderKey(Document.newFromFile(examplePath), Style()), self.key)
+        self.assertEqual(renderKey(self.document, Style().snapshot()), self.key)
+        self.assertEqual(len(self.key), 64)
+
+    def test_document_changes(self):
+        for change in (setTitle, setLength, setChord, setVoicing, setSectionName):
+            with self.subTest(change=change.__name__):
+                document = Document.newFromFile(examplePath)
+                change(document)
+                self.assertNotEqual(renderKey(document, Style()), self.key)
+
+    def test_style_changes(self):
+        for name, value in [('unitWidth', 12), ('leftMargin', 20), ('lineSpacing', 1.5), ('pageSize', letter)]:
+            with self.subTest(name=name):
+                self.assertNotEqual(renderKey(self.document, Style(**{name: value})), self.key)
+
+    def test_renderer_changes(self):
+        with mock.patch.object(renderCache, 'rendererVersion', renderCache.rendererVersion + 1):
+            self.assertNotEqual(renderKey(self.document, Style()), self.key)
+
+
+class MemoryCacheTest(unittest.TestCase):
+    def test_least_recently_used_goes_first(self):
+        cache = MemoryCache(30)
+        for n in range(3):
+            cache.put(key(n), bytes(10))
+        cache.get(key(0))
+        cache.put(key(3), bytes(10))
+        self.assertEqual([key(n) in cache for n in range(4)], [True, False, True, True])
+        self.assertEqual(cache.size, 30)
+
+    def test_too_big(self):
+        cache = MemoryCache(30)
+        cache.put(key(0), bytes(31))
+        self.assertEqual(len(cache), 0)
+
+
+class DiskCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='chordsheet-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def age(self, cache, n, seconds):
+        then = time.time() - seconds
+        os.utime(cache.path(key(n)), (then, then))
+
+    def test_evicts_by_last_use(self):
+        cache = DiskCache(self.dir, 30)
+        for n in range(3):
+            cache.put(key(n), bytes([n]) * 10)
+            # older first, but 1 the oldest of all
+            self.age(cache, n, {0: 200, 1: 300, 2: 100}[n])
+        cache.put(key(3), bytes(10))
+        self.assertEqual([os.path.exists(cache.path(key(n))) for n in range(4)], [True, False, True, True])
+        self.assertIsNone(cache.get(key(1)))
+        self.assertEqual(cache.size, 30)
+
+    def test_get_marks_as_used(self):
+        cache = DiskCache(self.dir, 30)
+        for n in range(3):
+            cache.put(key(n), bytes([n]) * 10)
+            self.age(cache, n, 300 - n)
+        self.assertEqual(cache.get(key(0)), bytes([0]) * 10)
+        cache.put(key(3), bytes(10))
+        self.assertEqual([os.path.exists(cache.path(key(n))) for n in range(4)], [True, False, True, True])
+
+    def test_size_is_counted_on_opening(self):
+        cache = DiskCache(self.dir, 100)
+        for n in range(3):
+            cache.put(key(n), bytes(10))
+        self.assertEqual(DiskCache(self.dir, 100).size, 30)
+        cache.clear()
+        self.assertEqual(DiskCache(self.dir, 100).size, 0)
+
+
+class RenderCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='chordsheet-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_render_once(self):
+        document = Document.newFromFile(examplePath)
+        cache = RenderCache(directory=self.dir)
+        data, dataKey = cache.render(document, Style())
+        self.assertTrue(data.startswith(b'%PDF'))
+        self.assertEqual(cache.render(document, Style()), (data, dataKey))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # a new cache on the same directory finds it on disk
+        cache = RenderCache(directory=self.dir)
+        with mock.patch('chordsheet.render.Renderer') as renderer:
+            self.assertEqual(cache.render(document, Style()), (data, dataKey))
+        renderer.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
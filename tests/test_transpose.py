@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Transposing chord names, voicings and whole documents, and how the new notes are spelt.
+"""
+
+import unittest
+
+from chordsheet.document import Document, Section, Block, Chord
+from chordsheet.transpose import (transposeName, transposeFingering, transposeVoicing, transposeDocument,
+                                  transposedCopy, documentSpelling, transposedPathFor)
+
+# (name, semitones, spelling) -> transposed name
+names = {
+    ('C', 2, 'sharp'): 'D',
+    ('C', -1, 'sharp'): 'B',
+    ('C', 13, 'sharp'): 'C♯',
+    ('C', 1, 'flat'): 'D♭',
+    ('Am7', 3, 'sharp'): 'Cm7',
+    ('F♯m7♭5', 1, 'flat'): 'Gm7♭5',
+    ('E♭maj7(♯11)', 2, 'sharp'): 'Fmaj7(♯11)',
+    ('C♭', 0, 'sharp'): 'B',
+    ('Bbm7', 2, 'sharp'): 'Cm7',
+    ('Cxyz', 2, 'sharp'): 'Dxyz',
+    ('N.C.', 2, 'sharp'): 'N.C.',
+    ('', 2, 'sharp'): '',
+}
+
+slashChords = {
+    ('B♭m/F', 2, 'sharp'): 'Cm/G',
+    ('C/E', 1, 'sharp'): 'C♯/F',
+    ('C/E', 1, 'flat'): 'D♭/F',
+    ('Am7/G', -2, 'flat'): 'Gm7/F',
+    ('D/F♯', 5, 'sharp'): 'G/B',
+    # not a bass note, so left as part of the suffix
+    ('C/X', 2, 'sharp'): 'D/X',
+}
+
+# (fingering, semitones) -> transposed fingering
+fingerings = {
+    ('x32010', 2): 'x54232',
+    ('x32010', 12): 'x32010',
+    # moving down a tone from open strings goes up the neck instead
+    ('x32010', -2): ('x', '13', '12', '10', '11', '10'),
+    # up ten frets from the fifth is further than down two
+    (('5', '7', '7', '6', '5', '5'), 10): ('3', '5', '5', '4', '3', '3'),
+    ('133211', 10): ('11', '13', '13', '12', '11', '11'),
+    ('133211', -1): '022100',
+    ('xxxxxx', 3): 'xxxxxx',
+}
+
+
+def makeDocument(*names, piano=None):
+    chords = [Chord(name) for name in names]
+    if piano:
+        chords[0].voicings['piano'] = piano
+    return Document(chordList=chords, sectionList=[Section([Block(4, chord=c) for c in chords], name="Verse")])
+
+
+class TransposeTest(unittest.TestCase):
+    def test_names(self):
+        for (name, semitones, spelling), expected in names.items():
+            with self.subTest(name=name, semitones=semitones, spelling=spelling):
+                self.assertEqual(transposeName(name, semitones, spelling), expected)
+
+    def test_slash_chords(self):
+        for (name, semitones, spelling), expected in slashChords.items():
+            with self.subTest(name=name, semitones=semitones, spelling=spelling):
+                self.assertEqual(transposeName(name, semitones, spelling), expected)
+
+    def test_fingering_octave(self):
+        for (fingering, semitones), expected in fingerings.items():
+            with self.subTest(fingering=fingering, semitones=semitones):
+                self.assertEqual(transposeFingering(tuple(fingering), semitones), tuple(expected))
+        self.assertEqual(transposeVoicing('guitar', list('x32010'), 2), list('x54232'))
+
+    def test_piano_voicing(self):
+        self.assertEqual(transposeVoicing('piano', ['B♭', 'D', 'F'], 2, 'sharp'), ['C', 'E', 'G'])
+        self.assertEqual(transposeVoicing('piano', ['C', 'E', 'G'], 1, 'flat'), ['D♭', 'F', 'A♭'])
+
+    def test_document_spelling(self):
+        self.assertEqual(documentSpelling(makeDocument('B♭', 'E♭', 'F')), 'flat')
+        self.assertEqual(documentSpelling(makeDocument('F♯m', 'D', 'A')), 'sharp')
+        self.assertEqual(documentSpelling(makeDocument('C', 'G')), 'sharp')
+        # piano voicings count too
+        self.assertEqual(documentSpelling(makeDocument('C♯', piano=['D♭', 'F', 'A♭'])), 'flat')
+        for semitones in (0, 12, -12, 24):
+            with self.subTest(semitones=semitones):
+                self.assertEqual(documentSpelling(makeDocument('B♭', 'C♯'), semitones), 'asWritten')
+
+    def test_document_keeps_its_spelling(self):
+        doc = transposeDocument(makeDocument('B♭', 'E♭m', 'F7'), 1)
+        self.assertEqual([c.name for c in doc.chordList], ['B', 'Em', 'G♭7'])
+        doc = transposeDocument(makeDocument('F♯m', 'D', 'A'), -2)
+        self.assertEqual([c.name for c in doc.chordList], ['Em', 'C', 'G'])
+        doc = transposeDocument(makeDocument('B♭', 'E♭m', 'F7'), 1, spelling='sharp')
+        self.assertEqual([c.name for c in doc.chordList], ['B', 'Em', 'F♯7'])
+
+    def test_octave_keeps_every_name(self):
+        for semitones in (0, 12, -12):
+            with self.subTest(semitones=semitones):
+                doc = transposeDocument(makeDocument('B♭', 'C♯m/G♯', 'D', piano=['B♭', 'D', 'F']), semitones)
+                self.assertEqual([c.name for c in doc.chordList], ['B♭', 'C♯m/G♯', 'D'])
+                self.assertEqual(doc.chordList[0].voicings['piano'], ['B♭', 'D', 'F'])
+        # unless a spelling is asked for
+        doc = transposeDocument(makeDocument('B♭'), 12, spelling='sharp')
+        self.assertEqual(doc.chordList[0].name, 'A♯')
+
+    def test_blocks_follow_chords(self):
+        doc = transposeDocument(makeDocument('C', 'G'), 2)
+        self.assertEqual([b.chord.name for b in doc.sectionList[0].blockList], ['D', 'A'])
+
+    def test_copy_leaves_the_original(self):
+        original = makeDocument('B♭', 'E♭', piano=['B♭', 'D', 'F'])
+        original.title = "Song"
+        copy = transposedCopy(original, 2)
+        self.assertEqual([c.name for c in original.chordList], ['B♭', 'E♭'])
+        self.assertEqual(original.chordList[0].voicings['piano'], ['B♭', 'D', 'F'])
+        self.assertEqual([c.name for c in copy.chordList], ['C', 'F'])
+        self.assertEqual(copy.chordList[0].voicings['piano'], ['C', 'E', 'G'])
+        self.assertEqual(copy.title, "Song")
+        self.assertIs(copy.sectionList[0].blockList[0].chord, copy.chordList[0])
+        self.assertIsNot(copy.sectionList[0], original.sectionList[0])
+        self.assertIsNot(copy.sectionList[0].blockList[0], original.sectionList[0].blockList[0])
+        self.assertEqual(transposedCopy(original, 12).chordList[0].name, 'B♭')
+
+    def test_path(self):
+        self.assertEqual(transposedPathFor('songs/a.cma', 2), 'songs/a+2.xml')
+        self.assertEqual(transposedPathFor('songs/a.xml', -3, 'out'), 'out/a-3.xml')
+
+
+if __name__ == '__main__':
+    unittest.main()